@@ -1,17 +1,91 @@
+import time
+
+START = time.perf_counter()
+
+import argparse
+import os
 import sys
+from typing import Optional
 
+from PySide6.QtCore import QStandardPaths
 from PySide6.QtWidgets import QApplication
 
+import model
 from views.main_window import MainWindow
 
+JOURNAL_FILE = "session.journal"
+
 
 class App(QApplication):
-    def __init__(self, sys_argv: list[str]):
+    def __init__(self, sys_argv: list[str], startup_budget: Optional[float] = None, measure_startup: bool = False,
+                 journal: bool = True):
         super().__init__(sys_argv)
+        self.setApplicationName("oop-lab6")
+        self._startup_budget = startup_budget
+        self._startup_failed = False
+        self._imported = time.perf_counter()
+
         self._main_window = MainWindow()
+        self._journal: Optional[model.Journal] = None
+        if journal:
+            self._start_journal()
+        self._constructed = time.perf_counter()
+        if measure_startup:
+            self._main_window.first_painted.connect(self._report_startup)
         self._main_window.show()
 
+    @property
+    def startup_failed(self) -> bool:
+        return self._startup_failed
+
+    @property
+    def journal(self) -> Optional[model.Journal]:
+        return self._journal
+
+    def _start_journal(self):
+        directory = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            return
+        path = os.path.join(directory, JOURNAL_FILE)
+
+        # Listening before the storage is set makes the reset start this session with a fresh base
+        area = self._main_window.area
+        restored = model.Journal.replay(path)
+        self._journal = model.Journal(path)
+        area.add_listener(self._journal)
+        if restored is not None:
+            area.storage = restored
+        else:
+            self._journal.document_reset(list(area.storage))
+        if restored:
+            self._main_window.statusBar().showMessage(f"Restored {len(restored)} shapes from the last session",
+                                                      10000)
+        self.aboutToQuit.connect(self._journal.close)
+
+    def _report_startup(self):
+        painted = time.perf_counter()
+        total = (painted - START) * 1000
+        print(f"imports and QApplication {(self._imported - START) * 1000:8.1f} ms\n"
+              f"MainWindow()             {(self._constructed - self._imported) * 1000:8.1f} ms\n"
+              f"show() to first paint    {(painted - self._constructed) * 1000:8.1f} ms\n"
+              f"time to first paint      {total:8.1f} ms", file=sys.stderr)
+
+        if self._startup_budget is not None and total > self._startup_budget:
+            print(f"over the startup budget of {self._startup_budget:.0f} ms", file=sys.stderr)
+            self._startup_failed = True
+        self.quit()
+
 
 if __name__ == '__main__':
-    app = App(sys.argv)
-    sys.exit(app.exec())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print the time to the first paint of the main window and exit")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="with --startup-time, exit with status 1 when the first paint takes longer")
+    args, qt_args = parser.parse_known_args()
+
+    app = App(sys.argv[:1] + qt_args, args.startup_budget, args.startup_time, journal=not args.startup_time)
+    status = app.exec()
+    sys.exit(1 if app.startup_failed else status)
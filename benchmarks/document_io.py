@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PySide6.QtGui import QGuiApplication
+
+from model import Storage, Shape, save_document, load_storage
+from model.shapes import available_shapes
+
+
+def make_storage(n: int, seed: int = 0) -> Storage[Shape]:
+    rng = np.random.default_rng(seed)
+    storage: Storage[Shape] = Storage()
+    for kind, x, y, w, h, a, z in zip(
+            rng.integers(0, len(available_shapes), n).tolist(), rng.integers(0, 2000, n).tolist(),
+            rng.integers(0, 2000, n).tolist(), rng.integers(5, 80, n).tolist(), rng.integers(5, 80, n).tolist(),
+            rng.uniform(0, 360, n).tolist(), rng.choice([-100, 0, 100], n).tolist()):
+        shape = available_shapes[kind](x, y, w, h, a)
+        shape.node = storage.push(shape, z)
+    return storage
+
+
+def save_json(path: str, storage: Storage[Shape]):
+    names = {kind: kind.name() for kind in available_shapes}
+    with open(path, "w") as f:
+        json.dump([{
+            "type": names[type(s)], "x": s.x, "y": s.y, "w": s.w, "h": s.h, "a": s.a,
+            "z": s.node.priority, "border": s.default_border_color.rgba(), "fill": s.default_background_color.rgba(),
+        } for s in storage], f)
+
+
+def load_json(path: str) -> Storage[Shape]:
+    kinds = {kind.name(): kind for kind in available_shapes}
+    storage: Storage[Shape] = Storage()
+    with open(path) as f:
+        for record in json.load(f):
+            shape = kinds[record["type"]](record["x"], record["y"], record["w"], record["h"], record["a"])
+            shape.node = storage.push(shape, record["z"])
+    return storage
+
+
+def timed(func, *args) -> float:
+    t = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary document format against a naive JSON baseline")
+    parser.add_argument("sizes", nargs="*", type=int, default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        binary = os.path.join(tmp, "doc.bin")
+        text = os.path.join(tmp, "doc.json")
+        print(f"{'shapes':>8} {'format':>8} {'save/s':>12} {'load/s':>12} {'bytes':>12}")
+        for n in args.sizes:
+            storage = make_storage(n)
+
+            rows = [
+                ("bin-objs", timed(save_document, binary, storage), timed(load_storage, binary), binary),
+                ("json", timed(save_json, text, storage), timed(load_json, text), text),
+            ]
+            for name, save, load, path in rows:
+                print(f"{n:>8} {name:>8} {n / save:>12.0f} {n / load:>12.0f} {os.path.getsize(path):>12}")
+
+
+if __name__ == '__main__':
+    main()
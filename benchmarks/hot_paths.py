@@ -0,0 +1,450 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import PySide6
+from PySide6.QtCore import QEvent, QPoint, QPointF, Qt
+from PySide6.QtGui import QImage, QMouseEvent
+from PySide6.QtWidgets import QApplication
+
+from model import Autosave, Journal, Shape, Storage
+from model.shapes import available_shapes
+from views import PaintingArea
+
+VIEWPORT = (1280, 800)
+
+POINT_TEST_SHAPES = 10_000
+
+AREA_BENCHMARKS = ("area.change_z_selected", "area.hit_test", "area.band_select", "autosave.snapshot", "journal.append",
+                   "journal.replay", "paint.viewport", "paint.fit")
+
+# Priority distributions for Storage.push
+PRIORITIES: dict[str, Callable[[np.random.Generator, int], np.ndarray]] = {
+    "constant": lambda rng, n: np.zeros(n, np.int64),
+    "few": lambda rng, n: rng.choice([-100, 0, 100], n),
+    "uniform": lambda rng, n: rng.integers(0, 1000, n),
+    "ascending": lambda rng, n: np.arange(n),
+    "descending": lambda rng, n: -np.arange(n),
+}
+
+
+def make_shapes(n: int, seed: int = 0) -> list[tuple[Shape, int]]:
+    # Same density at every size: the canvas grows with the shape count
+    rng = np.random.default_rng(seed)
+    side = int(VIEWPORT[0] * max(1.0, (n / 5000) ** 0.5))
+    kinds = rng.integers(0, len(available_shapes), n).tolist()
+    x = rng.integers(40, side, n).tolist()
+    y = rng.integers(40, side, n).tolist()
+    w = rng.integers(5, 60, n).tolist()
+    h = rng.integers(5, 60, n).tolist()
+    a = rng.uniform(0, 360, n).tolist()
+    z = rng.choice([-100, 0, 100], n).tolist()
+    return [(available_shapes[k](*args), zi) for k, *args, zi in zip(kinds, x, y, w, h, a, z)]
+
+
+def make_area(n: int) -> PaintingArea:
+    area = PaintingArea()
+    area.resize(*VIEWPORT)
+    area.add_shapes(make_shapes(n))
+    area.history.clear()
+    return area
+
+
+def measure(func: Callable[[], Optional[int]], setup: Optional[Callable[[], None]] = None,
+            repeat: int = 3) -> tuple[float, int]:
+    # Best of repeat runs; func returns how many operations it did, defaulting to one
+    best = float("inf")
+    ops = 1
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        ops = func() or 1
+        best = min(best, time.perf_counter() - t)
+    return best, ops
+
+
+def bench_push(n: int, distribution: str, repeat: int) -> tuple[float, int]:
+    priorities = PRIORITIES[distribution](np.random.default_rng(1), n).tolist()
+
+    def run():
+        storage: Storage[int] = Storage()
+        push = storage.push
+        for i, p in enumerate(priorities):
+            push(i, p)
+        return n
+
+    return measure(run, repeat=repeat)
+
+
+def bench_iterate(storage: Storage, repeat: int) -> tuple[float, int]:
+    def run():
+        count = 0
+        for _ in storage:
+            count += 1
+        return count
+
+    return measure(run, repeat=repeat)
+
+
+def bench_pop_current(n: int, repeat: int) -> tuple[float, int]:
+    state = {}
+
+    def setup():
+        storage: Storage[int] = Storage()
+        for i, p in enumerate(PRIORITIES["few"](np.random.default_rng(2), n).tolist()):
+            storage.push(i, p)
+        state["storage"] = storage
+
+    def run():
+        # Walk with the cursor and delete every tenth value
+        storage = state["storage"]
+        storage.first()
+        i = 0
+        popped = 0
+        while not storage.eol():
+            if i % 10 == 0:
+                storage.pop_current()
+                popped += 1
+            else:
+                storage.next()
+            i += 1
+        return popped
+
+    return measure(run, setup, repeat)
+
+
+def bench_batch_insert(n: int, repeat: int) -> tuple[float, int]:
+    state = {}
+
+    def setup():
+        area = PaintingArea()
+        area.resize(*VIEWPORT)
+        state["area"] = area
+        state["shapes"] = make_shapes(n)
+
+    def run():
+        area = state["area"]
+        with area.batch() as batch:
+            for shape, z in state["shapes"]:
+                batch.insert(shape, z)
+        return n
+
+    result = measure(run, setup, repeat)
+    state.clear()
+    return result
+
+
+def bench_change_z(area: PaintingArea, repeat: int) -> tuple[float, int]:
+    shapes = list(area.storage)[::100]
+
+    def setup():
+        area.clear_selection()
+        area.selection.select(shapes)
+
+    def run():
+        area.change_z_selected(100)
+        return len(shapes)
+
+    result = measure(run, setup, repeat)
+    area.clear_selection()
+    area.history.clear()
+    return result
+
+
+def bench_hit_test(area: PaintingArea, clicks: int, repeat: int) -> tuple[float, int]:
+    rng = np.random.default_rng(3)
+    visible = area.visible_rect
+    points = [QPointF(x, y) for x, y in zip(rng.uniform(0, visible.width(), clicks).tolist(),
+                                             rng.uniform(0, visible.height(), clicks).tolist())]
+    area.mode = PaintingArea.Mode.EDIT_ITEM
+
+    def run():
+        for p in points:
+            area.mousePressEvent(QMouseEvent(QEvent.MouseButtonPress, p, p, Qt.LeftButton, Qt.LeftButton,
+                                             Qt.NoModifier))
+            area.mouseReleaseEvent(QMouseEvent(QEvent.MouseButtonRelease, p, p, Qt.LeftButton, Qt.NoButton,
+                                               Qt.NoModifier))
+        return clicks
+
+    result = measure(run, repeat=repeat)
+    area.clear_selection()
+    return result
+
+
+def bench_point_test(shapes: list[Shape], method: str, points: int, repeat: int) -> tuple[float, int]:
+    # One shape test per op. The path method drops the cached geometry first, as a move or resize does
+    rng = np.random.default_rng(5)
+    side = max(shape.x for shape in shapes)
+    probes = [QPointF(x, y) for x, y in zip(rng.uniform(0, side, points).tolist(), rng.uniform(0, side, points).tolist())]
+
+    def path():
+        for p in probes:
+            for shape in shapes:
+                shape._geometry = None
+                shape.shape().contains(p)
+
+    def analytic():
+        for p in probes:
+            for shape in shapes:
+                shape.inside(p)
+
+    def batched():
+        for p in probes:
+            Shape.hit_test(shapes, p)
+
+    run = {"path": path, "analytic": analytic, "batched": batched}[method]
+    seconds, _ = measure(run, repeat=repeat)
+    return seconds, points * len(shapes)
+
+
+def bench_band_select(area: PaintingArea, lasso: bool, steps: int, repeat: int) -> tuple[float, int]:
+    # A Shift-drag across the fitted drawing, one selection update per step
+    area.zoom_to_fit()
+    area.mode = PaintingArea.Mode.EDIT_ITEM
+    area.band_shape = PaintingArea.BandShape.LASSO if lasso else PaintingArea.BandShape.RECTANGLE
+    w, h = VIEWPORT
+    if lasso:
+        points = [QPointF(w / 2 + w * 0.4 * np.cos(t), h / 2 + h * 0.4 * np.sin(t))
+                  for t in np.linspace(0, 2 * np.pi, steps).tolist()]
+    else:
+        points = [QPointF(w * t, h * t) for t in np.linspace(0, 1, steps).tolist()]
+
+    def run():
+        area.mousePressEvent(QMouseEvent(QEvent.MouseButtonPress, points[0], points[0], Qt.LeftButton, Qt.LeftButton,
+                                         Qt.ShiftModifier))
+        for p in points[1:]:
+            area.mouseMoveEvent(QMouseEvent(QEvent.MouseMove, p, p, Qt.NoButton, Qt.LeftButton, Qt.ShiftModifier))
+            area._on_frame()
+        area.mouseReleaseEvent(QMouseEvent(QEvent.MouseButtonRelease, points[-1], points[-1], Qt.LeftButton,
+                                           Qt.NoButton, Qt.ShiftModifier))
+        return steps
+
+    result = measure(run, area.clear_selection, repeat)
+    area.clear_selection()
+    area.band_shape = PaintingArea.BandShape.RECTANGLE
+    area.reset_zoom()
+    return result
+
+
+def bench_autosave(area: PaintingArea, edited: int, repeat: int) -> tuple[float, int]:
+    # GUI thread side of an autosave after a small edit; the write itself happens on the worker
+    with tempfile.TemporaryDirectory() as directory:
+        autosave = Autosave(os.path.join(directory, "autosave.shapes"))
+        area.add_listener(autosave)
+        autosave.document_reset(list(area.storage))
+        autosave.save()
+        shapes = list(area.storage)[:edited]
+
+        def setup():
+            autosave.wait()
+            area.transform_shapes(shapes, 1, 0, 0, 0, 0)
+
+        def run():
+            autosave.save()
+
+        result = measure(run, setup, repeat)
+        autosave.close()
+        area.remove_listener(autosave)
+    return result
+
+
+def bench_journal_append(area: PaintingArea, edits: int, repeat: int) -> tuple[float, int]:
+    # GUI thread side of journaling single-shape edits; commits happen on the worker
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(os.path.join(directory, "session.journal"))
+        journal.document_reset(list(area.storage))
+        journal.wait()
+        shapes = list(area.storage)[:edits]
+
+        def run():
+            for shape in shapes:
+                journal.shapes_changed([shape])
+            journal.commit()
+            return len(shapes)
+
+        result = measure(run, journal.wait, repeat)
+        journal.close()
+    return result
+
+
+def bench_journal_replay(area: PaintingArea, edits: int, repeat: int) -> tuple[float, int]:
+    # Base of the whole document plus a log of single-shape edits, replayed into a new storage
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.journal")
+        journal = Journal(path)
+        journal.document_reset(list(area.storage))
+        shapes = list(area.storage)
+        for i in np.random.default_rng(5).integers(0, len(shapes), edits).tolist():
+            journal.shapes_changed([shapes[i]])
+        journal.commit()
+        journal.wait()
+
+        def run():
+            Journal.replay(path)
+            return len(shapes) + edits
+
+        result = measure(run, repeat=repeat)
+    return result
+
+
+def bench_paint(area: PaintingArea, fit: bool, repeat: int) -> tuple[float, int]:
+    image = QImage(*VIEWPORT, QImage.Format_ARGB32_Premultiplied)
+    if fit:
+        area.zoom_to_fit()
+    else:
+        area.reset_zoom()
+        area.view_offset = QPoint()
+
+    def run():
+        area.render(image)
+        return len(area._index.query_rect(area.visible_rect))
+
+    result = measure(run, repeat=repeat)
+    area.reset_zoom()
+    return result
+
+
+def run_suite(sizes: list[int], repeat: int, only: Optional[list[str]]) -> list[dict]:
+    results = []
+
+    def record(name: str, n: int, timing: tuple[float, int], **params):
+        seconds, ops = timing
+        results.append({"name": name, "size": n, "params": params, "seconds": seconds, "ops": ops,
+                        "seconds_per_op": seconds / ops})
+        print(f"{name:<24} {n:>9} {seconds * 1000:>11.2f} ms {seconds / ops * 1e6:>11.2f} us/op", file=sys.stderr)
+
+    def wanted(name: str) -> bool:
+        return only is None or any(name.startswith(o) for o in only)
+
+    for n in sizes:
+        for distribution in PRIORITIES:
+            if wanted(f"storage.push.{distribution}"):
+                record(f"storage.push.{distribution}", n, bench_push(n, distribution, repeat))
+
+        if wanted("storage.iterate"):
+            storage: Storage[int] = Storage()
+            for i, p in enumerate(PRIORITIES["few"](np.random.default_rng(4), n).tolist()):
+                storage.push(i, p)
+            record("storage.iterate", n, bench_iterate(storage, repeat))
+
+        if wanted("storage.pop_current"):
+            record("storage.pop_current", n, bench_pop_current(n, repeat))
+
+        if wanted("area.batch_insert"):
+            record("area.batch_insert", n, bench_batch_insert(n, repeat))
+
+        if wanted("shape.inside"):
+            # Capped so the QPainterPath baseline stays affordable at every size
+            shapes = [shape for shape, _ in make_shapes(min(n, POINT_TEST_SHAPES))]
+            for method in ("path", "analytic", "batched"):
+                record(f"shape.inside.{method}", n, bench_point_test(shapes, method, 5, repeat), shapes=len(shapes))
+
+        if not any(wanted(name) for name in AREA_BENCHMARKS):
+            continue
+
+        area = make_area(n)
+        if wanted("area.change_z_selected"):
+            record("area.change_z_selected", n, bench_change_z(area, repeat))
+        if wanted("area.hit_test"):
+            record("area.hit_test", n, bench_hit_test(area, 200, repeat))
+        if wanted("area.band_select"):
+            record("area.band_select", n, bench_band_select(area, False, 60, repeat), shape="rectangle")
+            record("area.band_select.lasso", n, bench_band_select(area, True, 60, repeat), shape="lasso")
+        if wanted("autosave.snapshot"):
+            record("autosave.snapshot", n, bench_autosave(area, 10, repeat), edited=10)
+        if wanted("journal.append"):
+            record("journal.append", n, bench_journal_append(area, 1000, repeat), edits=1000)
+        if wanted("journal.replay"):
+            record("journal.replay", n, bench_journal_replay(area, 10_000, repeat), edits=10_000)
+        if wanted("paint.viewport"):
+            record("paint.viewport", n, bench_paint(area, False, repeat), viewport=list(VIEWPORT))
+        if wanted("paint.fit"):
+            record("paint.fit", n, bench_paint(area, True, repeat), viewport=list(VIEWPORT))
+        area.deleteLater()
+
+    return results
+
+
+def curves(results: list[dict]) -> dict[str, list[list[float]]]:
+    out: dict[str, list[list[float]]] = {}
+    for r in results:
+        out.setdefault(r["name"], []).append([r["size"], r["seconds"]])
+    for points in out.values():
+        points.sort()
+    return out
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "pyside6": PySide6.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r["seconds"] for r in json.load(f)["results"]}
+
+    regressions = 0
+    for r in results:
+        before = baseline.get((r["name"], r["size"]))
+        if not before:
+            continue
+        ratio = r["seconds"] / before
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['name']:<24} {r['size']:>9} {ratio:>7.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time model and view hot paths on synthetic documents")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per measurement, best one is kept")
+    parser.add_argument("-k", "--only", nargs="+", help="benchmark name prefixes to run, e.g. storage paint.fit")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    results = run_suite(args.sizes, args.repeat, args.only)
+    report = {"meta": metadata(), "results": results, "curves": curves(results)}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
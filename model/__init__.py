@@ -1,3 +1,17 @@
 from .shape import *
 from .storage import *
-
+from .selection import *
+from .style import *
+from .spatial_index import *
+from .raster_cache import *
+from .lod import *
+from .tile_renderer import *
+from .group_transform import *
+from .columnar import *
+from .history import *
+from .profiler import *
+from .document import *
+from .record_table import *
+from .autosave import *
+from .journal import *
+from .ndjson import *
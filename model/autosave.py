@@ -0,0 +1,156 @@
+import os
+from contextlib import suppress
+from typing import Optional, Sequence, Union
+
+from PySide6.QtCore import QRunnable, QThreadPool, QTimer
+
+from .document import DocumentError, load_storage
+from .record_table import RecordTable, TableSnapshot
+from .shape import Shape
+from .storage import Storage
+
+__all__ = ("Autosave",)
+
+AUTOSAVE_INTERVAL = 30_000
+
+
+class _SaveJob(QRunnable):
+    def __init__(self, snapshot: TableSnapshot, path: str):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.snapshot = snapshot
+        self.path = path
+        self.error: Optional[OSError] = None
+        self.done = False
+
+    def run(self):
+        try:
+            self.snapshot.write(self.path)
+        except OSError as e:
+            self.error = e
+        finally:
+            self.snapshot = None
+            self.done = True
+
+
+class Autosave:
+    # A DocumentListener saving the shapes changed since the last tick from a RecordTable snapshot on a worker thread
+    def __init__(self, path: Union[str, os.PathLike], interval: int = AUTOSAVE_INTERVAL):
+        self._path = os.fspath(path)
+        self._table = RecordTable()
+        self._dirty: dict[Shape, None] = {}
+        self._removed: dict[Shape, None] = {}
+        self._changed = False
+        self._error: Optional[OSError] = None
+        self._saves = 0
+
+        # One writer at a time, so saves land in the order they were taken
+        self._job: Optional[_SaveJob] = None
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(1)
+
+        self._timer = QTimer()
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.save)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def interval(self) -> int:
+        return self._timer.interval()
+
+    @interval.setter
+    def interval(self, value: int):
+        self._timer.setInterval(value)
+
+    @property
+    def pending(self) -> bool:
+        return self._changed
+
+    @property
+    def saves(self) -> int:
+        return self._saves
+
+    @property
+    def error(self) -> Optional[OSError]:
+        return self._error
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def save(self) -> bool:
+        # Nothing is started while the previous save is still being written; the changes wait for the next tick
+        if self._job is not None:
+            if not self._job.done:
+                return False
+            self._finish_job()
+        if not self._changed:
+            return False
+
+        self._table.remove(list(self._removed))
+        self._table.update(list(self._dirty))
+        self._removed.clear()
+        self._dirty.clear()
+        self._changed = False
+
+        self._job = _SaveJob(self._table.snapshot(), self._path)
+        self._pool.start(self._job)
+        return True
+
+    def wait(self):
+        self._pool.waitForDone()
+        if self._job is not None:
+            self._finish_job()
+
+    def close(self):
+        # A clean shutdown leaves nothing to recover
+        self.stop()
+        self.wait()
+        with suppress(OSError):
+            os.remove(self._path)
+
+    def _finish_job(self):
+        self._error = self._job.error
+        if self._error is None:
+            self._saves += 1
+        self._job = None
+
+    @staticmethod
+    def recover(path: Union[str, os.PathLike]) -> Optional[Storage[Shape]]:
+        # What a previous run left behind, or None when it exited cleanly or the file is unusable
+        path = os.fspath(path)
+        with suppress(OSError):
+            os.remove(f"{path}.tmp")
+        if not os.path.exists(path):
+            return None
+        try:
+            return load_storage(path)
+        except (OSError, DocumentError):
+            return None
+
+    def document_reset(self, shapes: Sequence[Shape]):
+        self._table.clear()
+        self._removed.clear()
+        self._dirty = dict.fromkeys(shapes)
+        self._changed = True
+
+    def shapes_added(self, shapes: Sequence[Shape]):
+        for shape in shapes:
+            self._removed.pop(shape, None)
+            self._dirty[shape] = None
+        self._changed = True
+
+    def shapes_removed(self, shapes: Sequence[Shape]):
+        for shape in shapes:
+            self._dirty.pop(shape, None)
+            self._removed[shape] = None
+        self._changed = True
+
+    def shapes_changed(self, shapes: Sequence[Shape]):
+        self._dirty.update(dict.fromkeys(shapes))
+        self._changed = True
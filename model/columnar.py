@@ -0,0 +1,314 @@
+from operator import attrgetter, methodcaller
+from typing import Optional, Sequence, Type, Union
+
+import numpy as np
+from PySide6.QtGui import QColor, Qt
+
+from .group_transform import GroupTransform
+from .shape import Shape, Geometry
+from .style import styles
+
+__all__ = ("ShapeColumns", "ShapeView", "ColumnTransform")
+
+Color = Union[QColor, Qt.GlobalColor]
+
+_COLUMNS = {
+    "kind": np.int16,
+    "x": np.int64,
+    "y": np.int64,
+    "w": np.int64,
+    "h": np.int64,
+    "a": np.float64,
+    "style": np.int64,
+    "revision": np.int64,
+    # Bumped by every column edit of the geometry, so a view can tell its cached geometry went stale
+    "version": np.int64,
+    "live": np.bool_,
+}
+
+
+def _column(name: str) -> property:
+    return property(lambda self: self._columns[name][:self._size])
+
+
+def _counts(ids: np.ndarray) -> list[tuple[int, int]]:
+    values, counts = np.unique(ids, return_counts=True)
+    return list(zip(values.tolist(), counts.tolist()))
+
+
+class ShapeColumns:
+    # One row per ShapeView in contiguous NumPy columns; a row is reused once its view is garbage collected
+    kind = _column("kind")
+    x = _column("x")
+    y = _column("y")
+    w = _column("w")
+    h = _column("h")
+    a = _column("a")
+    style = _column("style")
+    revision = _column("revision")
+    version = _column("version")
+    live = _column("live")
+
+    def __init__(self, kinds: Optional[Sequence[Type[Shape]]] = None, capacity: int = 1024):
+        if kinds is None:
+            from .shapes import available_shapes
+            kinds = available_shapes
+
+        self._kinds = list(kinds)
+        # By name, which views share with the kind they derive from
+        self._kind_ids = {kind.name(): i for i, kind in enumerate(self._kinds)}
+        self._view_types = [
+            type(f"{kind.__name__}View", (ShapeView, kind), {"__slots__": (), "__module__": __name__}) for kind in self._kinds
+        ]
+
+        self._size = 0
+        self._free: list[int] = []
+        self._columns = {name: np.zeros(max(capacity, 1), dtype) for name, dtype in _COLUMNS.items()}
+
+    def __len__(self) -> int:
+        # Rows of shapes in a document, not counting deleted ones an undo step still holds
+        return int(np.count_nonzero(self.live))
+
+    @property
+    def kinds(self) -> list[Type[Shape]]:
+        return self._kinds
+
+    def create(self, kind: Type[Shape], x: int, y: int, w: int, h: int, a: float = 0) -> 'ShapeView':
+        k = self._kind_ids[kind.name()]
+        values = np.array([x, y, w, h], np.int64)
+        if not np.isfinite(a):
+            raise ValueError("Trying to store a shape with a non-finite angle")
+
+        # The row is filled before its view exists, as the view releases the row's style when it goes away
+        row = int(self._allocate(1)[0])
+        c = self._columns
+        c["kind"][row] = k
+        c["x"][row], c["y"][row], c["w"][row], c["h"][row] = values.tolist()
+        c["a"][row] = a
+        c["style"][row] = styles.default()
+        c["revision"][row] = 0
+        c["version"][row] = 0
+        return self._view_types[k](self, row)
+
+    def adopt(self, shapes: Sequence[Shape]) -> list['ShapeView']:
+        # Views over new rows holding copies of the shapes; views of these columns are kept as they are
+        shapes = list(shapes)
+        copied = [i for i, shape in enumerate(shapes) if not (isinstance(shape, ShapeView) and shape.columns is self)]
+        if not copied:
+            return shapes
+
+        source = [shapes[i] for i in copied]
+        n = len(source)
+        # Everything is converted before a row is taken, so geometry the columns cannot hold leaves them as they were
+        kind = np.fromiter(map(self._kind_ids.__getitem__, map(methodcaller("name"), source)), np.int16, n)
+        x, y, w, h = (np.fromiter(map(attrgetter(name), source), np.int64, n) for name in ("_x", "_y", "_w", "_h"))
+        a = np.fromiter(map(attrgetter("_a"), source), np.float64, n)
+        style = np.fromiter(map(attrgetter("_style"), source), np.int64, n)
+        if not np.isfinite(a).all():
+            raise ValueError("Trying to store a shape with a non-finite angle")
+
+        rows = self._allocate(n)
+        c = self._columns
+        c["kind"][rows] = kind
+        c["x"][rows] = x
+        c["y"][rows] = y
+        c["w"][rows] = w
+        c["h"][rows] = h
+        c["a"][rows] = a
+        c["style"][rows] = style
+        c["revision"][rows] = 0
+        c["version"][rows] = 0
+        for i, count in _counts(style):
+            styles.retain(i, count)
+
+        types = self._view_types
+        for i, k, row, shape in zip(copied, kind.tolist(), rows.tolist(), source):
+            shapes[i] = types[k](self, row, shape.selected)
+        return shapes
+
+    def rows(self, views: Sequence['ShapeView']) -> np.ndarray:
+        return np.fromiter(map(attrgetter("_row"), views), np.int64, len(views))
+
+    def set_live(self, rows: np.ndarray, live: bool):
+        self._columns["live"][rows] = live
+
+    def transform(self, rows: np.ndarray, dx: int, dy: int, dw: int, dh: int, da: float):
+        c = self._columns
+        for name, d in (("x", dx), ("y", dy), ("w", dw), ("h", dh), ("a", da)):
+            if d:
+                c[name][rows] += d
+        c["version"][rows] += 1
+        if dw or dh or da:
+            c["revision"][rows] += 1
+
+    def restyle(self, rows: np.ndarray, ids: Sequence[int]):
+        ids = np.asarray(ids, np.int64)
+        column = self._columns["style"]
+        old = column[rows]
+        changed = old != ids
+        # Retained before the old ones are released, so a style shared by both sides survives
+        for i, count in _counts(ids[changed]):
+            styles.retain(i, count)
+        for i, count in _counts(old[changed]):
+            styles.release(i, count)
+        column[rows] = ids
+        self._columns["revision"][rows[changed]] += 1
+
+    def recolor(self, rows: np.ndarray, border: Optional[Color] = None,
+                fill: Optional[Color] = None) -> tuple[np.ndarray, np.ndarray]:
+        # Each distinct style is derived once and hands its references over to the derived one
+        column = self._columns["style"]
+        old = column[rows]
+        ids, inverse, counts = np.unique(old, return_inverse=True, return_counts=True)
+        derived = [styles.derive(i, border=border, fill=fill, n=count)
+                   for i, count in zip(ids.tolist(), counts.tolist())]
+        new = np.array(derived, np.int64)[inverse.reshape(-1)]
+        column[rows] = new
+        self._columns["revision"][rows[new != old]] += 1
+        return old, new
+
+    def _release(self, row: int):
+        self._columns["live"][row] = False
+        self._free.append(row)
+
+    def _allocate(self, n: int) -> np.ndarray:
+        reused = min(n, len(self._free))
+        rows = np.empty(n, np.int64)
+        if reused:
+            rows[:reused] = self._free[-reused:]
+            del self._free[-reused:]
+        if reused < n:
+            self._reserve(self._size + n - reused)
+            rows[reused:] = np.arange(self._size, self._size + n - reused)
+            self._size += n - reused
+        self._columns["live"][rows] = True
+        return rows
+
+    def _reserve(self, n: int):
+        capacity = len(self._columns["x"])
+        if n <= capacity:
+            return
+        while capacity < n:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+
+class ShapeView(Shape):
+    # A Shape whose geometry and style live in a row of ShapeColumns, so painting and hit-testing are inherited as is
+    __slots__ = ("_columns", "_row", "_version")
+
+    def __init__(self, columns: ShapeColumns, row: int, selected: bool = False):
+        self._columns = columns
+        self._row = row
+        self._version = -1
+        self._selected = selected
+        self._geometry: Optional[Geometry] = None
+        self._node = None
+        self._selection = None
+
+    def __del__(self):
+        super().__del__()
+        self._columns._release(self._row)
+
+    @property
+    def columns(self) -> ShapeColumns:
+        return self._columns
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    def to_shape(self) -> Shape:
+        # A plain shape with the same geometry, style and selection flag, outside any columns
+        kind = self._columns.kinds[self._columns._columns["kind"][self._row]]
+        shape = kind(self._x, self._y, self._w, self._h, self._a)
+        shape.style_id = self._style
+        shape.selected = self._selected
+        return shape
+
+    @property
+    def geometry(self) -> Geometry:
+        version = int(self._columns._columns["version"][self._row])
+        if version != self._version:
+            self._geometry = None
+            self._version = version
+        return Shape.geometry.fget(self)
+
+    @property
+    def _x(self) -> int:
+        return int(self._columns._columns["x"][self._row])
+
+    @_x.setter
+    def _x(self, value: int):
+        self._columns._columns["x"][self._row] = value
+
+    @property
+    def _y(self) -> int:
+        return int(self._columns._columns["y"][self._row])
+
+    @_y.setter
+    def _y(self, value: int):
+        self._columns._columns["y"][self._row] = value
+
+    @property
+    def _w(self) -> int:
+        return int(self._columns._columns["w"][self._row])
+
+    @_w.setter
+    def _w(self, value: int):
+        self._columns._columns["w"][self._row] = value
+
+    @property
+    def _h(self) -> int:
+        return int(self._columns._columns["h"][self._row])
+
+    @_h.setter
+    def _h(self, value: int):
+        self._columns._columns["h"][self._row] = value
+
+    @property
+    def _a(self) -> float:
+        return float(self._columns._columns["a"][self._row])
+
+    @_a.setter
+    def _a(self, value: float):
+        self._columns._columns["a"][self._row] = value
+
+    @property
+    def _style(self) -> int:
+        return int(self._columns._columns["style"][self._row])
+
+    @_style.setter
+    def _style(self, value: int):
+        self._columns._columns["style"][self._row] = value
+
+    @property
+    def _revision(self) -> int:
+        return int(self._columns._columns["revision"][self._row])
+
+    @_revision.setter
+    def _revision(self, value: int):
+        self._columns._columns["revision"][self._row] = value
+
+
+class ColumnTransform(GroupTransform):
+    # A GroupTransform over views of one ShapeColumns, gathering and writing back whole columns at once
+    def __init__(self, columns: ShapeColumns, shapes: Sequence[ShapeView]):
+        shapes = list(shapes)
+        self._columns = columns
+        self._rows = columns.rows(shapes)
+        super().__init__(shapes)
+
+    def _gather(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict[type, np.ndarray]]:
+        c = self._columns
+        rows = self._rows
+        kind = c.kind[rows]
+        types = {c.kinds[k]: kind == k for k in np.unique(kind).tolist()}
+        return c.x[rows], c.y[rows], c.w[rows], c.h[rows], c.a[rows], types
+
+    def _set(self, dx: int, dy: int, dw: int, dh: int, da: float):
+        self._columns.transform(self._rows, dx, dy, dw, dh, da)
+        self._delta = (dx, dy, dw, dh, da)
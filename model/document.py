@@ -0,0 +1,219 @@
+import mmap
+import os
+import struct
+from contextlib import suppress
+from typing import Optional, Protocol, Sequence, Type, Union
+
+import numpy as np
+
+from .shape import Shape
+from .storage import Storage
+from .style import styles
+
+__all__ = (
+    "DocumentFile", "DocumentError", "DocumentListener", "save_document", "write_document", "records_to_storage",
+    "load_storage", "RECORD_DTYPE",
+)
+
+MAGIC = b"OOPSHAPE"
+VERSION = 1
+
+# magic, version, record size, style count, reserved, record count
+HEADER = struct.Struct("<8sHHIIQ4x")
+
+# One style row: default border, default fill, selected border, selected fill as QColor.rgba()
+STYLE_DTYPE = np.dtype(("<u4", 4))
+
+RECORD_DTYPE = np.dtype([
+    ("a", "<f8"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("w", "<i4"),
+    ("h", "<i4"),
+    ("z", "<i4"),
+    ("style", "<u4"),
+    ("kind", "<u2"),
+    ("flags", "<u2"),
+    ("reserved", "<u4"),
+])
+
+FLAG_SELECTED = 1
+
+
+class DocumentError(Exception):
+    pass
+
+
+class DocumentListener(Protocol):
+    def document_reset(self, shapes: Sequence[Shape]):
+        ...
+
+    def shapes_added(self, shapes: Sequence[Shape]):
+        ...
+
+    def shapes_removed(self, shapes: Sequence[Shape]):
+        ...
+
+    def shapes_changed(self, shapes: Sequence[Shape]):
+        ...
+
+
+def _available_shapes() -> list[Type[Shape]]:
+    from .shapes import available_shapes
+    return available_shapes
+
+
+def _kind_ids(kinds: Sequence[Type[Shape]]) -> dict[str, int]:
+    # By name, so subclasses such as column views are saved as the kind they derive from
+    return {kind.name(): i for i, kind in enumerate(kinds)}
+
+
+def write_document(path: Union[str, os.PathLike], records: np.ndarray, style_table: np.ndarray):
+    # Written next to the target and renamed over it, so a crash mid-save leaves the previous file intact
+    path = os.fspath(path)
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(style_table), 0, len(records)))
+            f.write(style_table.astype(STYLE_DTYPE.base, copy=False).tobytes())
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def _style_table(ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    used, local = np.unique(ids, return_inverse=True)
+    table = np.array([styles[int(i)].key for i in used], dtype=np.uint32).reshape(-1, 4)
+    return table, local
+
+
+def save_document(path: Union[str, os.PathLike], storage: Storage[Shape]):
+    shapes = list(storage)
+    n = len(shapes)
+    kind_ids = _kind_ids(_available_shapes())
+
+    records = np.zeros(n, RECORD_DTYPE)
+    records["x"] = np.fromiter((s.x for s in shapes), np.int32, n)
+    records["y"] = np.fromiter((s.y for s in shapes), np.int32, n)
+    records["w"] = np.fromiter((s.w for s in shapes), np.int32, n)
+    records["h"] = np.fromiter((s.h for s in shapes), np.int32, n)
+    records["a"] = np.fromiter((s.a for s in shapes), np.float64, n)
+    records["z"] = np.fromiter((s.node.priority if s.node is not None else 0 for s in shapes), np.int32, n)
+    records["kind"] = np.fromiter((kind_ids[s.name()] for s in shapes), np.uint16, n)
+    records["flags"] = np.fromiter((FLAG_SELECTED if s.selected else 0 for s in shapes), np.uint16, n)
+
+    table, local = _style_table(np.fromiter((s.style_id for s in shapes), np.int64, n))
+    records["style"] = local
+    write_document(path, records, table)
+
+
+def _invalid_records(records: np.ndarray, style_count: int) -> Optional[str]:
+    # Kinds and styles index into tables, so a corrupt file has to fail on open rather than with an IndexError later.
+    # Returned rather than raised, as a traceback through here would keep views into a mapping alive
+    if not len(records):
+        return None
+    if int(records["kind"].max()) >= len(_available_shapes()):
+        return "Document has records of an unknown shape type"
+    if int(records["style"].max()) >= style_count:
+        return "Document has records with an unknown style"
+    if not np.isfinite(records["a"]).all():
+        return "Document has records with an invalid angle"
+    return None
+
+
+class DocumentFile:
+    # records and style_table are views into the mapping; drop any taken from them before close()
+    def __init__(self, path: Union[str, os.PathLike]):
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise DocumentError("File is too short to be a document")
+            self._mmap: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, record_size, style_count, _, record_count = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise DocumentError("Not a shape document")
+            if version != VERSION or record_size != RECORD_DTYPE.itemsize:
+                raise DocumentError(f"Unsupported document version {version}")
+
+            records_offset = HEADER.size + style_count * STYLE_DTYPE.itemsize
+            if records_offset + record_count * record_size > size:
+                raise DocumentError("Document is truncated")
+
+            self.style_table = np.frombuffer(self._mmap, STYLE_DTYPE.base, style_count * 4, HEADER.size)
+            self.style_table = self.style_table.reshape(-1, 4)
+            self.records = np.frombuffer(self._mmap, RECORD_DTYPE, record_count, records_offset)
+            problem = _invalid_records(self.records, style_count)
+            if problem is not None:
+                raise DocumentError(problem)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> 'DocumentFile':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self):
+        self.records = None
+        self.style_table = None
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def shape(self, i: int) -> Shape:
+        r = self.records[i]
+        shape = _available_shapes()[r["kind"]](int(r["x"]), int(r["y"]), int(r["w"]), int(r["h"]), float(r["a"]))
+        style = styles.acquire_rgba(tuple(int(c) for c in self.style_table[r["style"]]))
+        shape.style_id = style
+        styles.release(style)
+        shape.selected = bool(r["flags"] & FLAG_SELECTED)
+        return shape
+
+    def to_storage(self) -> Storage[Shape]:
+        return records_to_storage(self.records, self.style_table)
+
+
+def records_to_storage(records: np.ndarray, style_table: np.ndarray) -> Storage[Shape]:
+    problem = _invalid_records(records, len(style_table))
+    if problem is not None:
+        raise DocumentError(problem)
+    storage: Storage[Shape] = Storage()
+    kinds = _available_shapes()
+    ids = np.array([styles.acquire_rgba(tuple(int(c) for c in row)) for row in style_table], np.int64)
+
+    r = records
+    shapes = []
+    for kind, x, y, w, h, a, style, flags in zip(
+            r["kind"].tolist(), r["x"].tolist(), r["y"].tolist(), r["w"].tolist(), r["h"].tolist(),
+            r["a"].tolist(), ids[r["style"]].tolist(), r["flags"].tolist()):
+        shape = kinds[kind](x, y, w, h, a)
+        shape.style_id = style
+        shape.selected = bool(flags & FLAG_SELECTED)
+        shapes.append(shape)
+
+    # push_many links each z level in as one chain
+    for shape, node in zip(shapes, storage.push_many(zip(shapes, r["z"].tolist()))):
+        shape.node = node
+
+    for i in ids.tolist():
+        styles.release(i)
+    return storage
+
+
+def load_storage(path: Union[str, os.PathLike]) -> Storage[Shape]:
+    with DocumentFile(path) as doc:
+        return doc.to_storage()
+
@@ -0,0 +1,104 @@
+from typing import Optional, Sequence
+
+import numpy as np
+from PySide6.QtCore import QRectF
+
+from .shape import Shape, Bounds
+
+__all__ = ("GroupTransform",)
+
+
+class GroupTransform:
+    def __init__(self, shapes: Sequence[Shape]):
+        self._shapes = list(shapes)
+        self._x, self._y, self._w, self._h, self._a, self._types = self._gather()
+        self._old = self._bounds(self._x, self._y, self._w, self._h, self._a)
+        self._new = self._old
+        self._delta = (0, 0, 0, 0, 0.0)
+
+    def __len__(self) -> int:
+        return len(self._shapes)
+
+    @property
+    def shapes(self) -> list[Shape]:
+        return self._shapes
+
+    @property
+    def old_bounds(self) -> Bounds:
+        return self._old
+
+    @property
+    def new_bounds(self) -> Bounds:
+        return self._new
+
+    @property
+    def delta(self) -> tuple[int, int, int, int, float]:
+        # What apply() actually did, after clamping
+        return self._delta
+
+    def apply(self, dx: int, dy: int, dw: int, dh: int, da: float, area: Optional[QRectF]) -> bool:
+        # Without an area the step is applied as is, e.g. to replay a delta that was checked before
+        if not self._shapes:
+            return False
+
+        if area is None:
+            self._new = self._bounds(self._x + dx, self._y + dy, self._w + dw, self._h + dh, self._a + da)
+            self._set(dx, dy, dw, dh, da)
+            return True
+
+        left, top, right, bottom = area.left(), area.top(), area.right(), area.bottom()
+
+        if dw == 0 and dh == 0 and da == 0:
+            # Pure moves are clamped so the group stops at the edge as a whole
+            x0, y0, x1, y1 = self._old
+            dx = min(max(dx, min(left - x0.min(), 0)), max(right - x1.max(), 0))
+            dy = min(max(dy, min(top - y0.min(), 0)), max(bottom - y1.max(), 0))
+            dx = int(np.floor(dx)) if dx > 0 else int(np.ceil(dx))
+            dy = int(np.floor(dy)) if dy > 0 else int(np.ceil(dy))
+            if dx == 0 and dy == 0:
+                return False
+            self._new = x0 + dx, y0 + dy, x1 + dx, y1 + dy
+        else:
+            new = self._bounds(self._x + dx, self._y + dy, self._w + dw, self._h + dh, self._a + da)
+            x0, y0, x1, y1 = new
+            if x0.min() < left or y0.min() < top or x1.max() > right or y1.max() > bottom:
+                return False
+            self._new = new
+
+        self._set(dx, dy, dw, dh, da)
+        return True
+
+    def _gather(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict[type, np.ndarray]]:
+        # Geometry columns of the shapes and a mask per shape type
+        n = len(self._shapes)
+        x = np.fromiter((s.x for s in self._shapes), np.int64, n)
+        y = np.fromiter((s.y for s in self._shapes), np.int64, n)
+        w = np.fromiter((s.w for s in self._shapes), np.int64, n)
+        h = np.fromiter((s.h for s in self._shapes), np.int64, n)
+        a = np.fromiter((s.a for s in self._shapes), np.float64, n)
+
+        types: dict[type, np.ndarray] = {}
+        kinds = [type(s) for s in self._shapes]
+        for kind in set(kinds):
+            types[kind] = np.fromiter((k is kind for k in kinds), np.bool_, n)
+        return x, y, w, h, a, types
+
+    def _set(self, dx: int, dy: int, dw: int, dh: int, da: float):
+        for shape in self._shapes:
+            shape.x += dx
+            shape.y += dy
+            shape.w += dw
+            shape.h += dh
+            shape.a += da
+        self._delta = (dx, dy, dw, dh, da)
+
+    def _bounds(self, x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray) -> Bounds:
+        if len(self._types) == 1:
+            kind, = self._types
+            return kind.bounds(x, y, w, h, a)
+
+        res = tuple(np.empty(len(self._shapes)) for _ in range(4))
+        for kind, mask in self._types.items():
+            for column, values in zip(res, kind.bounds(x[mask], y[mask], w[mask], h[mask], a[mask])):
+                column[mask] = values
+        return res
@@ -0,0 +1,315 @@
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from typing import Optional, Protocol, Sequence
+
+from .shape import Shape
+from .storage import Node
+from .style import styles
+
+__all__ = (
+    "EditTarget", "Command", "InsertCommand", "DeleteCommand", "TransformCommand", "RecolorCommand",
+    "ChangeZCommand", "BatchCommand", "History",
+)
+
+# Rough cost of a shape kept alive only by the history: the object, its node and cached geometry
+RETAINED_SHAPE_BYTES = 512
+
+# A reference to a node whose shape is still in the document
+NODE_REF_BYTES = 8
+
+# Per-command bookkeeping on top of the payload
+COMMAND_BYTES = 128
+
+# A node unlinked from the document, whose shape is still in it through another node
+NODE_BYTES = sys.getsizeof(Node(None)) + sys.getsizeof(vars(Node(None)))
+
+
+def _nodes_size(nodes: Sequence[Node[Shape]]) -> int:
+    # Commands swap their nodes in and out as a whole, so the first one tells whether the history alone holds them
+    if nodes and nodes[0].storage is None:
+        return len(nodes) * (NODE_REF_BYTES + RETAINED_SHAPE_BYTES)
+    return len(nodes) * NODE_REF_BYTES
+
+
+class EditTarget(Protocol):
+    def remove_nodes(self, nodes: Sequence[Node[Shape]]):
+        ...
+
+    def restore_nodes(self, nodes: Sequence[Node[Shape]]):
+        ...
+
+    def transform_shapes(self, shapes: Sequence[Shape], dx: int, dy: int, dw: int, dh: int, da: float):
+        ...
+
+    def restyle_shapes(self, shapes: Sequence[Shape], style_ids: Sequence[int]):
+        ...
+
+
+class Command(ABC):
+    @abstractmethod
+    def undo(self, target: EditTarget):
+        pass
+
+    @abstractmethod
+    def redo(self, target: EditTarget):
+        pass
+
+    @abstractmethod
+    def size(self) -> int:
+        pass
+
+    def merge(self, other: 'Command') -> bool:
+        return False
+
+    def discard(self):
+        pass
+
+
+class InsertCommand(Command):
+    def __init__(self, nodes: Sequence[Node[Shape]]):
+        self._nodes = list(nodes)
+
+    @property
+    def nodes(self) -> list[Node[Shape]]:
+        return self._nodes
+
+    def undo(self, target: EditTarget):
+        target.remove_nodes(self._nodes[::-1])
+
+    def redo(self, target: EditTarget):
+        target.restore_nodes(self._nodes)
+
+    def size(self) -> int:
+        return COMMAND_BYTES + _nodes_size(self._nodes)
+
+    def merge(self, other: Command) -> bool:
+        if not isinstance(other, InsertCommand):
+            return False
+        self._nodes.extend(other._nodes)
+        return True
+
+
+class DeleteCommand(Command):
+    def __init__(self, nodes: Sequence[Node[Shape]]):
+        # In removal order; restoring in reverse puts every node back next to its old neighbour
+        self._nodes = list(nodes)
+
+    def undo(self, target: EditTarget):
+        target.restore_nodes(self._nodes[::-1])
+
+    def redo(self, target: EditTarget):
+        target.remove_nodes(self._nodes)
+
+    def size(self) -> int:
+        return COMMAND_BYTES + _nodes_size(self._nodes)
+
+
+class TransformCommand(Command):
+    def __init__(self, shapes: Sequence[Shape], dx: int, dy: int, dw: int, dh: int, da: float):
+        self._shapes = tuple(shapes)
+        self._delta = [dx, dy, dw, dh, da]
+
+    @property
+    def delta(self) -> tuple[int, int, int, int, float]:
+        dx, dy, dw, dh, da = self._delta
+        return dx, dy, dw, dh, da
+
+    def undo(self, target: EditTarget):
+        dx, dy, dw, dh, da = self._delta
+        target.transform_shapes(self._shapes, -dx, -dy, -dw, -dh, -da)
+
+    def redo(self, target: EditTarget):
+        target.transform_shapes(self._shapes, *self._delta)
+
+    def size(self) -> int:
+        return COMMAND_BYTES + sys.getsizeof(self._shapes)
+
+    def merge(self, other: Command) -> bool:
+        if not isinstance(other, TransformCommand) or len(other._shapes) != len(self._shapes):
+            return False
+        if any(a is not b for a, b in zip(self._shapes, other._shapes)):
+            return False
+
+        # Moves, resizes and rotations of the same group commute, so the deltas simply add up
+        for i, d in enumerate(other._delta):
+            self._delta[i] += d
+        return True
+
+
+class RecolorCommand(Command):
+    def __init__(self, shapes: Sequence[Shape], old_styles: Sequence[int], new_styles: Sequence[int]):
+        self._shapes = tuple(shapes)
+        self._old = array("l", old_styles)
+        self._new = array("l", new_styles)
+        # Keep both sides interned so their ids are not recycled while the entry lives
+        for i in self._old:
+            styles.retain(i)
+        for i in self._new:
+            styles.retain(i)
+
+    def undo(self, target: EditTarget):
+        target.restyle_shapes(self._shapes, self._old)
+
+    def redo(self, target: EditTarget):
+        target.restyle_shapes(self._shapes, self._new)
+
+    def size(self) -> int:
+        return (COMMAND_BYTES + sys.getsizeof(self._shapes)
+                + self._old.itemsize * len(self._old) + self._new.itemsize * len(self._new))
+
+    def discard(self):
+        for i in self._old:
+            styles.release(i)
+        for i in self._new:
+            styles.release(i)
+        self._old = array("l")
+        self._new = array("l")
+
+
+class ChangeZCommand(Command):
+    def __init__(self, old_nodes: Sequence[Node[Shape]], new_nodes: Sequence[Node[Shape]]):
+        self._old = list(old_nodes)
+        self._new = list(new_nodes)
+
+    def undo(self, target: EditTarget):
+        target.remove_nodes(self._new[::-1])
+        target.restore_nodes(self._old[::-1])
+
+    def redo(self, target: EditTarget):
+        target.remove_nodes(self._old)
+        target.restore_nodes(self._new)
+
+    def size(self) -> int:
+        # One of the two node lists is always unlinked and held only here; the shapes stay in the document
+        return COMMAND_BYTES + sys.getsizeof(self._old) + sys.getsizeof(self._new) + len(self._old) * NODE_BYTES
+
+
+class BatchCommand(Command):
+    def __init__(self, commands: Sequence[Command]):
+        self._commands = list(commands)
+
+    def undo(self, target: EditTarget):
+        for command in reversed(self._commands):
+            command.undo(target)
+
+    def redo(self, target: EditTarget):
+        for command in self._commands:
+            command.redo(target)
+
+    def size(self) -> int:
+        return COMMAND_BYTES + sum(command.size() for command in self._commands)
+
+    def discard(self):
+        for command in self._commands:
+            command.discard()
+        self._commands.clear()
+
+
+class History:
+    # Once the sizes of all entries exceed the budget the oldest undo entries go first
+    def __init__(self, budget: int = 16 * 1024 * 1024):
+        self._budget = budget
+        self._undo: deque[tuple[Command, int]] = deque()
+        self._redo: list[tuple[Command, int]] = []
+        self._used = 0
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, value: int):
+        self._budget = value
+        self._evict()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def __len__(self) -> int:
+        return len(self._undo)
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def clear(self):
+        for command, _ in self._undo:
+            command.discard()
+        self._undo.clear()
+        self._clear_redo()
+        self._used = 0
+
+    def push(self, command: Command, merge: bool = False):
+        self._clear_redo()
+
+        if merge and self._undo:
+            top, size = self._undo[-1]
+            if top.merge(command):
+                command.discard()
+                new_size = top.size()
+                self._undo[-1] = top, new_size
+                self._used += new_size - size
+                self._evict()
+                return
+
+        size = command.size()
+        self._undo.append((command, size))
+        self._used += size
+        self._evict()
+
+    def refresh(self, command: Command) -> bool:
+        # Re-measures a command that grew in place; False when it is no longer on the undo stack
+        for i in range(len(self._undo) - 1, -1, -1):
+            if self._undo[i][0] is command:
+                break
+        else:
+            return False
+
+        self._clear_redo()
+        size = command.size()
+        self._used += size - self._undo[i][1]
+        self._undo[i] = command, size
+        self._evict()
+        return True
+
+    def undo(self, target: EditTarget) -> Optional[Command]:
+        if not self._undo:
+            return None
+
+        command, size = self._undo.pop()
+        command.undo(target)
+        # What a command retains depends on which side of it the document is
+        self._redo.append((command, self._remeasure(command, size)))
+        return command
+
+    def redo(self, target: EditTarget) -> Optional[Command]:
+        if not self._redo:
+            return None
+
+        command, size = self._redo.pop()
+        command.redo(target)
+        self._undo.append((command, self._remeasure(command, size)))
+        self._evict()
+        return command
+
+    def _remeasure(self, command: Command, size: int) -> int:
+        new_size = command.size()
+        self._used += new_size - size
+        return new_size
+
+    def _clear_redo(self):
+        for command, size in self._redo:
+            command.discard()
+            self._used -= size
+        self._redo.clear()
+
+    def _evict(self):
+        while self._used > self._budget and self._undo:
+            command, size = self._undo.popleft()
+            command.discard()
+            self._used -= size
@@ -0,0 +1,350 @@
+import os
+import struct
+import zlib
+from contextlib import suppress
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from PySide6.QtCore import QRunnable, QThreadPool, QTimer
+
+from .record_table import RecordTable, TableSnapshot, TABLE_DTYPE, table_records
+from .document import DocumentError, records_to_storage
+from .shape import Shape
+from .storage import Storage
+
+__all__ = ("Journal",)
+
+BASE_MAGIC = b"OOPJBASE"
+BASE_VERSION = 1
+
+# magic, version, generation, row count
+BASE_HEADER = struct.Struct("<8sIIQ")
+
+# payload size, CRC-32 of the payload, record type
+FRAME = struct.Struct("<IIB3x")
+
+# Payload is row numbers followed by TABLE_DTYPE rows
+UPSERT = 1
+# Payload is row numbers
+REMOVE = 2
+
+# Records are committed together at most this often, with one fsync
+COMMIT_INTERVAL = 100
+COMMIT_BYTES = 1 << 20
+
+# A log grown past this, or past half the base, is folded into a new base
+COMPACT_BYTES = 16 << 20
+
+
+def _log_path(path: str, generation: int) -> str:
+    return f"{path}.{generation}.log"
+
+
+def _logs(path: str) -> list[tuple[int, str]]:
+    directory, name = os.path.split(path)
+    logs = []
+    with suppress(OSError):
+        for entry in os.listdir(directory or "."):
+            stem, _, generation = entry[:-len(".log")].rpartition(".")
+            if entry.endswith(".log") and stem == name and generation.isdigit():
+                logs.append((int(generation), os.path.join(directory, entry)))
+    return sorted(logs)
+
+
+def _read_base(path: str) -> tuple[Optional[np.ndarray], int]:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(BASE_HEADER.size)
+            if len(header) < BASE_HEADER.size:
+                return None, 0
+            magic, version, generation, rows = BASE_HEADER.unpack(header)
+            if magic != BASE_MAGIC or version != BASE_VERSION:
+                return None, 0
+            table = np.fromfile(f, TABLE_DTYPE, rows)
+    except OSError:
+        return None, 0
+    if len(table) != rows:
+        return None, 0
+    return table, generation
+
+
+def _read_log(path: str) -> tuple[np.ndarray, np.ndarray, int]:
+    # Frames up to the first torn or corrupt one, which is where a crash cut the last commit short
+    rows: list[bytes] = []
+    values: list[bytes] = []
+    count = 0
+    with suppress(OSError), open(path, "rb") as f:
+        data = memoryview(f.read())
+        offset = 0
+        while offset + FRAME.size <= len(data):
+            size, crc, kind = FRAME.unpack_from(data, offset)
+            start = offset + FRAME.size
+            payload = data[start:start + size]
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                break
+            offset = start + size
+            count += 1
+
+            if kind == UPSERT:
+                n = size // (8 + TABLE_DTYPE.itemsize)
+                rows.append(payload[:8 * n])
+                values.append(payload[8 * n:])
+            elif kind == REMOVE:
+                rows.append(payload)
+                values.append(bytes(size // 8 * TABLE_DTYPE.itemsize))
+
+    # Decoded in one go rather than per frame
+    return np.frombuffer(b"".join(rows), np.int64), np.frombuffer(b"".join(values), TABLE_DTYPE), count
+
+
+class _AppendJob(QRunnable):
+    def __init__(self, path: str, data: bytes, base: Optional['_CompactJob']):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.path = path
+        self.data = data
+        self.base = base
+        self.error: Optional[OSError] = None
+        self.done = False
+
+    def run(self):
+        try:
+            # The log of a base that never got written would replay on top of the previous one; the compaction
+            # redone after the failure covers these records instead
+            if self.base is not None and self.base.error is not None:
+                return
+            with open(self.path, "ab") as f:
+                f.write(self.data)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            self.error = e
+        finally:
+            self.data = None
+            self.done = True
+
+
+class _CompactJob(QRunnable):
+    def __init__(self, snapshot: TableSnapshot, path: str, generation: int):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.snapshot = snapshot
+        self.path = path
+        self.generation = generation
+        self.error: Optional[OSError] = None
+        self.done = False
+
+    def run(self):
+        # The base names the first log still needed, so older ones go only once it is in place
+        tmp = f"{self.path}.tmp"
+        try:
+            table = self.snapshot.table()
+            with open(tmp, "wb") as f:
+                f.write(BASE_HEADER.pack(BASE_MAGIC, BASE_VERSION, self.generation, len(table)))
+                f.write(table.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            for generation, log in _logs(self.path):
+                if generation < self.generation:
+                    os.remove(log)
+        except OSError as e:
+            self.error = e
+            with suppress(OSError):
+                os.remove(tmp)
+        finally:
+            self.snapshot = None
+            self.done = True
+
+
+class Journal:
+    # A DocumentListener writing each change as a framed record, group-committed with one fsync on a worker thread
+    def __init__(self, path: Union[str, os.PathLike], commit_interval: int = COMMIT_INTERVAL):
+        self._path = os.fspath(path)
+        self._table = RecordTable()
+        _, base_generation = _read_base(self._path)
+        self._generation = max([base_generation] + [g for g, _ in _logs(self._path)])
+
+        self._pending: list[bytes] = []
+        self._pending_bytes = 0
+        self._log_bytes = 0
+        self._records = 0
+        self._commits = 0
+        self._compactions = 0
+        self._error: Optional[OSError] = None
+
+        # A single writer runs the jobs in the order they were queued
+        self._jobs: list[Union[_AppendJob, _CompactJob]] = []
+        self._base: Optional[_CompactJob] = None
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(1)
+
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(commit_interval)
+        self._timer.timeout.connect(self.commit)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def commit_interval(self) -> int:
+        return self._timer.interval()
+
+    @commit_interval.setter
+    def commit_interval(self, value: int):
+        self._timer.setInterval(value)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    @property
+    def commits(self) -> int:
+        return self._commits
+
+    @property
+    def compactions(self) -> int:
+        return self._compactions
+
+    @property
+    def error(self) -> Optional[OSError]:
+        self._reap()
+        return self._error
+
+    def commit(self):
+        self._flush()
+        failed = self._base is not None and self._base.done and self._base.error is not None
+        if failed or self._log_bytes > min(COMPACT_BYTES, len(self._table) * TABLE_DTYPE.itemsize // 2):
+            self.compact()
+
+    def compact(self):
+        # Appends queued from here on go to the new generation and are dropped if this base fails to be written
+        self._flush()
+        self._generation += 1
+        self._log_bytes = 0
+        self._compactions += 1
+        self._base = _CompactJob(self._table.snapshot(), self._path, self._generation)
+        self._start(self._base)
+
+    def wait(self):
+        self._pool.waitForDone()
+        self._reap()
+
+    def close(self):
+        # Leaves a single base behind, so the next start has no log to replay
+        self.compact()
+        self.wait()
+
+    def _flush(self):
+        self._timer.stop()
+        if not self._pending:
+            return
+
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._log_bytes += len(data)
+        self._commits += 1
+        self._start(_AppendJob(_log_path(self._path, self._generation), data, self._base))
+
+    def _start(self, job: Union[_AppendJob, _CompactJob]):
+        self._reap()
+        self._jobs.append(job)
+        self._pool.start(job)
+
+    def _reap(self):
+        while self._jobs and self._jobs[0].done:
+            job = self._jobs.pop(0)
+            if job.error is not None:
+                self._error = job.error
+
+    def _append(self, kind: int, payload: bytes):
+        self._pending.append(FRAME.pack(len(payload), zlib.crc32(payload), kind) + payload)
+        self._pending_bytes += FRAME.size + len(payload)
+        self._records += 1
+        if self._pending_bytes >= COMMIT_BYTES:
+            self.commit()
+        elif not self._timer.isActive():
+            self._timer.start()
+
+    @staticmethod
+    def replay(path: Union[str, os.PathLike]) -> Optional[Storage[Shape]]:
+        # The document as of the last commit, or None when there is nothing to replay
+        table, _ = Journal.replay_table(path)
+        if table is None:
+            return None
+        try:
+            return records_to_storage(*table_records(table))
+        except DocumentError:
+            return None
+
+    @staticmethod
+    def replay_table(path: Union[str, os.PathLike]) -> tuple[Optional[np.ndarray], int]:
+        # Final rows after the base and its logs, with the number of log records applied
+        path = os.fspath(path)
+        with suppress(OSError):
+            os.remove(f"{path}.tmp")
+        # Only the log of the base's own generation continues it. Older ones are left over from a compaction and a
+        # newer one could only come from a base that failed to be written, on top of which its rows mean nothing
+        table, generation = _read_base(path)
+        logs = [log for g, log in _logs(path) if g == generation]
+        if table is None and not logs:
+            return None, 0
+        if table is None:
+            table = np.zeros(0, TABLE_DTYPE)
+
+        rows: list[np.ndarray] = []
+        values: list[np.ndarray] = []
+        count = 0
+        for log in logs:
+            log_rows, log_values, log_count = _read_log(log)
+            rows.append(log_rows)
+            values.append(log_values)
+            count += log_count
+        rows = np.concatenate(rows) if rows else np.zeros(0, np.int64)
+        values = np.concatenate(values) if values else np.zeros(0, TABLE_DTYPE)
+        if not len(rows):
+            return table, count
+
+        # Only the last record for each row matters
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        if rows.max() >= len(table):
+            grown = np.zeros(int(rows.max()) + 1, TABLE_DTYPE)
+            grown[:len(table)] = table
+            table = grown
+        table[rows[last]] = values[last]
+        return table, count
+
+    def document_reset(self, shapes: Sequence[Shape]):
+        # A whole new document goes straight into a new base
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._table.clear()
+        self._table.update(shapes)
+        self.compact()
+
+    def shapes_added(self, shapes: Sequence[Shape]):
+        self._upsert(shapes)
+
+    def shapes_changed(self, shapes: Sequence[Shape]):
+        self._upsert(shapes)
+
+    def shapes_removed(self, shapes: Sequence[Shape]):
+        rows = self._table.remove(shapes)
+        if len(rows):
+            self._append(REMOVE, rows.tobytes())
+
+    def _upsert(self, shapes: Sequence[Shape]):
+        rows, values = self._table.update(shapes)
+        if len(rows):
+            self._append(UPSERT, rows.tobytes() + values.tobytes())
@@ -0,0 +1,52 @@
+from typing import Iterable, Optional
+
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QPainter
+
+from .raster_cache import RasterCache
+from .shape import Shape
+from .style import styles
+
+__all__ = ("LOD_BOX_SIZE", "LOD_POINT_SIZE", "paint_shapes")
+
+# On-screen size in device pixels below which a shape is drawn as a filled box
+LOD_BOX_SIZE = 4.0
+
+# ... and below which it is drawn as a single pixel
+LOD_POINT_SIZE = 1.0
+
+
+def paint_shapes(painter: QPainter, shapes: Iterable[Shape], scale: float = 1.0,
+                 cache: Optional[RasterCache] = None):
+    # At 100% and above every shape is drawn in full
+    box = LOD_BOX_SIZE / scale if scale < 1 else 0.0
+    point = LOD_POINT_SIZE / scale
+    antialiasing = painter.testRenderHint(QPainter.Antialiasing)
+
+    for shape in shapes:
+        # Slots rather than properties: this loop runs once per visible shape per frame
+        w = shape._w
+        h = shape._h
+        if w < box and h < box:
+            # Far too small to show rotation or outline; skip the path entirely
+            if antialiasing:
+                painter.setRenderHint(QPainter.Antialiasing, False)
+                antialiasing = False
+
+            style = styles[shape._style]
+            color = style.selected_border_color if shape._selected else style.default_background_color
+            if w < point and h < point:
+                w = h = point
+            painter.fillRect(QRectF(shape._x - w / 2, shape._y - h / 2, w, h), color)
+            continue
+
+        if not antialiasing:
+            painter.setRenderHint(QPainter.Antialiasing)
+            antialiasing = True
+
+        painter.save()
+        if cache is not None:
+            cache.paint(shape, painter)
+        else:
+            shape.paint(painter)
+        painter.restore()
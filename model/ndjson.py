@@ -0,0 +1,89 @@
+import json
+import math
+from typing import Iterable, Iterator, TextIO
+
+from PySide6.QtGui import QColor
+
+from .document import DocumentError
+from .shape import Shape
+
+__all__ = ("shape_to_ndjson", "iter_ndjson", "write_ndjson", "read_ndjson")
+
+
+def _shapes_by_name() -> dict[str, type]:
+    from .shapes import available_shapes
+    return {kind.name(): kind for kind in available_shapes}
+
+
+def _int32(record: dict, key: str) -> int:
+    # Stored as int32 in binary documents, so anything else could not be saved again
+    value = record[key]
+    if type(value) is not int or not -2 ** 31 <= value < 2 ** 31:
+        raise ValueError(f"{key} must be a 32-bit integer, got {value!r}")
+    return value
+
+
+def _angle(record: dict) -> float:
+    value = record.get("a", 0)
+    if type(value) not in (int, float) or not math.isfinite(value):
+        raise ValueError(f"a must be a finite number, got {value!r}")
+    return float(value)
+
+
+def shape_to_ndjson(shape: Shape) -> str:
+    node = shape.node
+    return json.dumps({
+        "type": shape.name(),
+        "x": shape.x,
+        "y": shape.y,
+        "w": shape.w,
+        "h": shape.h,
+        "a": shape.a,
+        "z": node.priority if node is not None else 0,
+        "border": shape.default_border_color.name(QColor.HexArgb),
+        "fill": shape.default_background_color.name(QColor.HexArgb),
+        "selected": shape.selected,
+    }, separators=(",", ":"))
+
+
+def iter_ndjson(shapes: Iterable[Shape]) -> Iterator[str]:
+    for shape in shapes:
+        yield shape_to_ndjson(shape) + "\n"
+
+
+def write_ndjson(f: TextIO, shapes: Iterable[Shape]) -> int:
+    n = 0
+    for line in iter_ndjson(shapes):
+        f.write(line)
+        n += 1
+    return n
+
+
+def read_ndjson(f: TextIO, chunk_size: int = 5000) -> Iterator[list[tuple[Shape, int]]]:
+    kinds = _shapes_by_name()
+    chunk: list[tuple[Shape, int]] = []
+
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+            shape = kinds[record["type"]](*(_int32(record, key) for key in ("x", "y", "w", "h")), _angle(record))
+            if "border" in record:
+                shape.default_border_color = QColor(record["border"])
+            if "fill" in record:
+                shape.default_background_color = QColor(record["fill"])
+            shape.selected = bool(record.get("selected", False))
+            z = _int32(record, "z") if "z" in record else 0
+        except (ValueError, KeyError, TypeError, OverflowError) as e:
+            raise DocumentError(f"Line {line_no}: invalid shape record ({e!r})") from e
+
+        chunk.append((shape, z))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
@@ -0,0 +1,142 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Union
+
+from .shape import Shape
+from .storage import Storage
+
+__all__ = ("Profiler", "profiler")
+
+# Methods counted while the profiler is on, as (class, method name, counter name, count from the result).
+# Without the last one each call counts once
+_COUNTED: tuple[tuple[type, str, str, Optional[Callable[[Any], int]]], ...] = (
+    (Shape, "shape", "shape.shape", None),
+    (Storage, "push", "storage.push", None),
+    (Storage, "push_many", "storage.push", len),
+    (Storage, "remove", "storage.remove", None),
+    (Storage, "restore", "storage.restore", None),
+    (Storage, "pop_current", "storage.pop_current", None),
+)
+
+
+class Profiler:
+    # Counters are only wrapped around the counted methods while enabled, so off leaves the hot paths untouched
+    def __init__(self, max_events: int = 200_000, max_frames: int = 1000):
+        self._enabled = False
+        self._events: deque[dict] = deque(maxlen=max_events)
+        # (start, duration) in seconds for recent frames
+        self._frames: deque[tuple[float, float]] = deque(maxlen=max_frames)
+        self._counters: Counter[str] = Counter()
+        # Counted methods also run on the tile renderer's workers
+        self._lock = threading.Lock()
+        self._originals: dict[tuple[type, str], Callable] = {}
+        self._origin = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool):
+        if value == self._enabled:
+            return
+        self._enabled = value
+        if value:
+            self._install()
+        else:
+            self._uninstall()
+
+    @property
+    def counters(self) -> dict[str, int]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["shape.geometry_builds"] = Shape.cache_stats()[1]
+        return counters
+
+    def reset(self):
+        self._events.clear()
+        self._frames.clear()
+        with self._lock:
+            self._counters.clear()
+        Shape.reset_cache_stats()
+        self._origin = time.perf_counter()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] += n
+
+    @contextmanager
+    def span(self, name: str, category: str = "view", **args: Any) -> Iterator[dict[str, Any]]:
+        # Yields the args dict so the caller can attach results, e.g. how many shapes were painted
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self._record(name, category, start, time.perf_counter() - start, args)
+
+    def frame(self, start: float, duration: float, **args: Any):
+        self._frames.append((start, duration))
+        self._record("frame", "paint", start, duration, args)
+        self._events.append({
+            "name": "counters", "ph": "C", "ts": self._us(start + duration), "pid": os.getpid(),
+            "args": self.counters,
+        })
+
+    def stats(self) -> dict[str, float]:
+        frames = list(self._frames)
+        if not frames:
+            return {"fps": 0.0, "p50": 0.0, "p99": 0.0, "frames": 0}
+
+        durations = sorted(d for _, d in frames)
+        last = frames[-1][0]
+        recent = [start for start, _ in frames if start > last - 1.0]
+        span = last - recent[0]
+        fps = (len(recent) - 1) / span if span > 0 else 0.0
+        return {
+            "fps": fps,
+            "p50": durations[len(durations) // 2],
+            "p99": durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+            "frames": len(frames),
+        }
+
+    def export_chrome_trace(self, path: Union[str, os.PathLike]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": list(self._events), "displayTimeUnit": "ms"}, f)
+
+    def _us(self, t: float) -> float:
+        return (t - self._origin) * 1e6
+
+    def _record(self, name: str, category: str, start: float, duration: float, args: dict[str, Any]):
+        self._events.append({
+            "name": name, "cat": category, "ph": "X", "ts": self._us(start), "dur": duration * 1e6,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        })
+
+    def _install(self):
+        counters = self._counters
+        lock = self._lock
+        for cls, method, name, weight in _COUNTED:
+            original = cls.__dict__[method]
+            self._originals[cls, method] = original
+
+            def counted(*args, __original=original, __name=name, __weight=weight, **kwargs):
+                result = __original(*args, **kwargs)
+                n = 1 if __weight is None else __weight(result)
+                with lock:
+                    counters[__name] += n
+                return result
+
+            setattr(cls, method, functools.wraps(original)(counted))
+
+    def _uninstall(self):
+        for (cls, method), original in self._originals.items():
+            setattr(cls, method, original)
+        self._originals.clear()
+
+
+profiler = Profiler()
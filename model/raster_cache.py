@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from PySide6.QtCore import QRect, QPoint
+from PySide6.QtGui import QImage, QPainter, Qt
+
+from .shape import Shape, STROKE_MARGIN
+
+__all__ = ("RasterCache",)
+
+
+@dataclass
+class _Entry:
+    revision: int
+    image: QImage
+    # Image rect relative to the shape position
+    rect: QRect
+    size: int
+
+
+class RasterCache:
+    def __init__(self, budget: int = 64 * 1024 * 1024, device_pixel_ratio: float = 1.0):
+        self._budget = budget
+        self._device_pixel_ratio = device_pixel_ratio
+        self._entries: OrderedDict[Shape, _Entry] = OrderedDict()
+        self._used = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, value: int):
+        self._budget = value
+        self._evict()
+
+    @property
+    def device_pixel_ratio(self) -> float:
+        return self._device_pixel_ratio
+
+    @device_pixel_ratio.setter
+    def device_pixel_ratio(self, value: float):
+        if value != self._device_pixel_ratio:
+            self._device_pixel_ratio = value
+            self.clear()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def stats(self) -> tuple[int, int]:
+        return self._hits, self._misses
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._used = 0
+
+    def discard(self, shape: Shape):
+        entry = self._entries.pop(shape, None)
+        if entry is not None:
+            self._used -= entry.size
+
+    def paint(self, shape: Shape, painter: QPainter):
+        entry = self._entries.get(shape)
+        if entry is not None and entry.revision == shape.revision:
+            self._hits += 1
+            self._entries.move_to_end(shape)
+        else:
+            self._misses += 1
+            self.discard(shape)
+            entry = self._render(shape)
+            if entry is None:
+                shape.paint(painter)
+                return
+
+            self._entries[shape] = entry
+            self._used += entry.size
+            self._evict()
+
+        painter.drawImage(entry.rect.topLeft() + QPoint(shape.x, shape.y), entry.image)
+
+    def _render(self, shape: Shape) -> Optional[_Entry]:
+        m = STROKE_MARGIN
+        rect = shape.bounding_rect.adjusted(-m, -m, m, m).toAlignedRect()
+        ratio = self._device_pixel_ratio
+        w = int(rect.width() * ratio + 0.5)
+        h = int(rect.height() * ratio + 0.5)
+        size = w * h * 4
+        if size > self._budget or w <= 0 or h <= 0:
+            return None
+
+        image = QImage(w, h, QImage.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(ratio)
+        image.fill(Qt.transparent)
+
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.translate(-rect.x(), -rect.y())
+        shape.paint(painter)
+        painter.end()
+
+        return _Entry(shape.revision, image, rect.translated(-shape.x, -shape.y), size)
+
+    def _evict(self):
+        while self._used > self._budget and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._used -= entry.size
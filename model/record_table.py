@@ -0,0 +1,163 @@
+import os
+from operator import attrgetter, methodcaller
+from typing import Sequence, Union
+
+import numpy as np
+
+from .document import RECORD_DTYPE, write_document
+from .shape import Shape
+from .style import styles
+
+__all__ = ("RecordTable", "TableSnapshot", "table_records", "TABLE_DTYPE")
+
+# Rows per chunk of a RecordTable; a change copies at most one chunk per snapshot
+CHUNK_ROWS = 4096
+
+TABLE_DTYPE = np.dtype([
+    ("a", "<f8"),
+    ("seq", "<i8"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("w", "<i4"),
+    ("h", "<i4"),
+    ("z", "<i4"),
+    ("kind", "<u2"),
+    ("live", "?"),
+    # The style colors themselves, so a snapshot does not depend on the registry
+    ("style", "<u4", (4,)),
+])
+
+
+def _kind_ids() -> dict[str, int]:
+    from .shapes import available_shapes
+    return {kind.name(): i for i, kind in enumerate(available_shapes)}
+
+
+def table_records(table: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Document records of the live rows in storage order and their style table
+    live = table[table["live"]]
+    live = live[np.lexsort((live["seq"], -live["z"].astype(np.int64)))]
+
+    records = np.zeros(len(live), RECORD_DTYPE)
+    for name in ("x", "y", "w", "h", "a", "z", "kind"):
+        records[name] = live[name]
+    style_table, local = np.unique(live["style"].reshape(-1, 4), axis=0, return_inverse=True)
+    records["style"] = local.reshape(-1)
+    return records, style_table.reshape(-1, 4)
+
+
+class TableSnapshot:
+    # Frozen rows of a RecordTable, safe to read on any thread
+    def __init__(self, chunks: tuple[np.ndarray, ...]):
+        self._chunks = chunks
+
+    def table(self) -> np.ndarray:
+        # Every row, free ones included, so row numbers stay valid
+        return np.concatenate(self._chunks) if self._chunks else np.zeros(0, TABLE_DTYPE)
+
+    def records(self) -> tuple[np.ndarray, np.ndarray]:
+        return table_records(self.table())
+
+    def write(self, path: Union[str, os.PathLike]):
+        write_document(path, *self.records())
+
+
+class RecordTable:
+    # One row per shape in fixed-size chunks; a chunk is copied on its first write after a snapshot shared it
+    def __init__(self, chunk_rows: int = CHUNK_ROWS):
+        self._chunk_rows = chunk_rows
+        self._chunks: list[np.ndarray] = []
+        self._owned: list[bool] = []
+        self._rows: dict[Shape, int] = {}
+        self._free: list[int] = []
+        self._kinds = _kind_ids()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, shape: Shape) -> bool:
+        return shape in self._rows
+
+    def clear(self):
+        self._chunks.clear()
+        self._owned.clear()
+        self._rows.clear()
+        self._free.clear()
+
+    def update(self, shapes: Sequence[Shape]) -> tuple[np.ndarray, np.ndarray]:
+        # Writes the current state of shapes still in a storage, new ones get a row. Returns the rows written
+        shapes = [shape for shape in shapes if shape.node is not None]
+        n = len(shapes)
+        if not n:
+            return np.zeros(0, np.int64), np.zeros(0, TABLE_DTYPE)
+
+        rows = np.fromiter(self._rows_for(shapes), np.int64, n)
+        nodes = list(map(attrgetter("_node"), shapes))
+        values = np.zeros(n, TABLE_DTYPE)
+        for name in ("x", "y", "w", "h"):
+            values[name] = np.fromiter(map(attrgetter(f"_{name}"), shapes), np.int32, n)
+        values["a"] = np.fromiter(map(attrgetter("_a"), shapes), np.float64, n)
+        values["z"] = np.fromiter(map(attrgetter("priority"), nodes), np.int32, n)
+        values["seq"] = np.fromiter(map(attrgetter("seq"), nodes), np.int64, n)
+        values["kind"] = np.fromiter(map(self._kinds.__getitem__, map(methodcaller("name"), shapes)), np.uint16, n)
+        values["live"] = True
+
+        keys: dict[int, tuple[int, int, int, int]] = {}
+        ids = list(map(attrgetter("_style"), shapes))
+        for i in set(ids):
+            keys[i] = styles[i].key
+        values["style"] = np.array([keys[i] for i in ids], np.uint32).reshape(n, 4)
+
+        self._assign(rows, values)
+        return rows, values
+
+    def remove(self, shapes: Sequence[Shape]) -> np.ndarray:
+        rows = [self._rows.pop(shape) for shape in shapes if shape in self._rows]
+        if not rows:
+            return np.zeros(0, np.int64)
+
+        self._free.extend(rows)
+        rows = np.array(rows, np.int64)
+        self._assign(rows, np.zeros(len(rows), TABLE_DTYPE))
+        return rows
+
+    def snapshot(self) -> TableSnapshot:
+        self._owned = [False] * len(self._chunks)
+        return TableSnapshot(tuple(self._chunks))
+
+    def _rows_for(self, shapes: list[Shape]) -> list[int]:
+        rows = list(map(self._rows.get, shapes))
+        missing = rows.count(None)
+        while len(self._free) < missing:
+            start = len(self._chunks) * self._chunk_rows
+            self._chunks.append(np.zeros(self._chunk_rows, TABLE_DTYPE))
+            self._owned.append(True)
+            self._free.extend(range(start + self._chunk_rows - 1, start - 1, -1))
+
+        if missing:
+            for i, row in enumerate(rows):
+                if row is None:
+                    # A shape listed twice keeps the row it got first
+                    row = self._rows.get(shapes[i])
+                    if row is None:
+                        row = self._rows[shapes[i]] = self._free.pop()
+                    rows[i] = row
+        return rows
+
+    def _assign(self, rows: np.ndarray, values: np.ndarray):
+        # Grouped by chunk, so each one is copied at most once
+        chunk_ids = rows // self._chunk_rows
+        first = int(chunk_ids[0])
+        if (chunk_ids == first).all():
+            self._write_chunk(first, rows, values)
+            return
+
+        order = np.argsort(chunk_ids, kind="stable")
+        for part in np.split(order, np.flatnonzero(np.diff(chunk_ids[order])) + 1):
+            self._write_chunk(int(chunk_ids[part[0]]), rows[part], values[part])
+
+    def _write_chunk(self, c: int, rows: np.ndarray, values: np.ndarray):
+        if not self._owned[c]:
+            self._chunks[c] = self._chunks[c].copy()
+            self._owned[c] = True
+        self._chunks[c][rows % self._chunk_rows] = values
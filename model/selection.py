@@ -0,0 +1,48 @@
+import typing
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from .shape import Shape
+
+__all__ = ("Selection",)
+
+
+class Selection:
+    # Shapes join through Shape.selection, after which their selected setter keeps this set in sync
+    def __init__(self):
+        # dict keeps selection order and gives O(1) add/discard
+        self._shapes: dict['Shape', None] = {}
+
+    def __len__(self) -> int:
+        return len(self._shapes)
+
+    def __iter__(self) -> typing.Iterator['Shape']:
+        return iter(list(self._shapes))
+
+    def __contains__(self, shape: 'Shape') -> bool:
+        return shape in self._shapes
+
+    def __bool__(self) -> bool:
+        return bool(self._shapes)
+
+    def select(self, shapes: Iterable['Shape']) -> list['Shape']:
+        changed = [shape for shape in shapes if not shape.selected]
+        for shape in changed:
+            shape.selected = True
+        return changed
+
+    def clear(self) -> list['Shape']:
+        changed = list(self._shapes)
+        for shape in changed:
+            shape.selected = False
+        self._shapes.clear()
+        return changed
+
+    def sync(self, shape: 'Shape'):
+        if shape.selected:
+            self._shapes[shape] = None
+        else:
+            self._shapes.pop(shape, None)
+
+    def discard(self, shape: 'Shape'):
+        self._shapes.pop(shape, None)
@@ -1,12 +1,63 @@
+import math
+import threading
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Optional, Sequence, Union
 
-from PySide6.QtCore import QRectF, QPoint
-from PySide6.QtGui import QPainter, QColor, Qt, QBrush, QPen, QPixmap, QPainterPath, QTransform
+import numpy as np
+from PySide6.QtCore import QRectF, QPoint, QPointF
+from PySide6.QtGui import QPainter, QColor, QPixmap, QPainterPath, QTransform
 
-__all__ = ("Shape",)
+from .selection import Selection
+from .storage import Node
+from .style import Style, styles
+
+__all__ = ("Shape", "Geometry", "Bounds", "STROKE_MARGIN")
+
+Bounds = tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+# How far antialiasing and the dotted selection frame spill outside a shape's bounding rect
+STROKE_MARGIN = 2
+
+# Below this many shapes hit_test calls inside one by one, which beats setting up the numpy arrays
+HIT_TEST_BATCH = 64
+
+# (cos, sin) that QTransform.rotate uses exactly instead of computing them
+_RIGHT_ANGLES = {90: (0.0, 1.0), -270: (0.0, 1.0), 270: (0.0, -1.0), -90: (0.0, -1.0), 180: (-1.0, 0.0)}
+_RIGHT_ANGLE_KEYS = np.array(list(_RIGHT_ANGLES), np.float64)
+
+# qFuzzyIsNull for doubles, which QTransform uses to classify itself
+FUZZY_NULL = 1e-12
+
+# Points closer than this, relative to the coordinates, to an edge of a polygon shape get the exact QPainterPath rule
+EDGE_TOLERANCE = 1e-9
+
+
+class _CacheCounts(threading.local):
+    # Tile workers build geometry too, so each thread counts [hits, misses] in its own list, summed on read
+    lock = threading.Lock()
+    lists: list[list[int]] = []
+
+    def __init__(self):
+        self.counts = [0, 0]
+        with self.lock:
+            self.lists.append(self.counts)
+
+
+_cache_counts = _CacheCounts()
+
+
+@dataclass(frozen=True)
+class Geometry:
+    transform: QTransform
+    path: QPainterPath
+    bounding_rect: QRectF
 
 
 class Shape(ABC):
+    __slots__ = ("_x", "_y", "_w", "_h", "_a", "_selected", "_geometry", "_node", "_selection", "_revision", "_style")
+
     def __init__(self, x: int, y: int, w: int, h: int, a: float):
         self._x = x
         self._y = y
@@ -14,36 +65,226 @@ class Shape(ABC):
         self._h = h
         self._a = a
         self._selected = False
+        self._geometry: Optional[Geometry] = None
+        self._node: Optional[Node] = None
+        self._selection: Optional[Selection] = None
+
+        # Bumped whenever the shape would rasterize differently, apart from a move
+        self._revision = 0
+        self._style = styles.default()
+
+    def __del__(self):
+        if styles is not None:
+            styles.release(self._style)
+
+    def inside(self, p: Union[QPoint, QPointF]) -> bool:
+        px, py = p.x(), p.y()
+        if type(self).contains(self._x, self._y, self._w, self._h, self._a, px, py):
+            return True
+        if not self._selected:
+            return False
+        # Like QRectF.contains, an empty box holds nothing
+        x0, y0, x1, y1 = type(self).bounds(self._x, self._y, self._w, self._h, self._a)
+        return bool(x0 <= px <= x1 and y0 <= py <= y1 and x0 < x1 and y0 < y1)
 
-        self._default_border_color = QColor(Qt.black)
-        self._default_background_color = QColor(Qt.lightGray)
+    @staticmethod
+    def hit_test(shapes: Sequence['Shape'], p: Union[QPoint, QPointF]) -> np.ndarray:
+        # Shape.inside for every shape at once, one closed-form pass per shape type
+        n = len(shapes)
+        if n < HIT_TEST_BATCH:
+            return np.fromiter((shape.inside(p) for shape in shapes), np.bool_, n)
+
+        px, py = p.x(), p.y()
+        x, y, w, h = (np.fromiter(map(attrgetter(name), shapes), np.int64, n) for name in ("_x", "_y", "_w", "_h"))
+        a = np.fromiter(map(attrgetter("_a"), shapes), np.float64, n)
+        selected = np.fromiter(map(attrgetter("_selected"), shapes), np.bool_, n)
+        kinds = {kind: i for i, kind in enumerate(set(map(type, shapes)))}
+        kind_ids = np.fromiter(map(kinds.__getitem__, map(type, shapes)), np.int64, n)
+
+        hits = np.zeros(n, np.bool_)
+        for kind, i in kinds.items():
+            rows = np.flatnonzero(kind_ids == i)
+            hits[rows] = kind.contains(x[rows], y[rows], w[rows], h[rows], a[rows], px, py)
+
+            rows = rows[selected[rows] & ~hits[rows]]
+            if len(rows):
+                x0, y0, x1, y1 = kind.bounds(x[rows], y[rows], w[rows], h[rows], a[rows])
+                hits[rows] = (x0 <= px) & (px <= x1) & (y0 <= py) & (py <= y1) & (x0 < x1) & (y0 < y1)
+        return hits
 
-        self._selected_border_color = QColor(Qt.darkBlue)
-        self._selected_background_color = QColor(Qt.transparent)
+    def paint(self, painter: QPainter):
+        style = styles[self._style]
+        painter.setPen(style.default_pen)
+        painter.setBrush(style.default_brush)
+        painter.drawPath(self.shape())
 
-        self._default_pen = QPen(self._default_border_color)
-        self._default_brush = QBrush(self._default_background_color)
+        if self._selected:
+            painter.setPen(style.selected_pen)
+            painter.setBrush(style.selected_brush)
+            painter.drawRect(self.bounding_rect)
 
-        self._selected_pen = QPen(self._selected_border_color, 1.25, Qt.DotLine)
-        self._selected_brush = QBrush(self._selected_background_color)
+    def shape(self) -> QPainterPath:
+        return self.geometry.path
 
-    def inside(self, p: QPoint) -> bool:
-        return self.shape().contains(p) or self._selected and self.bounding_rect.contains(p)
+    @abstractmethod
+    def _path(self) -> QPainterPath:
+        pass
 
-    def paint(self, painter: QPainter):
-        painter.setPen(self._default_pen)
-        painter.setBrush(self._default_brush)
-        painter.drawPath(self.shape())
+    @property
+    def geometry(self) -> Geometry:
+        if self._geometry is not None:
+            _cache_counts.counts[0] += 1
+            return self._geometry
 
-        if self._selected:
-            painter.setPen(self._selected_pen)
-            painter.setBrush(self._selected_brush)
-            painter.drawRect(self.shape().boundingRect())
+        _cache_counts.counts[1] += 1
+        t = QTransform()
+        t.translate(self._x, self._y)
+        t.rotate(self._a)
 
+        path = t.map(self._path())
+        geometry = self._geometry = Geometry(t, path, path.boundingRect())
+        return geometry
+
+    @staticmethod
+    def cache_stats() -> tuple[int, int]:
+        with _CacheCounts.lock:
+            return sum(c[0] for c in _CacheCounts.lists), sum(c[1] for c in _CacheCounts.lists)
+
+    @staticmethod
+    def reset_cache_stats():
+        with _CacheCounts.lock:
+            for counts in _CacheCounts.lists:
+                counts[0] = counts[1] = 0
+
+    @staticmethod
     @abstractmethod
-    def shape(self) -> QPainterPath:
+    def bounds(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray) -> Bounds:
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def contains(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray,
+                 px: float, py: float) -> np.ndarray:
+        # Whether the point lies inside the outline, with scalars or arrays of shapes alike
         pass
 
+    @staticmethod
+    def _rotation(a: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # cos and sin as QTransform.rotate has them. Scalars go through math, which is several times cheaper
+        # than numpy for a single shape. A sin within qFuzzyIsNull of zero makes the transform a scale, or with cos
+        # as close to 1 a translation, which QTransform.map then applies without the dropped terms
+        if not isinstance(a, np.ndarray):
+            if a in _RIGHT_ANGLES:
+                return _RIGHT_ANGLES[a]
+            rad = math.radians(a)
+            c, s = math.cos(rad), math.sin(rad)
+            if abs(s) <= FUZZY_NULL:
+                return (1.0 if abs(c - 1) <= FUZZY_NULL else c), 0.0
+            return c, s
+
+        rad = np.radians(a)
+        c = np.cos(rad)
+        s = np.sin(rad)
+        if np.isin(a, _RIGHT_ANGLE_KEYS).any():
+            for angle, (cos, sin) in _RIGHT_ANGLES.items():
+                exact = a == angle
+                c[exact] = cos
+                s[exact] = sin
+        scale = np.abs(s) <= FUZZY_NULL
+        if scale.any():
+            s[scale] = 0.0
+            c[scale & (np.abs(c - 1) <= FUZZY_NULL)] = 1.0
+        return c, s
+
+    @staticmethod
+    def _local(x: np.ndarray, y: np.ndarray, a: np.ndarray, px: float, py: float) -> tuple[np.ndarray, np.ndarray]:
+        # The point in the unrotated frame of the shape, inverse of QTransform().translate(x, y).rotate(a)
+        c, s = Shape._rotation(a)
+        dx = px - x
+        dy = py - y
+        return dx * c + dy * s, dy * c - dx * s
+
+    @staticmethod
+    def _map(x: np.ndarray, y: np.ndarray, a: np.ndarray,
+             px: list[np.ndarray], py: list[np.ndarray]) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        # Points through QTransform().translate(x, y).rotate(a), rounded in the same order QTransform.map does
+        c, s = Shape._rotation(a)
+        xs = [c * u + -s * v + x for u, v in zip(px, py)]
+        ys = [s * u + c * v + y for u, v in zip(px, py)]
+        return xs, ys
+
+    @staticmethod
+    def _rotated_bounds(x: np.ndarray, y: np.ndarray, a: np.ndarray,
+                        px: list[np.ndarray], py: list[np.ndarray]) -> Bounds:
+        return Shape._path_rect(*Shape._map(x, y, a, px, py))
+
+    @staticmethod
+    def _path_rect(xs: list[np.ndarray], ys: list[np.ndarray]) -> Bounds:
+        # QPainterPath builds its rects from the top left and the size, so right and bottom round like x + w does
+        if not isinstance(xs[0], np.ndarray):
+            x0, y0 = min(xs), min(ys)
+            return x0, y0, x0 + (max(xs) - x0), y0 + (max(ys) - y0)
+        x0, y0 = np.minimum.reduce(xs), np.minimum.reduce(ys)
+        return x0, y0, x0 + (np.maximum.reduce(xs) - x0), y0 + (np.maximum.reduce(ys) - y0)
+
+    @staticmethod
+    def _empty_path_bounds(w: np.ndarray, h: np.ndarray, bounds: Bounds) -> Bounds:
+        # addRect and addEllipse add nothing for a 0x0 rect, and the empty path is bounded by QRectF() at the origin
+        empty = (w == 0) & (h == 0)
+        if not isinstance(empty, np.ndarray):
+            return (0.0, 0.0, 0.0, 0.0) if empty else bounds
+        if not empty.any():
+            return bounds
+        return tuple(np.where(empty, 0.0, b) for b in bounds)
+
+    @staticmethod
+    def _edge_tolerance(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray) -> np.ndarray:
+        return EDGE_TOLERANCE * (abs(x) + abs(y) + abs(w) + abs(h) + 1)
+
+    @staticmethod
+    def _settle(inside: np.ndarray, near: np.ndarray, x: np.ndarray, y: np.ndarray, a: np.ndarray,
+                corners: tuple[list[np.ndarray], list[np.ndarray]], px: float, py: float) -> np.ndarray:
+        # inside is right for points clear of the edges, the rest go through the rule QPainterPath.contains has
+        if not isinstance(near, np.ndarray):
+            return Shape._polygon_contains(*Shape._map(x, y, a, *corners), px, py) if near else inside
+        rows = np.flatnonzero(near)
+        if len(rows):
+            us, vs = ([c[rows] for c in cs] for cs in corners)
+            inside[rows] = Shape._polygon_contains(*Shape._map(x[rows], y[rows], a[rows], us, vs), px, py)
+        return inside
+
+    @staticmethod
+    def _polygon_contains(xs: list[np.ndarray], ys: list[np.ndarray], px: float, py: float) -> np.ndarray:
+        # QPainterPath.contains for a closed polygon: inside the control point rect, which must not be empty, and an
+        # odd number of crossings, counted half open in y and skipping edges qFuzzyCompare calls horizontal
+        edges = zip(xs, ys, xs[1:] + xs[:1], ys[1:] + ys[:1])
+        if not isinstance(xs[0], np.ndarray):
+            x0, y0, x1, y1 = Shape._path_rect(xs, ys)
+            if not (x0 <= px <= x1 and y0 <= py <= y1 and x0 < x1 and y0 < y1):
+                return False
+            inside = False
+            for xa, ya, xb, yb in edges:
+                if abs(ya - yb) * 1e12 <= min(abs(ya), abs(yb)):
+                    continue
+                if yb < ya:
+                    xa, ya, xb, yb = xb, yb, xa, ya
+                if ya <= py < yb and xa + (xb - xa) / (yb - ya) * (py - ya) <= px:
+                    inside = not inside
+            return inside
+
+        x0, y0, x1, y1 = Shape._path_rect(xs, ys)
+        inside = (x0 <= px) & (px <= x1) & (y0 <= py) & (py <= y1) & (x0 < x1) & (y0 < y1)
+        odd = np.zeros_like(inside)
+        for xa, ya, xb, yb in edges:
+            flat = np.abs(ya - yb) * 1e12 <= np.minimum(np.abs(ya), np.abs(yb))
+            down = yb < ya
+            xa, xb = np.where(down, xb, xa), np.where(down, xa, xb)
+            ya, yb = np.where(down, yb, ya), np.where(down, ya, yb)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cross = xa + (xb - xa) / (yb - ya) * (py - ya) <= px
+            odd ^= ~flat & (ya <= py) & (py < yb) & cross
+        return inside & odd
+
     @staticmethod
     @abstractmethod
     def name() -> str:
@@ -54,13 +295,42 @@ class Shape(ABC):
     def image() -> QPixmap:
         pass
 
+    @property
+    def node(self) -> Optional[Node]:
+        return self._node
+
+    @node.setter
+    def node(self, value: Optional[Node]):
+        self._node = value
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
     @property
     def selected(self) -> bool:
         return self._selected
 
     @selected.setter
     def selected(self, selected: bool):
+        if selected == self._selected:
+            return
         self._selected = selected
+        self._revision += 1
+        if self._selection is not None:
+            self._selection.sync(self)
+
+    @property
+    def selection(self) -> Optional[Selection]:
+        return self._selection
+
+    @selection.setter
+    def selection(self, value: Optional[Selection]):
+        if self._selection is not None:
+            self._selection.discard(self)
+        self._selection = value
+        if value is not None:
+            value.sync(self)
 
     @property
     def x(self) -> int:
@@ -68,7 +338,10 @@ class Shape(ABC):
 
     @x.setter
     def x(self, x: int):
+        if x == self._x:
+            return
         self._x = x
+        self._geometry = None
 
     @property
     def y(self) -> int:
@@ -76,7 +349,10 @@ class Shape(ABC):
 
     @y.setter
     def y(self, y: int):
+        if y == self._y:
+            return
         self._y = y
+        self._geometry = None
 
     @property
     def w(self) -> int:
@@ -84,7 +360,11 @@ class Shape(ABC):
 
     @w.setter
     def w(self, value: int):
+        if value == self._w:
+            return
         self._w = value
+        self._geometry = None
+        self._revision += 1
 
     @property
     def h(self) -> int:
@@ -92,7 +372,11 @@ class Shape(ABC):
 
     @h.setter
     def h(self, value: int):
+        if value == self._h:
+            return
         self._h = value
+        self._geometry = None
+        self._revision += 1
 
     @property
     def a(self) -> float:
@@ -100,52 +384,69 @@ class Shape(ABC):
 
     @a.setter
     def a(self, value: float):
+        if value == self._a:
+            return
         self._a = value
+        self._geometry = None
+        self._revision += 1
 
     @property
     def transform(self) -> QTransform:
-        t = QTransform()
-        t.translate(self.x, self.y)
-        t.rotate(self.a)
-
-        return t
+        return self.geometry.transform
 
     @property
     def bounding_rect(self) -> QRectF:
-        return self.shape().boundingRect()
+        return self.geometry.bounding_rect
+
+    @property
+    def style_id(self) -> int:
+        return self._style
+
+    @style_id.setter
+    def style_id(self, value: int):
+        if value == self._style:
+            return
+        styles.retain(value)
+        styles.release(self._style)
+        self._style = value
+        self._revision += 1
+
+    @property
+    def style(self) -> Style:
+        return styles[self._style]
 
     @property
     def default_border_color(self) -> QColor:
-        return self._default_border_color
+        return styles[self._style].default_border_color
 
     @default_border_color.setter
     def default_border_color(self, value: QColor):
-        self._default_border_color = value
-        self._default_pen.setColor(value)
+        self._style = styles.derive(self._style, border=value)
+        self._revision += 1
 
     @property
     def default_background_color(self) -> QColor:
-        return self._default_background_color
+        return styles[self._style].default_background_color
 
     @default_background_color.setter
     def default_background_color(self, value: QColor):
-        self._default_background_color = value
-        self._default_brush.setColor(value)
+        self._style = styles.derive(self._style, fill=value)
+        self._revision += 1
 
     @property
     def selected_border_color(self) -> QColor:
-        return self._selected_border_color
+        return styles[self._style].selected_border_color
 
     @selected_border_color.setter
     def selected_border_color(self, value: QColor):
-        self._selected_border_color = value
-        self._selected_pen.setColor(value)
+        self._style = styles.derive(self._style, selected_border=value)
+        self._revision += 1
 
     @property
     def selected_background_color(self) -> QColor:
-        return self._selected_background_color
+        return styles[self._style].selected_background_color
 
     @selected_background_color.setter
     def selected_background_color(self, value: QColor):
-        self._selected_background_color = value
-        self._selected_brush.setColor(value)
+        self._style = styles.derive(self._style, selected_fill=value)
+        self._revision += 1
@@ -1,18 +1,42 @@
+import numpy as np
 from PySide6.QtGui import QPainter, Qt, QPixmap, QPen, QPainterPath
 
-from model.shape import Shape
+from model.shape import Shape, Bounds
 
 __all__ = ("Ellipse",)
 
 
 class Ellipse(Shape):
-    def shape(self) -> QPainterPath:
+    __slots__ = ()
+
+    def _path(self) -> QPainterPath:
         path = QPainterPath()
         path.addEllipse(-self._w // 2, -self._h // 2, self._w, self._h)
-
-        path = self.transform.map(path)
         return path
 
+    @staticmethod
+    def bounds(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray) -> Bounds:
+        rx = w / 2
+        ry = h / 2
+        cx = -w // 2 + rx
+        cy = -h // 2 + ry
+
+        c, s = Shape._rotation(a)
+        ox = x + cx * c - cy * s
+        oy = y + cx * s + cy * c
+        ex = np.hypot(rx * c, ry * s)
+        ey = np.hypot(rx * s, ry * c)
+        return Shape._empty_path_bounds(w, h, (ox - ex, oy - ey, ox + ex, oy + ey))
+
+    @staticmethod
+    def contains(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray,
+                 px: float, py: float) -> np.ndarray:
+        u, v = Shape._local(x, y, a, px, py)
+        # (u / rx)^2 + (v / ry)^2 < 1 multiplied out, so zero radii need no special case
+        u = u - (-w // 2 + w / 2)
+        v = v - (-h // 2 + h / 2)
+        return (u * h) ** 2 + (v * w) ** 2 < (w * h / 2) ** 2
+
     @staticmethod
     def name() -> str:
         return "Ellipse"
@@ -1,18 +1,40 @@
+import numpy as np
 from PySide6.QtGui import QPainter, QPixmap, Qt, QPen, QPainterPath
 
-from model.shape import Shape
+from model.shape import Shape, Bounds
 
 __all__ = ("Rectangle",)
 
 
 class Rectangle(Shape):
-    def shape(self) -> QPainterPath:
+    __slots__ = ()
+
+    def _path(self) -> QPainterPath:
         path = QPainterPath()
         path.addRect(-self._w // 2, -self._h // 2, self._w, self._h)
-
-        path = self.transform.map(path)
         return path
 
+    @staticmethod
+    def _corners(w: np.ndarray, h: np.ndarray) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        x0 = -w // 2
+        y0 = -h // 2
+        return [x0, x0 + w, x0 + w, x0], [y0, y0, y0 + h, y0 + h]
+
+    @staticmethod
+    def bounds(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray) -> Bounds:
+        return Shape._empty_path_bounds(w, h, Shape._rotated_bounds(x, y, a, *Rectangle._corners(w, h)))
+
+    @staticmethod
+    def contains(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray,
+                 px: float, py: float) -> np.ndarray:
+        u, v = Shape._local(x, y, a, px, py)
+        u = u - (-w // 2)
+        v = v - (-h // 2)
+        inside = (u * (u - w) < 0) & (v * (v - h) < 0)
+        tolerance = Shape._edge_tolerance(x, y, w, h)
+        near = (abs(u) <= tolerance) | (abs(u - w) <= tolerance) | (abs(v) <= tolerance) | (abs(v - h) <= tolerance)
+        return Shape._settle(inside, near, x, y, a, Rectangle._corners(w, h), px, py)
+
     @staticmethod
     def name() -> str:
         return "Rectangle"
@@ -1,13 +1,16 @@
+import numpy as np
 from PySide6.QtCore import QPoint, Qt
 from PySide6.QtGui import QPixmap, QPainterPath, QPolygon, QPainter, QPen
 
-from model.shape import Shape
+from model.shape import Shape, Bounds
 
 __all__ = ("Triangle",)
 
 
 class Triangle(Shape):
-    def shape(self) -> QPainterPath:
+    __slots__ = ()
+
+    def _path(self) -> QPainterPath:
         p0 = QPoint(-self.w // 2, self.h // 2)
         p1 = QPoint(self.w // 2, self.h // 2)
         p2 = QPoint(0, -self.h // 2)
@@ -18,10 +21,34 @@ class Triangle(Shape):
 
         path = QPainterPath()
         path.addPolygon(polygon)
-
-        path = self.transform.map(path)
         return path
 
+    @staticmethod
+    def _corners(w: np.ndarray, h: np.ndarray) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        return [-w // 2, w // 2, w * 0], [h // 2, h // 2, -h // 2]
+
+    @staticmethod
+    def bounds(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray) -> Bounds:
+        return Shape._rotated_bounds(x, y, a, *Triangle._corners(w, h))
+
+    @staticmethod
+    def contains(x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray, a: np.ndarray,
+                 px: float, py: float) -> np.ndarray:
+        u, v = Shape._local(x, y, a, px, py)
+        # Strictly on the same side of all three edges of the _path polygon, so a flat one holds nothing
+        left, right, bottom, top = -w // 2, w // 2, h // 2, -h // 2
+        d0 = (right - left) * (v - bottom)
+        d1 = (top - bottom) * (right - u) - right * (v - bottom)
+        d2 = left * (v - top) - (bottom - top) * u
+        inside = ((d0 > 0) & (d1 > 0) & (d2 > 0)) | ((d0 < 0) & (d1 < 0) & (d2 < 0))
+
+        # Each d is the distance to its edge times the edge length
+        tolerance = Shape._edge_tolerance(x, y, w, h)
+        near = (abs(d0) <= tolerance * abs(right - left)) | \
+            (abs(d1) <= tolerance * (right ** 2 + (top - bottom) ** 2) ** 0.5) | \
+            (abs(d2) <= tolerance * (left ** 2 + (bottom - top) ** 2) ** 0.5)
+        return Shape._settle(inside, near, x, y, a, Triangle._corners(w, h), px, py)
+
     @staticmethod
     def name() -> str:
         return "Triangle"
@@ -0,0 +1,262 @@
+import itertools
+import math
+from typing import TypeVar, Generic, Optional, Hashable, Sequence
+
+import numpy as np
+from PySide6.QtCore import QRectF, QPointF
+
+__all__ = ("SpatialIndex",)
+
+T = TypeVar("T", bound=Hashable)
+
+Box = tuple[float, float, float, float]
+
+# Each side of a node's loose box lies this fraction of the node size outside its cell
+LOOSENESS = 0.125
+
+
+def _box(rect: QRectF) -> Box:
+    return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+
+def _item_box(rect: QRectF) -> Box:
+    # A NaN or infinite rect could never fit in the root, however much it grows
+    box = _box(rect)
+    if not all(map(math.isfinite, box)):
+        raise ValueError(f"Trying to index a non-finite rect {box}")
+    return box
+
+
+def _loose(box: Box) -> Box:
+    x0, y0, x1, y1 = box
+    dx = (x1 - x0) * LOOSENESS
+    dy = (y1 - y0) * LOOSENESS
+    return x0 - dx, y0 - dy, x1 + dx, y1 + dy
+
+
+def _contains(outer: Box, inner: Box) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class _Node(Generic[T]):
+    __slots__ = ("box", "loose", "depth", "items", "children")
+
+    def __init__(self, box: Box, depth: int):
+        # Items are routed by their center within box and only have to fit in loose
+        self.box = box
+        self.loose = _loose(box)
+        self.depth = depth
+        self.items: dict[T, Box] = {}
+        self.children: Optional[list['_Node[T]']] = None
+
+    def split(self):
+        x0, y0, x1, y1 = self.box
+        cx = (x0 + x1) / 2
+        cy = (y0 + y1) / 2
+        d = self.depth + 1
+        self.children = [
+            _Node((x0, y0, cx, cy), d),
+            _Node((cx, y0, x1, cy), d),
+            _Node((x0, cy, cx, y1), d),
+            _Node((cx, cy, x1, y1), d),
+        ]
+
+    def child_for(self, box: Box) -> Optional['_Node[T]']:
+        if self.children is None:
+            return None
+        x0, y0, x1, y1 = self.box
+        quadrant = (1 if box[0] + box[2] >= x0 + x1 else 0) + (2 if box[1] + box[3] >= y0 + y1 else 0)
+        child = self.children[quadrant]
+        return child if _contains(child.loose, box) else None
+
+
+class SpatialIndex(Generic[T]):
+    def __init__(self, bounds: QRectF = QRectF(0, 0, 1024, 1024), max_items: int = 8, max_depth: int = 16):
+        self._max_items = max_items
+        self._max_depth = max_depth
+        self._root: _Node[T] = _Node(_box(bounds), 0)
+        self._nodes: dict[T, _Node[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._nodes
+
+    def clear(self):
+        self._root = _Node(self._root.box, 0)
+        self._nodes.clear()
+
+    def insert(self, item: T, rect: QRectF):
+        if item in self._nodes:
+            self.remove(item)
+        box = _item_box(rect)
+        while not _contains(self._root.box, box):
+            self._grow(box)
+        self._insert(self._root, item, box)
+
+    def insert_many(self, items: Sequence[T], x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray):
+        # Partitions the whole batch level by level instead of walking down once per item
+        for item in items:
+            if item in self._nodes:
+                self.remove(item)
+        if not len(items):
+            return
+        if not (np.isfinite(x0).all() and np.isfinite(y0).all() and np.isfinite(x1).all() and np.isfinite(y1).all()):
+            raise ValueError("Trying to index a non-finite rect")
+
+        union = float(x0.min()), float(y0.min()), float(x1.max()), float(y1.max())
+        while not _contains(self._root.box, union):
+            self._grow(union)
+
+        boxes = list(zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist()))
+        self._insert_many(self._root, items, boxes, x0, y0, x1, y1, np.arange(len(items)))
+
+    def remove(self, item: T):
+        node = self._nodes.pop(item, None)
+        if node is not None:
+            del node.items[item]
+
+    def update(self, item: T, rect: QRectF):
+        node = self._nodes.get(item)
+        box = _item_box(rect)
+        if node is not None and _contains(node.loose, box) and node.child_for(box) is None:
+            node.items[item] = box
+            return
+        self.insert(item, rect)
+
+    def bounds(self, item: T) -> Optional[QRectF]:
+        node = self._nodes.get(item)
+        if node is None:
+            return None
+        x0, y0, x1, y1 = node.items[item]
+        return QRectF(QPointF(x0, y0), QPointF(x1, y1))
+
+    def query_point(self, p: QPointF) -> list[T]:
+        return self._query((p.x(), p.y(), p.x(), p.y()))
+
+    def query_rect(self, rect: QRectF, contained: bool = False) -> list[T]:
+        # With contained only items whose rect lies entirely inside are returned
+        return self._query(_box(rect), contained)
+
+    def query_rect_boxes(self, rect: QRectF) -> tuple[list[T], np.ndarray]:
+        # Items intersecting rect with their rects as rows of (x0, y0, x1, y1)
+        boxes: list[Box] = []
+        items = self._query(_box(rect), False, boxes)
+        return items, np.fromiter(itertools.chain.from_iterable(boxes), np.float64, 4 * len(boxes)).reshape(-1, 4)
+
+    def _query(self, box: Box, contained: bool = False, boxes: Optional[list[Box]] = None) -> list[T]:
+        res = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if _contains(box, node.loose):
+                # Everything below lies inside the loose box, so no item needs testing
+                self._collect(node, res, boxes)
+                continue
+
+            for item, item_box in node.items.items():
+                if _contains(box, item_box) if contained else _intersects(item_box, box):
+                    res.append(item)
+                    if boxes is not None:
+                        boxes.append(item_box)
+            if node.children is not None:
+                for child in node.children:
+                    if _intersects(child.loose, box):
+                        stack.append(child)
+        return res
+
+    @staticmethod
+    def _collect(node: _Node[T], res: list[T], boxes: Optional[list[Box]]):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            res.extend(node.items)
+            if boxes is not None:
+                boxes.extend(node.items.values())
+            if node.children is not None:
+                stack.extend(node.children)
+
+    def _insert(self, node: _Node[T], item: T, box: Box):
+        while True:
+            child = node.child_for(box)
+            if child is None:
+                break
+            node = child
+
+        node.items[item] = box
+        self._nodes[item] = node
+
+        if node.children is None and len(node.items) > self._max_items and node.depth < self._max_depth:
+            node.split()
+            for other, other_box in list(node.items.items()):
+                child = node.child_for(other_box)
+                if child is not None:
+                    del node.items[other]
+                    self._insert(child, other, other_box)
+
+    def _insert_many(self, node: _Node[T], items: Sequence[T], boxes: list[Box], x0: np.ndarray, y0: np.ndarray,
+                     x1: np.ndarray, y1: np.ndarray, selected: np.ndarray):
+        if node.children is None:
+            if len(node.items) + len(selected) <= self._max_items or node.depth >= self._max_depth:
+                for i in selected.tolist():
+                    node.items[items[i]] = boxes[i]
+                    self._nodes[items[i]] = node
+                return
+
+            node.split()
+            for other, other_box in list(node.items.items()):
+                child = node.child_for(other_box)
+                if child is not None:
+                    del node.items[other]
+                    self._insert(child, other, other_box)
+
+        # Same choice as child_for: the quadrant of the center, if the item fits in its loose box
+        bx0, by0, bx1, by1 = node.box
+        sx0, sy0, sx1, sy1 = x0[selected], y0[selected], x1[selected], y1[selected]
+        right = sx0 + sx1 >= bx0 + bx1
+        bottom = sy0 + sy1 >= by0 + by1
+        quadrants = right.astype(np.intp) + 2 * bottom.astype(np.intp)
+
+        fits = np.zeros(len(selected), bool)
+        masks = []
+        for q, child in enumerate(node.children):
+            lx0, ly0, lx1, ly1 = child.loose
+            mask = (quadrants == q) & (sx0 >= lx0) & (sy0 >= ly0) & (sx1 <= lx1) & (sy1 <= ly1)
+            fits |= mask
+            masks.append(mask)
+
+        for i in selected[~fits].tolist():
+            node.items[items[i]] = boxes[i]
+            self._nodes[items[i]] = node
+
+        for child, mask in zip(node.children, masks):
+            if mask.any():
+                self._insert_many(child, items, boxes, x0, y0, x1, y1, selected[mask])
+
+    def _grow(self, box: Box):
+        x0, y0, x1, y1 = self._root.box
+        w = x1 - x0
+        h = y1 - y0
+        left = box[0] < x0
+        up = box[1] < y0
+        nx0 = x0 - w if left else x0
+        ny0 = y0 - h if up else y0
+        new_root: _Node[T] = _Node((nx0, ny0, nx0 + 2 * w, ny0 + 2 * h), 0)
+        new_root.split()
+
+        old_root = self._root
+        quadrant = (1 if left else 0) + (2 if up else 0)
+        new_root.children[quadrant] = old_root
+        self._root = new_root
+
+        stack = [old_root]
+        while stack:
+            node = stack.pop()
+            node.depth += 1
+            if node.children is not None:
+                stack.extend(node.children)
@@ -1,4 +1,6 @@
+import random
 from dataclasses import dataclass, field
+import typing
 from typing import TypeVar, Generic, Optional
 
 __all__ = ("Node", "Storage", "Iterator")
@@ -10,31 +12,111 @@ T = TypeVar("T")
 class Node(Generic[T]):
     value: T = field(compare=False)
     priority: int = 0
-    prev: Optional['Node'] = field(compare=False, default=None)
-    next: Optional['Node'] = field(compare=False, default=None)
+    seq: int = field(compare=False, default=0)
+    prev: Optional['Node'] = field(compare=False, default=None, repr=False)
+    next: Optional['Node'] = field(compare=False, default=None, repr=False)
+    storage: Optional['Storage'] = field(compare=False, default=None, repr=False)
 
+    @property
+    def z_key(self) -> tuple[int, int]:
+        # Grows along the storage order: higher priority first, then insertion order
+        return -self.priority, self.seq
 
-class Iterator:
-    def __init__(self, storage: 'Storage', reverse: bool = False):
-        self._storage = storage
+
+class _Priorities:
+    # Skip list of the distinct priorities: insert, delete and neighbour lookup in expected O(log p)
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        # A node is [priority, next on level 0, next on level 1, ...]; the head has no priority
+        self._head: list = [None] * (self.MAX_LEVEL + 1)
+        self._level = 1
+        self._size = 0
+        self._random = random.Random(0)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> typing.Iterator[int]:
+        node = self._head[1]
+        while node is not None:
+            yield node[0]
+            node = node[1]
+
+    def add(self, priority: int):
+        path = self._path(priority)
+        found = path[0][1]
+        if found is not None and found[0] == priority:
+            return
+
+        level = 1
+        while level < self.MAX_LEVEL and self._random.random() < 0.25:
+            level += 1
+        if level > self._level:
+            path.extend([self._head] * (level - self._level))
+            self._level = level
+
+        node = [priority] + [None] * level
+        for i in range(level):
+            node[i + 1] = path[i][i + 1]
+            path[i][i + 1] = node
+        self._size += 1
+
+    def remove(self, priority: int):
+        path = self._path(priority)
+        node = path[0][1]
+        if node is None or node[0] != priority:
+            raise KeyError(priority)
+
+        for i in range(len(node) - 1):
+            path[i][i + 1] = node[i + 1]
+        while self._level > 1 and self._head[self._level] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def lower(self, priority: int) -> Optional[int]:
+        # The largest priority below, or None
+        return self._path(priority)[0][0]
+
+    def higher(self, priority: int) -> Optional[int]:
+        # The smallest priority above, or None
+        node = self._path(priority)[0][1]
+        if node is not None and node[0] == priority:
+            node = node[1]
+        return None if node is None else node[0]
+
+    def _path(self, priority: int) -> list[list]:
+        # On every level, the last node with a smaller priority
+        path = [self._head] * self._level
+        node = self._head
+        for i in range(self._level, 0, -1):
+            next_ = node[i]
+            while next_ is not None and next_[0] < priority:
+                node = next_
+                next_ = node[i]
+            path[i - 1] = node
+        return path
+
+
+class Iterator(Generic[T]):
+    def __init__(self, storage: 'Storage[T]', reverse: bool = False):
         self._reverse = reverse
-        if not self._reverse:
-            self._storage.first()
-        else:
-            self._storage.last()
+        self._node = storage._last if reverse else storage._first
 
     def __iter__(self):
         return self
 
-    def __next__(self):
-        if self._storage.eol():
+    def __next__(self) -> T:
+        node = self._node
+        # Removed nodes keep their links, so skip them to reach a live neighbour
+        while node is not None and node.storage is None:
+            node = node.prev if self._reverse else node.next
+        if node is None:
+            self._node = None
             raise StopIteration
-        res = self._storage.get_current()
-        if not self._reverse:
-            self._storage.next()
-        else:
-            self._storage.prev()
-        return res
+
+        self._node = node.prev if self._reverse else node.next
+        return node.value
 
 
 class Storage(Generic[T]):
@@ -43,6 +125,11 @@ class Storage(Generic[T]):
         self._last: Optional[Node] = None
         self._current: Optional[Node] = None
         self._size = 0
+        self._seq = 0
+
+        # Nodes with equal priority are contiguous, kept as [first, last] per priority
+        self._groups: dict[int, list[Node]] = {}
+        self._priorities = _Priorities()
 
     def __iter__(self):
         return Iterator(self)
@@ -50,6 +137,19 @@ class Storage(Generic[T]):
     def __reversed__(self):
         return Iterator(self, True)
 
+    def __len__(self) -> int:
+        return self._size
+
+    def snapshot(self, reverse: bool = False) -> typing.Iterator[T]:
+        values = list(Iterator(self, reverse))
+        return iter(values)
+
+    def nodes(self) -> typing.Iterator[Node[T]]:
+        node = self._first
+        while node is not None:
+            yield node
+            node = node.next
+
     def first(self) -> None:
         self._current = self._first
 
@@ -74,72 +174,218 @@ class Storage(Generic[T]):
         if self._current is None:
             raise ValueError("Trying to pop current from empty list")
 
-        if self._current.prev:
-            self._current.prev.next = self._current.next
-
-        if self._current.next:
-            self._current.next.prev = self._current.prev
-
-        if self._current is self._first:
-            self._first = self._current.next
+        node = self._current
+        self._current = node.next
+        self._unlink(node)
 
-        if self._current is self._last:
-            self._last = self._current.prev
-
-        v = self._current.value
-
-        self._current = self._current.next
-
-        return v
+        return node.value
 
     def pop_back(self) -> T:
         if self._last is None:
             raise ValueError("Trying to pop back from empty list")
 
-        v = self._last.value
-        p = self._last.prev
-        if p:
-            p.next = None
-
-        self._last = p
+        node = self._last
+        self.remove(node)
 
-        return v
+        return node.value
 
     def pop_front(self) -> T:
         if self._first is None:
             raise ValueError("Trying to pop front from empty list")
 
-        v = self._first.value
-        n = self._first.next
-        if n:
-            n.prev = None
+        node = self._first
+        self.remove(node)
 
-        self._first = n
+        return node.value
 
-        return v
+    def remove(self, node: Node[T]) -> T:
+        if node.storage is not self:
+            raise ValueError("Trying to remove node of another storage")
 
-    def push(self, value: T, priority=0):
-        node = Node(value, priority)
-        if not self._first:
-            self._current = self._first = self._last = node
-            return
+        if node is self._current:
+            self._current = node.next
+        self._unlink(node)
+
+        return node.value
 
-        if priority > self._first.priority:
+    def push(self, value: T, priority=0) -> Node[T]:
+        node = Node(value, priority, self._seq, storage=self)
+        self._seq += 1
+
+        group = self._groups.get(priority)
+        if group is not None:
+            self._link_after(node, group[1])
+            group[1] = node
+        else:
+            lower = self._priorities.lower(priority)
+            if lower is not None:
+                self._link_before(node, self._groups[lower][0])
+            else:
+                self._link_after(node, self._last)
+            self._priorities.add(priority)
+            self._groups[priority] = [node, node]
+
+        self._size += 1
+        if self._current is None and self._size == 1:
+            self._current = node
+
+        return node
+
+    def push_many(self, items: typing.Iterable[tuple[T, int]]) -> list[Node[T]]:
+        # Same order as pushing one by one, but each priority is linked in as one chain
+        nodes = []
+        chains: dict[int, list[Node[T]]] = {}
+        for value, priority in items:
+            node = Node(value, priority, self._seq, storage=self)
+            self._seq += 1
+            nodes.append(node)
+            chain = chains.get(priority)
+            if chain is None:
+                chains[priority] = [node]
+            else:
+                chain.append(node)
+        if not nodes:
+            return nodes
+
+        was_empty = self._size == 0
+        for priority in chains:
+            if priority not in self._groups:
+                self._priorities.add(priority)
+
+        # Lowest priorities first, so the group a new one is linked in front of is already in place
+        for priority in sorted(chains):
+            chain = chains[priority]
+            for a, b in zip(chain, chain[1:]):
+                a.next = b
+                b.prev = a
+
+            group = self._groups.get(priority)
+            if group is not None:
+                self._link_chain_after(chain[0], chain[-1], group[1])
+                group[1] = chain[-1]
+            else:
+                lower = self._priorities.lower(priority)
+                if lower is not None:
+                    self._link_chain_after(chain[0], chain[-1], self._groups[lower][0].prev)
+                else:
+                    self._link_chain_after(chain[0], chain[-1], self._last)
+                self._groups[priority] = [chain[0], chain[-1]]
+
+        self._size += len(nodes)
+        if self._current is None and was_empty:
+            self._current = nodes[0]
+
+        return nodes
+
+    def restore(self, node: Node[T], hint: Optional[Node[T]] = None) -> Node[T]:
+        # Puts a removed node back at its place in the z order, keeping its seq.
+        # hint is a live node known to come before it, e.g. the one restored just before
+        if node.storage is not None:
+            raise ValueError("Trying to restore a linked node")
+
+        key = node.z_key
+        prev = node.prev
+        # Skip old neighbours that are still removed
+        while prev is not None and prev.storage is None:
+            prev = prev.prev
+        if hint is not None and hint.storage is self and hint.z_key < key and \
+                (prev is None or prev.storage is not self or prev.z_key < hint.z_key):
+            prev = hint
+
+        if prev is None or prev.storage is not self or prev.z_key > key:
+            prev = self._find_prev(node)
+        else:
+            # Nodes restored since the removal can sit between the old neighbour and this one
+            while prev.next is not None and prev.next.z_key < key:
+                prev = prev.next
+
+        self._link_after(node, prev)
+        node.storage = self
+
+        group = self._groups.get(node.priority)
+        if group is None:
+            self._priorities.add(node.priority)
+            self._groups[node.priority] = [node, node]
+        elif group[0].seq > node.seq:
+            group[0] = node
+        elif group[1].seq < node.seq:
+            group[1] = node
+
+        self._size += 1
+        if self._current is None and self._size == 1:
+            self._current = node
+
+        return node
+
+    def restore_many(self, nodes: typing.Iterable[Node[T]]) -> list[Node[T]]:
+        # In z order each node is linked right after the previous one or a few steps past it
+        nodes = sorted(nodes, key=lambda n: n.z_key)
+        prev = None
+        for node in nodes:
+            prev = self.restore(node, prev)
+        return nodes
+
+    def _find_prev(self, node: Node[T]) -> Optional[Node[T]]:
+        group = self._groups.get(node.priority)
+        if group is None:
+            higher = self._priorities.higher(node.priority)
+            return self._groups[higher][1] if higher is not None else None
+
+        prev = group[1]
+        while prev is not group[0] and prev.seq > node.seq:
+            prev = prev.prev
+        return prev if prev.seq < node.seq else prev.prev
+
+    def _link_after(self, node: Node[T], prev: Optional[Node[T]]):
+        node.prev = prev
+        if prev is None:
             node.next = self._first
-            self._first.prev = node
             self._first = node
+        else:
+            node.next = prev.next
+            prev.next = node
 
-        elif priority <= self._last.priority:
-            self._last.next = node
-            node.prev = self._last
+        if node.next is None:
             self._last = node
+        else:
+            node.next.prev = node
+
+    def _link_chain_after(self, first: Node[T], last: Node[T], prev: Optional[Node[T]]):
+        first.prev = prev
+        if prev is None:
+            last.next = self._first
+            self._first = first
+        else:
+            last.next = prev.next
+            prev.next = first
 
+        if last.next is None:
+            self._last = last
         else:
-            curr = self._first
-            while curr.priority <= priority:
-                curr = curr.next
-            if curr.prev:
-                curr.prev.next = node
-                node.prev = curr.prev.next
-            node.next = curr.prev
-            curr.prev = node.next
+            last.next.prev = last
+
+    def _link_before(self, node: Node[T], next_: Node[T]):
+        self._link_after(node, next_.prev)
+
+    def _unlink(self, node: Node[T]):
+        group = self._groups[node.priority]
+        if group[0] is node and group[1] is node:
+            del self._groups[node.priority]
+            self._priorities.remove(node.priority)
+        elif group[0] is node:
+            group[0] = node.next
+        elif group[1] is node:
+            group[1] = node.prev
+
+        if node.prev is not None:
+            node.prev.next = node.next
+        else:
+            self._first = node.next
+
+        if node.next is not None:
+            node.next.prev = node.prev
+        else:
+            self._last = node.prev
+
+        node.storage = None
+        self._size -= 1
@@ -0,0 +1,98 @@
+from typing import Optional, Union
+
+from PySide6.QtGui import QColor, QPen, QBrush, Qt
+
+__all__ = ("Style", "StyleRegistry", "styles")
+
+Color = Union[QColor, Qt.GlobalColor]
+
+
+class Style:
+    __slots__ = (
+        "default_border_color", "default_background_color",
+        "selected_border_color", "selected_background_color",
+        "default_pen", "default_brush", "selected_pen", "selected_brush",
+        "key", "refs",
+    )
+
+    def __init__(self, border: QColor, fill: QColor, selected_border: QColor, selected_fill: QColor):
+        self.default_border_color = border
+        self.default_background_color = fill
+        self.selected_border_color = selected_border
+        self.selected_background_color = selected_fill
+
+        self.default_pen = QPen(border)
+        self.default_brush = QBrush(fill)
+        self.selected_pen = QPen(selected_border, 1.25, Qt.DotLine)
+        self.selected_brush = QBrush(selected_fill)
+
+        self.key = (border.rgba(), fill.rgba(), selected_border.rgba(), selected_fill.rgba())
+        self.refs = 0
+
+
+class StyleRegistry:
+    # Ids are reference counted; a style is dropped and its id reused once nothing refers to it
+    def __init__(self):
+        self._styles: list[Optional[Style]] = []
+        self._ids: dict[tuple[int, int, int, int], int] = {}
+        self._free: list[int] = []
+        # The default style keeps one extra reference so it is never dropped
+        self._default = self.acquire()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, i: int) -> Style:
+        return self._styles[i]
+
+    def acquire(self, border: Color = Qt.black, fill: Color = Qt.lightGray,
+                selected_border: Color = Qt.darkBlue, selected_fill: Color = Qt.transparent, n: int = 1) -> int:
+        return self._intern((QColor(border), QColor(fill), QColor(selected_border), QColor(selected_fill)), n)
+
+    def acquire_rgba(self, key: tuple[int, int, int, int], n: int = 1) -> int:
+        return self._intern(tuple(QColor.fromRgba(c) for c in key), n)
+
+    def default(self) -> int:
+        self._styles[self._default].refs += 1
+        return self._default
+
+    def retain(self, i: int, n: int = 1):
+        self._styles[i].refs += n
+
+    def release(self, i: int, n: int = 1):
+        style = self._styles[i]
+        style.refs -= n
+        if style.refs <= 0:
+            del self._ids[style.key]
+            self._styles[i] = None
+            self._free.append(i)
+
+    def derive(self, i: int, border: Optional[Color] = None, fill: Optional[Color] = None,
+               selected_border: Optional[Color] = None, selected_fill: Optional[Color] = None, n: int = 1) -> int:
+        style = self._styles[i]
+        j = self._intern((
+            style.default_border_color if border is None else QColor(border),
+            style.default_background_color if fill is None else QColor(fill),
+            style.selected_border_color if selected_border is None else QColor(selected_border),
+            style.selected_background_color if selected_fill is None else QColor(selected_fill),
+        ), n)
+        self.release(i, n)
+        return j
+
+    def _intern(self, colors: tuple[QColor, QColor, QColor, QColor], n: int) -> int:
+        key = (colors[0].rgba(), colors[1].rgba(), colors[2].rgba(), colors[3].rgba())
+        i = self._ids.get(key)
+        if i is None:
+            style = Style(*colors)
+            if self._free:
+                i = self._free.pop()
+                self._styles[i] = style
+            else:
+                i = len(self._styles)
+                self._styles.append(style)
+            self._ids[key] = i
+        self._styles[i].refs += n
+        return i
+
+
+styles = StyleRegistry()
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from typing import Container, Optional
+
+from PySide6.QtCore import QPoint, QRect, QRectF, QRunnable, QThreadPool
+from PySide6.QtGui import QImage, QPainter, Qt
+
+from .lod import paint_shapes
+from .shape import Shape, STROKE_MARGIN
+from .spatial_index import SpatialIndex
+
+__all__ = ("TileRenderer",)
+
+
+class _TileJob(QRunnable):
+    def __init__(self, image: QImage, rect: QRect, scale: float, shapes: list[Shape]):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.image = image
+        self.rect = rect
+        self.scale = scale
+        self.shapes = shapes
+
+    def run(self):
+        self.image.fill(Qt.white)
+        painter = QPainter(self.image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setClipRect(QRect(0, 0, self.rect.width(), self.rect.height()))
+        painter.translate(-self.rect.x(), -self.rect.y())
+        painter.scale(self.scale, self.scale)
+        paint_shapes(painter, self.shapes, self.scale)
+        painter.end()
+
+
+class TileRenderer:
+    # The grid is laid over the scaled canvas, so panning by whole pixels keeps every tile on screen valid
+    def __init__(self, tile_size: int = 256, threads: Optional[int] = None,
+                 budget: int = 128 * 1024 * 1024, device_pixel_ratio: float = 1.0):
+        self._tile_size = tile_size
+        self._budget = budget
+        self._device_pixel_ratio = device_pixel_ratio
+        self._scale = 1.0
+        # Shapes left out of newly rendered tiles, e.g. a selection drawn on top while it is dragged
+        self.hidden: Optional[Container[Shape]] = None
+        self._tiles: OrderedDict[tuple[int, int], QImage] = OrderedDict()
+        self._pool = QThreadPool()
+        if threads is not None:
+            self._pool.setMaxThreadCount(threads)
+        self._rendered = 0
+        self._reused = 0
+
+    @property
+    def tile_size(self) -> int:
+        return self._tile_size
+
+    @property
+    def threads(self) -> int:
+        return self._pool.maxThreadCount()
+
+    @threads.setter
+    def threads(self, value: int):
+        self._pool.setMaxThreadCount(value)
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, value: int):
+        self._budget = value
+        self._evict(0)
+
+    @property
+    def device_pixel_ratio(self) -> float:
+        return self._device_pixel_ratio
+
+    @device_pixel_ratio.setter
+    def device_pixel_ratio(self, value: float):
+        if value != self._device_pixel_ratio:
+            self._device_pixel_ratio = value
+            self.clear()
+
+    @property
+    def scale(self) -> float:
+        return self._scale
+
+    @scale.setter
+    def scale(self, value: float):
+        if value != self._scale:
+            self._scale = value
+            self.clear()
+
+    def stats(self) -> tuple[int, int]:
+        return self._reused, self._rendered
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def clear(self):
+        self._tiles.clear()
+
+    def _tile_range(self, rect: QRectF) -> tuple[range, range]:
+        s = self._tile_size
+        return (range(int(rect.left() // s), int(rect.right() // s) + 1),
+                range(int(rect.top() // s), int(rect.bottom() // s) + 1))
+
+    def invalidate(self, rect: QRectF):
+        m = STROKE_MARGIN
+        k = self._scale
+        rect = QRectF(rect.x() * k, rect.y() * k, rect.width() * k, rect.height() * k)
+        columns, rows = self._tile_range(rect.adjusted(-m, -m, m, m))
+        if len(columns) * len(rows) > len(self._tiles):
+            for tx, ty in list(self._tiles):
+                if tx in columns and ty in rows:
+                    del self._tiles[tx, ty]
+        else:
+            for ty in rows:
+                for tx in columns:
+                    self._tiles.pop((tx, ty), None)
+
+    def paint(self, painter: QPainter, rect: QRect, index: SpatialIndex[Shape], offset: QPoint = QPoint()) -> int:
+        # rect is in widget coordinates, offset is where the widget origin sits on the scaled canvas
+        s = self._tile_size
+        k = self._scale
+        ratio = self._device_pixel_ratio
+        columns, rows = self._tile_range(QRectF(rect.translated(offset)))
+        tiles = [(tx, ty) for ty in rows for tx in columns]
+
+        jobs = []
+        for key in tiles:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                continue
+
+            tile_rect = QRect(key[0] * s, key[1] * s, s, s)
+            m = STROKE_MARGIN
+            shapes = index.query_rect(QRectF(
+                (tile_rect.x() - m) / k, (tile_rect.y() - m) / k, (s + 2 * m) / k, (s + 2 * m) / k))
+            if self.hidden is not None:
+                shapes = [shape for shape in shapes if shape not in self.hidden]
+            shapes.sort(key=lambda shape: shape.node.z_key)
+            for shape in shapes:
+                # Build the lazy geometry here so workers only ever read it
+                shape.geometry
+
+            image = QImage(int(s * ratio + 0.5), int(s * ratio + 0.5), QImage.Format_ARGB32_Premultiplied)
+            image.setDevicePixelRatio(ratio)
+            jobs.append((key, _TileJob(image, tile_rect, k, shapes)))
+
+        for _, job in jobs:
+            self._pool.start(job)
+        self._pool.waitForDone()
+
+        for key, job in jobs:
+            self._tiles[key] = job.image
+        self._rendered += len(jobs)
+        self._reused += len(tiles) - len(jobs)
+
+        painter.save()
+        painter.setClipRect(rect)
+        for tx, ty in tiles:
+            painter.drawImage(QRect(tx * s, ty * s, s, s).translated(-offset), self._tiles[tx, ty])
+        painter.restore()
+
+        self._evict(len(tiles))
+        return sum(len(job.shapes) for _, job in jobs)
+
+    def _evict(self, keep: int):
+        s = int(self._tile_size * self._device_pixel_ratio + 0.5)
+        # Never drop the tiles of the frame just painted
+        limit = max(self._budget // (s * s * 4), keep)
+        while len(self._tiles) > limit:
+            self._tiles.popitem(last=False)
@@ -0,0 +1,124 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+_app = None
+
+
+def _init_worker():
+    global _app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from PySide6.QtGui import QGuiApplication
+    _app = QGuiApplication.instance() or QGuiApplication([])
+
+
+def _load(path: str):
+    import model
+
+    if path.endswith(".ndjson"):
+        storage = model.Storage()
+        with open(path, encoding="utf-8") as f:
+            for chunk in model.read_ndjson(f):
+                storage.push_many(chunk)
+        return storage
+
+    return model.load_storage(path)
+
+
+def render_file(path: str, output: str, width: int, height: int, margin: int) -> tuple[str, int, float]:
+    from PySide6.QtCore import QRectF
+    from PySide6.QtGui import QImage, QPainter, Qt
+
+    start = time.perf_counter()
+    storage = _load(path)
+
+    bounds = QRectF()
+    for shape in storage:
+        bounds = bounds.united(shape.bounding_rect)
+    bounds.adjust(-margin, -margin, margin, margin)
+
+    image = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.white)
+
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    if bounds.width() > 0 and bounds.height() > 0:
+        scale = min(width / bounds.width(), height / bounds.height())
+        painter.translate((width - bounds.width() * scale) / 2, (height - bounds.height() * scale) / 2)
+        painter.scale(scale, scale)
+        painter.translate(-bounds.left(), -bounds.top())
+
+    for shape in storage:
+        painter.save()
+        shape.paint(painter)
+        painter.restore()
+    painter.end()
+
+    if not image.save(output):
+        raise OSError(f"Could not write {output}")
+
+    return path, len(storage), time.perf_counter() - start
+
+
+def _output_path(path: str, output_dir: Optional[str]) -> str:
+    name = os.path.splitext(os.path.basename(path))[0] + ".png"
+    return os.path.join(output_dir if output_dir else os.path.dirname(path), name)
+
+
+def _size(value: str) -> tuple[int, int]:
+    try:
+        w, h = value.lower().split("x")
+        return int(w), int(h)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got {value!r}")
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Render shape documents to PNG without a display")
+    parser.add_argument("documents", nargs="+", help=".shapes or .ndjson documents")
+    parser.add_argument("-o", "--output-dir", help="directory for the PNGs, next to each document by default")
+    parser.add_argument("-s", "--size", type=_size, default=(1600, 1200), help="output size, e.g. 1920x1080")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--margin", type=int, default=10, help="document units around the drawing")
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    width, height = args.size
+    failures = 0
+    shapes = 0
+    start = time.perf_counter()
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1), mp_context=context, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(render_file, path, _output_path(path, args.output_dir), width, height, args.margin): path
+            for path in args.documents
+        }
+        for future in as_completed(futures):
+            try:
+                path, n, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"{futures[future]}: failed: {e}", file=sys.stderr)
+                continue
+
+            shapes += n
+            print(f"{path}: {n} shapes in {elapsed * 1000:.1f} ms")
+
+    elapsed = time.perf_counter() - start
+    done = len(args.documents) - failures
+    print(f"{done} documents, {shapes} shapes in {elapsed:.2f} s "
+          f"({done / elapsed:.1f} documents/s, {shapes / elapsed:.0f} shapes/s)")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,30 @@
+import os
+import random
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication
+
+
+@pytest.fixture(scope="session", autouse=True)
+def app() -> QApplication:
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def area(app: QApplication):
+    from model.shapes import available_shapes
+    from views import PaintingArea
+
+    # A fresh document of assorted shapes on three z levels, with nothing to undo
+    area = PaintingArea()
+    area.resize(1000, 800)
+    rng = random.Random(0)
+    area.add_shapes((rng.choice(available_shapes)(rng.randint(100, 900), rng.randint(100, 700), rng.randint(10, 60),
+                                                  rng.randint(10, 60), rng.choice([0, 30])), rng.choice([-100, 0, 100]))
+                    for _ in range(40))
+    area.history.clear()
+    yield area
+    area.deleteLater()
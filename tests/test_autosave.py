@@ -0,0 +1,67 @@
+import os
+
+from model import Autosave, RecordTable, Storage, save_document
+from model.shapes import Rectangle
+from views import PaintingArea
+
+
+def document(storage, path) -> bytes:
+    save_document(path, storage)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_recover_after_crash(area: PaintingArea, tmp_path):
+    path = tmp_path / "autosave.shapes"
+    autosave = Autosave(path)
+    area.add_listener(autosave)
+    autosave.document_reset(list(area.storage))
+    assert autosave.save()
+    autosave.wait()
+
+    shapes = list(area.storage)
+    area.transform_shapes(shapes[:5], 7, -3, 2, 0, 15.0)
+    area.remove_nodes([shape.node for shape in shapes[5:8]])
+    area.add_shapes([(Rectangle(300, 300, 20, 20, 0), 4)])
+    assert autosave.pending
+    assert autosave.save()
+    autosave.wait()
+    area.remove_listener(autosave)
+
+    # Nothing closed the autosave, as after a crash
+    assert autosave.error is None and autosave.saves == 2
+    recovered = Autosave.recover(path)
+    assert document(recovered, tmp_path / "a.shapes") == document(area.storage, tmp_path / "b.shapes")
+
+
+def test_nothing_to_save_or_recover(area: PaintingArea, tmp_path):
+    path = tmp_path / "autosave.shapes"
+    autosave = Autosave(path)
+    assert not autosave.save()
+    autosave.document_reset(list(area.storage))
+    autosave.save()
+    autosave.close()
+
+    assert not os.path.exists(path)
+    assert Autosave.recover(path) is None
+    (tmp_path / "autosave.shapes.tmp").write_bytes(b"partial")
+    assert Autosave.recover(path) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_does_not_see_later_edits():
+    shapes = [Rectangle(10 * i, 0, 5, 5, 0) for i in range(10)]
+    storage = Storage()
+    for shape in shapes:
+        shape.node = storage.push(shape)
+
+    table = RecordTable(chunk_rows=4)
+    table.update(shapes)
+    snapshot = table.snapshot()
+    shapes[0].x = 500
+    table.update(shapes[:1])
+    table.remove(shapes[5:])
+
+    records, _ = snapshot.records()
+    assert records["x"].tolist() == [10 * i for i in range(10)]
+    assert table.snapshot().records()[0]["x"].tolist() == [500, 10, 20, 30, 40]
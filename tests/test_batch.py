@@ -0,0 +1,56 @@
+from PySide6.QtCore import QPoint, QPointF, Qt
+from PySide6.QtGui import QColor
+from PySide6.QtTest import QTest
+
+from model.shapes import Rectangle, Triangle
+from views import PaintingArea
+
+
+class Recorder:
+    def __init__(self):
+        self.added = []
+
+    def shapes_added(self, shapes):
+        self.added += shapes
+
+    def shapes_removed(self, shapes):
+        pass
+
+    def shapes_changed(self, shapes):
+        pass
+
+    def document_reset(self, shapes):
+        pass
+
+
+def test_batch_is_one_undo_step(area: PaintingArea):
+    shapes = list(area.storage)
+    with area.batch() as batch:
+        batch.insert(Rectangle(500, 400, 30, 30, 0), 5)
+        batch.delete(shapes[:3])
+        batch.recolor(shapes[3:6], fill=QColor("red"))
+    assert len(area.history) == 1
+    assert len(area.storage) == len(shapes) - 2
+
+    area.undo()
+    assert list(area.storage) == shapes
+
+
+def test_click_insert_is_an_undoable_insert(area: PaintingArea):
+    recorder = Recorder()
+    area.add_listener(recorder)
+    area.current_shape = Triangle
+    area.mode = PaintingArea.Mode.INSERT_ITEM
+    n = len(area.storage)
+
+    QTest.mouseClick(area, Qt.LeftButton, Qt.NoModifier, QPoint(5, 5))
+    shape = recorder.added[-1]
+    assert len(area.storage) == n + 1
+    assert shape.selected and list(area.selection) == [shape]
+    # Pushed back inside the canvas, and indexed where it ended up
+    assert area.shape_at(QPointF(shape.x, shape.y)) is shape
+    assert len(area.history) == 1
+
+    area.undo()
+    assert len(area.storage) == n and shape.node is None
+    area.remove_listener(recorder)
@@ -0,0 +1,171 @@
+import gc
+
+import numpy as np
+import pytest
+from PySide6.QtGui import QColor
+
+from model import ShapeColumns, ShapeView, load_storage, save_document, styles
+from model.shapes import Ellipse, Rectangle, Triangle
+from views import PaintingArea
+
+
+def state(area: PaintingArea) -> list[tuple]:
+    return [(s.name(), s.x, s.y, s.w, s.h, s.a, s.style.key, s.node.priority, s.selected) for s in area.storage]
+
+
+def edit(area: PaintingArea) -> list[tuple]:
+    # Every selection edit once, each its own undo step
+    for shape in list(area.storage)[::3]:
+        shape.selected = True
+    area.line_color = QColor("red")
+    area.fill_color = QColor(10, 20, 30, 40)
+
+    area.move_selected(PaintingArea.Direction.RIGHT)
+    area.resize_selected(PaintingArea.Direction.UP)
+    area.rotate_selected(PaintingArea.Direction.LEFT)
+    area.flush_input()
+    area.change_border_color_selected()
+    area.change_fill_color_selected()
+    area.delete_selected()
+    return state(area)
+
+
+def test_views_behave_like_shapes():
+    columns = ShapeColumns()
+    shapes = [Rectangle(10, 20, 30, 40, 0), Ellipse(100, 100, 20, 10, 30), Triangle(-50, 60, 8, 9, 45)]
+    views = columns.adopt(shapes)
+    for shape, view in zip(shapes, views):
+        assert isinstance(view, ShapeView) and isinstance(view, type(shape))
+        assert (view.x, view.y, view.w, view.h, view.a) == (shape.x, shape.y, shape.w, shape.h, shape.a)
+        assert view.bounding_rect == shape.bounding_rect
+        assert view.inside(shape.bounding_rect.center()) == shape.inside(shape.bounding_rect.center())
+    assert columns.adopt(views) == views
+
+
+def test_column_edits_refresh_cached_geometry():
+    columns = ShapeColumns()
+    view, = columns.adopt([Rectangle(10, 20, 30, 40, 0)])
+    rect = view.bounding_rect
+    revision = view.revision
+
+    columns.transform(columns.rows([view]), 5, 0, 0, 0, 0)
+    assert view.bounding_rect == rect.translated(5, 0)
+    assert view.revision == revision
+    columns.transform(columns.rows([view]), 0, 0, 2, 0, 0)
+    assert view.bounding_rect.width() == rect.width() + 2
+    assert view.revision == revision + 1
+
+
+def test_adopt_rejects_bad_geometry_before_taking_rows():
+    columns = ShapeColumns()
+    for bad in (None, float("inf"), 2 ** 70):
+        with pytest.raises((ValueError, TypeError, OverflowError)):
+            columns.adopt([Rectangle(0, 0, 1, 1, 0), Rectangle(bad, 0, 1, 1, 0)])
+    with pytest.raises(ValueError):
+        columns.adopt([Rectangle(0, 0, 1, 1, float("nan"))])
+    assert len(columns) == 0
+
+
+def test_rows_are_reused_once_views_are_collected():
+    columns = ShapeColumns(capacity=2)
+    views = columns.adopt([Rectangle(i, i, 1, 1, 0) for i in range(5)])
+    assert len(columns) == 5
+    rows = set(columns.rows(views).tolist())
+    del views
+    gc.collect()
+    assert len(columns) == 0
+
+    views = columns.adopt([Ellipse(i, i, 2, 2, 0) for i in range(3)])
+    assert set(columns.rows(views).tolist()) <= rows
+
+
+def test_selection_edits_match_plain_shapes(area: PaintingArea):
+    before = state(area)
+    plain = edit(area)
+    steps = len(area.history)
+    while area.history.can_undo():
+        area.undo()
+    area.clear_selection()
+    assert state(area) == before
+
+    area.columnar = True
+    assert all(isinstance(s, ShapeView) for s in area.storage)
+    assert state(area) == before
+    assert edit(area) == plain
+    assert len(area.history) == steps
+    while area.history.can_undo():
+        area.undo()
+    area.clear_selection()
+    assert state(area) == before
+    while area.history.can_redo():
+        area.redo()
+    assert state(area) == plain
+
+    # Hit-testing goes through the index, which has to follow the column edits
+    for shape in area.storage:
+        assert area.shape_at(shape.bounding_rect.center()) is not None
+
+
+def test_selection_edits_run_on_the_columns(area: PaintingArea):
+    area.columnar = True
+    columns = area.columns
+    selected = list(area.storage)[:5]
+    for shape in selected:
+        shape.selected = True
+    rows = columns.rows(selected)
+    x = columns.x[rows].copy()
+
+    area.move_selected(PaintingArea.Direction.RIGHT)
+    area.flush_input()
+    assert (columns.x[rows] > x).all()
+    assert [s.x for s in selected] == columns.x[rows].tolist()
+
+    area.delete_selected()
+    assert not columns.live[rows].any()
+    area.undo()
+    assert columns.live[rows].all()
+
+
+def test_recolor_keeps_style_references_balanced(area: PaintingArea):
+    area.columnar = True
+    count = len(styles)
+    area.select_all()
+    area.fill_color = QColor(1, 2, 3, 4)
+    area.change_fill_color_selected()
+    assert len(styles) > count
+    area.undo()
+    area.history.clear()
+    assert len(styles) == count
+
+    area.columnar = False
+    gc.collect()
+    assert len(styles) == count
+    assert not any(isinstance(s, ShapeView) for s in area.storage)
+
+
+def test_columnar_insert_links_the_views(area: PaintingArea):
+    area.columnar = True
+    shape = Rectangle(500, 400, 30, 30, 0)
+    command = area.add_shapes([(shape, 5)])
+    view = command.nodes[0].value
+    assert isinstance(view, ShapeView) and view.columns is area.columns
+    assert view.node is command.nodes[0] and shape.node is None
+    assert area.shape_at(view.bounding_rect.center()) is view
+
+    n = len(area.storage)
+    for bad in (None, float("inf"), 2 ** 70):
+        with pytest.raises((ValueError, TypeError, OverflowError)):
+            area.add_shapes([(Rectangle(50, 50, 20, 20, 0), 0), (Rectangle(bad, 0, 1, 1, 0), 0)])
+    assert len(area.storage) == n
+
+
+def test_save_document_takes_views(tmp_path, area: PaintingArea):
+    area.columnar = True
+    path = tmp_path / "doc.shapes"
+    save_document(path, area.storage)
+
+    before = state(area)
+    area.storage = load_storage(path)
+    assert all(isinstance(s, ShapeView) for s in area.storage)
+    assert state(area) == before
+    assert np.array_equal(area.columns.x[area.columns.rows(list(area.storage))], [s.x for s in area.storage])
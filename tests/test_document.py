@@ -0,0 +1,130 @@
+import struct
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QPointF
+from PySide6.QtGui import QColor
+
+from model import DocumentError, DocumentFile, Storage, load_storage, save_document, styles
+from model.document import HEADER, RECORD_DTYPE, write_document
+from model.shapes import available_shapes
+
+
+def state(storage: Storage) -> list[tuple]:
+    return [(type(s), s.x, s.y, s.w, s.h, s.a, s.style.key, s.node.priority, s.selected) for s in storage]
+
+
+def make_storage(n: int = 200) -> Storage:
+    rng = np.random.default_rng(1)
+    storage = Storage()
+    colors = [QColor("red"), QColor("green"), QColor(10, 20, 30, 40)]
+    for i in range(n):
+        kind = available_shapes[int(rng.integers(len(available_shapes)))]
+        shape = kind(int(rng.integers(-500, 500)), int(rng.integers(-500, 500)), int(rng.integers(0, 80)),
+                     int(rng.integers(0, 80)), float(rng.uniform(-360, 360)))
+        if i % 3:
+            shape.default_background_color = colors[i % len(colors)]
+        shape.selected = i % 7 == 0
+        shape.node = storage.push(shape, int(rng.choice([-100, 0, 100])))
+    return storage
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "doc.shapes"
+    storage = make_storage()
+    save_document(path, storage)
+
+    loaded = load_storage(path)
+    assert state(loaded) == state(storage)
+    assert [s.node.seq for s in loaded] == sorted(s.node.seq for s in loaded)
+
+
+def test_round_trip_empty(tmp_path):
+    path = tmp_path / "empty.shapes"
+    save_document(path, Storage())
+    assert len(load_storage(path)) == 0
+
+
+def test_file_reads_single_records(tmp_path):
+    path = tmp_path / "doc.shapes"
+    storage = make_storage(20)
+    save_document(path, storage)
+
+    with DocumentFile(path) as doc:
+        assert len(doc) == 20
+        shapes = [doc.shape(i) for i in range(len(doc))]
+    assert [(type(s), s.x, s.y, s.w, s.h, s.a, s.style.key, s.selected) for s in shapes] == \
+        [t[:7] + t[8:] for t in state(storage)]
+
+
+def test_save_replaces_atomically(tmp_path):
+    path = tmp_path / "doc.shapes"
+    save_document(path, make_storage(10))
+    save_document(path, make_storage(30))
+    assert len(load_storage(path)) == 30
+    assert [p.name for p in tmp_path.iterdir()] == ["doc.shapes"]
+
+
+def records(n: int = 3) -> np.ndarray:
+    r = np.zeros(n, RECORD_DTYPE)
+    r["w"] = r["h"] = 10
+    return r
+
+
+def style_table() -> np.ndarray:
+    style = styles.default()
+    key = styles[style].key
+    styles.release(style)
+    return np.array([key], np.uint32)
+
+
+@pytest.mark.parametrize("field, value", [("kind", len(available_shapes)), ("style", 1), ("a", np.nan)])
+def test_rejects_invalid_records(tmp_path, field: str, value):
+    path = tmp_path / "bad.shapes"
+    bad = records()
+    bad[field][1] = value
+    write_document(path, bad, style_table())
+
+    with pytest.raises(DocumentError):
+        load_storage(path)
+
+
+def test_rejects_bad_headers(tmp_path):
+    path = tmp_path / "bad.shapes"
+    write_document(path, records(), style_table())
+    data = path.read_bytes()
+
+    path.write_bytes(data[:HEADER.size - 1])
+    with pytest.raises(DocumentError):
+        load_storage(path)
+
+    path.write_bytes(b"NOTSHAPE" + data[8:])
+    with pytest.raises(DocumentError):
+        load_storage(path)
+
+    path.write_bytes(data[:8] + struct.pack("<H", 99) + data[10:])
+    with pytest.raises(DocumentError):
+        load_storage(path)
+
+    path.write_bytes(data[:-1])
+    with pytest.raises(DocumentError):
+        load_storage(path)
+
+
+def test_area_takes_a_storage_filled_with_push():
+    from views import PaintingArea
+
+    storage = Storage()
+    shapes = [available_shapes[0](10 + 40 * i, 10, 30, 30, 0) for i in range(3)]
+    for shape in shapes:
+        storage.push(shape)
+
+    area = PaintingArea()
+    area.storage = storage
+    assert area.shape_at(QPointF(50, 10)) is shapes[1]
+    area.select_all()
+    area.delete_selected()
+    assert len(storage) == 0
+    area.undo()
+    assert list(storage) == shapes
+    area.deleteLater()
@@ -0,0 +1,139 @@
+import random
+
+import pytest
+from PySide6.QtGui import QColor
+
+from model import History, TransformCommand
+from model.history import NODE_BYTES, RETAINED_SHAPE_BYTES
+from model.shapes import available_shapes
+from views import PaintingArea
+
+
+def snapshot(area: PaintingArea) -> list[tuple]:
+    return [(type(s), s.x, s.y, s.w, s.h, s.a, s.style.key, s.node.priority) for s in area.storage]
+
+
+def random_edit(area: PaintingArea, rng: random.Random):
+    area.clear_selection()
+    shapes = list(area.storage)
+    area.selection.select(rng.sample(shapes, min(len(shapes), rng.randint(1, 5))))
+    op = rng.randrange(7)
+    if op == 0:
+        area.move_selected(rng.choice(list(PaintingArea.Direction)), rng.random() < 0.5)
+    elif op == 1:
+        area.resize_selected(rng.choice(list(PaintingArea.Direction)))
+    elif op == 2:
+        area.rotate_selected(rng.choice([PaintingArea.Direction.LEFT, PaintingArea.Direction.RIGHT]))
+    elif op == 3:
+        area.fill_color = QColor(rng.choice(["red", "green", "blue"]))
+        area.change_fill_color_selected()
+    elif op == 4:
+        area.change_z_selected(rng.choice([-100, 0, 100]))
+    elif op == 5:
+        area.delete_selected()
+    else:
+        area.add_shapes([(rng.choice(available_shapes)(rng.randint(100, 900), rng.randint(100, 700), 30, 30, 0), 0)])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_undo_and_redo_restore_every_state(area: PaintingArea, seed: int):
+    rng = random.Random(seed)
+    # One state per undo step; an edit that changed nothing adds no step
+    states = [snapshot(area)]
+    for _ in range(60):
+        random_edit(area, rng)
+        if len(area.history) == len(states):
+            states.append(snapshot(area))
+        assert len(area.history) == len(states) - 1
+    area.clear_selection()
+
+    for state in reversed(states[:-1]):
+        area.undo()
+        assert snapshot(area) == state
+    assert not area.history.can_undo()
+
+    for state in states[1:]:
+        area.redo()
+        assert snapshot(area) == state
+    assert not area.history.can_redo()
+
+
+def test_new_edit_drops_redo(area: PaintingArea):
+    shape = next(iter(area.storage))
+    shape.selected = True
+    area.move_selected(PaintingArea.Direction.RIGHT)
+    area.move_selected(PaintingArea.Direction.RIGHT)
+    area.undo()
+    assert area.history.can_redo()
+
+    area.move_selected(PaintingArea.Direction.DOWN)
+    assert not area.history.can_redo()
+    assert len(area.history) == 2
+
+
+def test_merged_steps_undo_together(area: PaintingArea):
+    shape = next(iter(area.storage))
+    x = shape.x
+    shape.selected = True
+    for _ in range(10):
+        area.move_selected(PaintingArea.Direction.RIGHT, merge=True)
+    area.flush_input()
+    for _ in range(5):
+        area.move_selected(PaintingArea.Direction.RIGHT, merge=True)
+    area.flush_input()
+    assert shape.x > x
+
+    assert len(area.history) == 1
+    area.undo()
+    assert shape.x == x
+
+
+def test_budget_evicts_oldest(area: PaintingArea):
+    shapes = list(area.storage)
+    for shape in shapes:
+        area.clear_selection()
+        shape.selected = True
+        area.move_selected(PaintingArea.Direction.RIGHT)
+    full = area.history.used
+    assert len(area.history) == len(shapes)
+
+    area.history.budget = full // 2
+    assert area.history.used <= full // 2
+    assert 0 < len(area.history) < len(shapes)
+    before = [shape.x for shape in shapes]
+    kept = len(area.history)
+    while area.history.can_undo():
+        area.undo()
+    # Only the newest moves are still undoable
+    assert [shape.x for shape in shapes[:-kept]] == before[:-kept]
+    assert [shape.x for shape in shapes[-kept:]] == [x - 1 for x in before[-kept:]]
+
+
+def test_history_without_target_state():
+    history = History()
+    assert not history.can_undo() and not history.can_redo()
+    assert history.undo(None) is None
+    assert history.redo(None) is None
+    assert history.used == 0
+
+
+def test_transforms_merge_only_for_the_same_shapes():
+    shapes = [available_shapes[0](0, 0, 10, 10, 0)]
+    move = TransformCommand(shapes, 1, 0, 0, 0, 0)
+    assert move.merge(TransformCommand(shapes, 2, 0, 0, 0, 0))
+    assert move.merge(TransformCommand(shapes, 0, 0, 1, 0, 5))
+    assert move.delta == (3, 0, 1, 0, 5)
+    assert not move.merge(TransformCommand([available_shapes[0](0, 0, 10, 10, 0)], 1, 0, 0, 0, 0))
+    assert not move.merge(TransformCommand(shapes * 2, 1, 0, 0, 0, 0))
+
+
+def test_change_z_charges_the_unlinked_nodes(area: PaintingArea):
+    shapes = list(area.storage)
+    area.selection.select(shapes[:10])
+    area.change_z_selected(7)
+    used = area.history.used
+    area.clear_selection()
+    area.selection.select(shapes[:20])
+    area.change_z_selected(8)
+    # The shapes stay in the document, so the step costs about a node per shape, well under what retaining them would
+    assert 20 * NODE_BYTES <= area.history.used - used < 20 * RETAINED_SHAPE_BYTES
@@ -0,0 +1,134 @@
+import random
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QPointF
+
+from model import Shape
+from model.shape import HIT_TEST_BATCH
+from model.shapes import Ellipse, Rectangle, Triangle
+
+ANGLES = [0, 90, 180, 270, -90, -270, 45, 360]
+
+
+def expected(shape: Shape, p: QPointF) -> bool:
+    return shape.shape().contains(p) or shape.selected and shape.bounding_rect.contains(p)
+
+
+def random_shape(rng: random.Random, kind: type) -> Shape:
+    w = rng.choice([rng.randint(1, 200), rng.randint(-50, -1), 0, 1, 2])
+    h = rng.choice([rng.randint(1, 200), rng.randint(-50, -1), 0, 1, 2])
+    a = rng.choice(ANGLES + [rng.uniform(-720, 720)])
+    shape = kind(rng.randint(-500, 500), rng.randint(-500, 500), w, h, a)
+    shape.selected = rng.random() < 0.3
+    return shape
+
+
+def random_points(rng: random.Random, shape: Shape, n: int, vertices: bool = True) -> list[QPointF]:
+    # Vertices and integer points land exactly on edges of the polygons
+    path = shape.shape()
+    points = [QPointF(path.elementAt(i).x, path.elementAt(i).y) for i in range(path.elementCount() if vertices else 0)]
+    r = max(abs(shape.w), abs(shape.h)) * 0.8 + 2
+    for _ in range(n):
+        p = QPointF(shape.x + rng.uniform(-r, r), shape.y + rng.uniform(-r, r))
+        points.append(QPointF(round(p.x()), round(p.y())) if rng.random() < 0.5 else p)
+    return points
+
+
+def near_outline(shape: Shape, p: QPointF, eps: float) -> bool:
+    inside = expected(shape, p)
+    offsets = [(d * dx, d * dy) for d in (eps / 10, eps) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    return any(expected(shape, p + QPointF(dx, dy)) != inside for dx, dy in offsets)
+
+
+def bounds_of(shape: Shape) -> list[float]:
+    return [float(v) for v in type(shape).bounds(shape.x, shape.y, shape.w, shape.h, shape.a)]
+
+
+def rect_of(shape: Shape) -> list[float]:
+    r = shape.bounding_rect
+    return [r.left(), r.top(), r.right(), r.bottom()]
+
+
+@pytest.mark.parametrize("kind", [Rectangle, Triangle])
+@pytest.mark.parametrize("seed", range(20))
+def test_polygon_inside_matches_path(kind: type, seed: int):
+    rng = random.Random(seed)
+    for _ in range(50):
+        shape = random_shape(rng, kind)
+        for p in random_points(rng, shape, 20):
+            assert shape.inside(p) == expected(shape, p), (shape.x, shape.y, shape.w, shape.h, shape.a, p)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ellipse_inside_matches_path_off_outline(seed: int):
+    # The path is a Bezier approximation, so points right at the outline may legitimately differ
+    rng = random.Random(seed)
+    for _ in range(50):
+        shape = random_shape(rng, Ellipse)
+        eps = 0.05 + 0.002 * max(abs(shape.w), abs(shape.h))
+        for p in random_points(rng, shape, 20, vertices=False):
+            if not near_outline(shape, p, eps):
+                assert shape.inside(p) == expected(shape, p), (shape.x, shape.y, shape.w, shape.h, shape.a, p)
+
+
+@pytest.mark.parametrize("kind", [Rectangle, Triangle, Ellipse])
+@pytest.mark.parametrize("seed", range(5))
+def test_hit_test_matches_inside(kind: type, seed: int):
+    rng = random.Random(seed)
+    shapes = [random_shape(rng, kind) for _ in range(2 * HIT_TEST_BATCH)]
+    for shape in shapes[:20]:
+        for p in random_points(rng, shape, 10):
+            assert Shape.hit_test(shapes, p).tolist() == [s.inside(p) for s in shapes]
+
+
+@pytest.mark.parametrize("kind", [Rectangle, Triangle])
+@pytest.mark.parametrize("seed", range(5))
+def test_polygon_hit_test_matches_path(kind: type, seed: int):
+    rng = random.Random(seed)
+    shapes = [random_shape(rng, kind) for _ in range(2 * HIT_TEST_BATCH)]
+    for shape in shapes[:20]:
+        for p in random_points(rng, shape, 10):
+            assert Shape.hit_test(shapes, p).tolist() == [expected(s, p) for s in shapes]
+
+
+def test_rotated_rectangle_edge():
+    shape = Rectangle(100, 100, 23, 63, 90)
+    for x in range(60, 141):
+        for y in range(80, 121):
+            p = QPointF(x, y)
+            assert shape.inside(p) == shape.shape().contains(p), (x, y)
+
+
+@pytest.mark.parametrize("kind", [Rectangle, Triangle])
+@pytest.mark.parametrize("seed", range(10))
+def test_polygon_bounds_match_path(kind: type, seed: int):
+    rng = random.Random(seed)
+    for _ in range(200):
+        shape = random_shape(rng, kind)
+        assert bounds_of(shape) == rect_of(shape), (shape.x, shape.y, shape.w, shape.h, shape.a)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ellipse_bounds_match_path(seed: int):
+    rng = random.Random(seed)
+    for _ in range(200):
+        shape = random_shape(rng, Ellipse)
+        tolerance = 1e-3 * max(abs(shape.w), abs(shape.h), 1)
+        assert bounds_of(shape) == pytest.approx(rect_of(shape), abs=tolerance)
+
+
+@pytest.mark.parametrize("kind", [Rectangle, Triangle, Ellipse])
+@pytest.mark.parametrize("w, h", [(0, 0), (0, 250), (250, 0)])
+@pytest.mark.parametrize("a", ANGLES)
+def test_degenerate_sizes(kind: type, w: int, h: int, a: float):
+    shape = kind(100, 100, w, h, a)
+    assert bounds_of(shape) == pytest.approx(rect_of(shape))
+
+    batch = np.array([shape.x]), np.array([shape.y]), np.array([w]), np.array([h]), np.array([float(a)])
+    assert [float(v[0]) for v in kind.bounds(*batch)] == pytest.approx(rect_of(shape))
+
+    shape.selected = True
+    for x in range(-30, 231, 10):
+        p = QPointF(x, x)
+        assert shape.inside(p) == expected(shape, p), p
@@ -0,0 +1,150 @@
+import os
+import random
+
+import pytest
+
+from model import Journal, Storage, save_document
+from model.shapes import Rectangle
+from views import PaintingArea
+
+
+def document(storage: Storage, directory) -> bytes:
+    # Compared as saved documents, which covers kinds, geometry, styles and z order at once
+    path = os.path.join(directory, "compare.shapes")
+    save_document(path, storage)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def edit(area: PaintingArea, rng: random.Random, n: int):
+    for _ in range(n):
+        shapes = list(area.storage)
+        area.transform_shapes(rng.sample(shapes, 3), rng.randint(-3, 3), rng.randint(-3, 3), 1, 0, 5.0)
+    shapes = list(area.storage)
+    area.remove_nodes([shape.node for shape in shapes[:5]])
+
+
+@pytest.fixture
+def journal(area: PaintingArea, tmp_path):
+    journal = Journal(tmp_path / "session.journal")
+    area.add_listener(journal)
+    journal.document_reset(list(area.storage))
+    journal.wait()
+    yield journal
+    area.remove_listener(journal)
+    journal.wait()
+
+
+def log_file(journal: Journal) -> str:
+    return f"{journal.path}.{journal.generation}.log"
+
+
+def test_replay_restores_document(area: PaintingArea, journal: Journal, tmp_path):
+    # Few enough edits that the log stays under half the base and is replayed on top of it
+    edit(area, random.Random(0), 3)
+    journal.commit()
+    journal.wait()
+
+    assert journal.error is None
+    assert os.path.exists(log_file(journal))
+    assert document(Journal.replay(journal.path), tmp_path) == document(area.storage, tmp_path)
+
+
+def test_replay_without_journal(tmp_path):
+    assert Journal.replay(tmp_path / "missing.journal") is None
+
+
+def test_replay_after_torn_write(area: PaintingArea, journal: Journal, tmp_path):
+    edit(area, random.Random(1), 20)
+    journal.commit()
+    journal.wait()
+    expected = document(area.storage, tmp_path)
+    _, records = Journal.replay_table(journal.path)
+
+    # A crash in the middle of the next commit leaves a partial frame at the end
+    area.transform_shapes(list(area.storage)[:4], 50, 50, 0, 0, 0)
+    journal.commit()
+    journal.wait()
+    path = log_file(journal)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 7)
+
+    table, replayed = Journal.replay_table(journal.path)
+    assert replayed == records
+    assert document(Journal.replay(journal.path), tmp_path) == expected
+
+
+def test_replay_stops_at_corrupt_frame(area: PaintingArea, journal: Journal, tmp_path):
+    edit(area, random.Random(2), 5)
+    journal.commit()
+    journal.wait()
+    expected = document(area.storage, tmp_path)
+
+    area.transform_shapes(list(area.storage)[:4], 50, 50, 0, 0, 0)
+    journal.commit()
+    journal.wait()
+    path = log_file(journal)
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    assert document(Journal.replay(journal.path), tmp_path) == expected
+
+
+def test_compaction_folds_logs_into_base(area: PaintingArea, journal: Journal, tmp_path):
+    edit(area, random.Random(3), 30)
+    generation = journal.generation
+    journal.compact()
+    journal.wait()
+
+    assert journal.generation == generation + 1
+    assert not os.path.exists(f"{journal.path}.{generation}.log")
+    assert document(Journal.replay(journal.path), tmp_path) == document(area.storage, tmp_path)
+
+
+def test_commit_compacts_a_log_past_half_the_base(area: PaintingArea, journal: Journal, tmp_path):
+    generation = journal.generation
+    edit(area, random.Random(6), 3)
+    journal.commit()
+    journal.wait()
+    assert journal.generation == generation
+
+    edit(area, random.Random(7), 50)
+    journal.commit()
+    journal.wait()
+    assert journal.generation == generation + 1
+    assert document(Journal.replay(journal.path), tmp_path) == document(area.storage, tmp_path)
+
+
+def test_failed_reset_keeps_previous_document(area: PaintingArea, journal: Journal, tmp_path):
+    edit(area, random.Random(4), 10)
+    journal.commit()
+    journal.wait()
+    expected = document(area.storage, tmp_path)
+
+    # The new base cannot be written, so the logs of the new document must not land on the old one
+    os.mkdir(f"{journal.path}.tmp")
+    area.storage = Storage()
+    area.add_shapes((Rectangle(100 * i, 100, 20, 20, 0), 0) for i in range(1, 4))
+    journal.commit()
+    journal.wait()
+    assert journal.error is not None
+    assert document(Journal.replay(journal.path), tmp_path) == expected
+
+    # The next commit redoes the compaction
+    os.rmdir(f"{journal.path}.tmp")
+    area.transform_shapes(list(area.storage), 1, 1, 0, 0, 0)
+    journal.commit()
+    journal.wait()
+    assert document(Journal.replay(journal.path), tmp_path) == document(area.storage, tmp_path)
+
+
+def test_close_leaves_a_single_base(area: PaintingArea, journal: Journal, tmp_path):
+    edit(area, random.Random(5), 10)
+    journal.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["session.journal"]
+    assert document(Journal.replay(journal.path), tmp_path) == document(area.storage, tmp_path)
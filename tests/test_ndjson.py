@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from model import DocumentError, read_ndjson, write_ndjson
+from model.shapes import Rectangle
+from views import NdjsonImporter, PaintingArea
+
+
+def line(**fields) -> str:
+    record = {"type": Rectangle.name(), "x": 10, "y": 20, "w": 30, "h": 40, "a": 15.0, "z": 2}
+    record.update(fields)
+    return json.dumps(record) + "\n"
+
+
+def test_round_trip():
+    shapes = [Rectangle(i, 2 * i, 10, 20, 5.5 * i) for i in range(5)]
+    f = io.StringIO()
+    assert write_ndjson(f, shapes) == 5
+    f.seek(0)
+    chunks = list(read_ndjson(f, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    loaded = [shape for chunk in chunks for shape, _ in chunk]
+    assert [(s.x, s.y, s.w, s.h, s.a) for s in loaded] == [(s.x, s.y, s.w, s.h, s.a) for s in shapes]
+
+
+@pytest.mark.parametrize("fields", [
+    {"x": None}, {"y": 1.5}, {"w": "30"}, {"h": True}, {"x": 2 ** 31}, {"z": 1e400},
+    {"a": None}, {"a": "15"}, {"a": 1e400}, {"a": float("nan")}, {"type": "Blob"},
+])
+def test_rejects_invalid_fields(fields: dict):
+    # json.dumps writes 1e400 as Infinity, which json.loads reads back as inf
+    with pytest.raises(DocumentError):
+        list(read_ndjson(io.StringIO(line() + line(**fields))))
+
+
+def test_failed_insert_links_nothing():
+    area = PaintingArea()
+    area.add_shapes([(Rectangle(10, 10, 20, 20, 0), 0)])
+    steps = len(area.history)
+
+    # Shapes built by hand skip the NDJSON checks, so geometry has to be checked before anything is linked
+    for bad in (None, float("inf"), 2 ** 70):
+        with pytest.raises((ValueError, TypeError, OverflowError)):
+            area.add_shapes([(Rectangle(50, 50, 20, 20, 0), 0), (Rectangle(bad, 0, 1, 1, 0), 0)])
+    assert len(area.storage) == 1
+    assert len(area.history) == steps
+    assert [shape for shape in area.storage if shape.node is None] == []
+    assert area.shape_at(next(iter(area.storage)).bounding_rect.center()) is not None
+    area.deleteLater()
+
+
+def test_importer_stops_on_a_bad_line(tmp_path):
+    path = tmp_path / "shapes.ndjson"
+    path.write_text(line() * 3 + line(x=None) + line() * 3)
+    area = PaintingArea()
+    importer = NdjsonImporter(area, str(path), chunk_size=2)
+    errors = []
+    importer.failed.connect(errors.append)
+
+    importer.start()
+    for _ in range(20):
+        QCoreApplication.processEvents()
+    assert len(errors) == 1
+    assert importer.count == 2
+    assert len(area.storage) == 2
+
+    area.undo()
+    assert len(area.storage) == 0
+    area.deleteLater()
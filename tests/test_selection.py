@@ -0,0 +1,65 @@
+from model import Selection
+from model.shapes import Ellipse, Rectangle, Triangle
+
+
+def make_shapes(selection: Selection, n: int = 6) -> list:
+    kinds = [Rectangle, Ellipse, Triangle]
+    shapes = [kinds[i % 3](10 * i, 10 * i, 20, 20, 0) for i in range(n)]
+    for shape in shapes:
+        shape.selection = selection
+    return shapes
+
+
+def test_follows_selected_flags():
+    selection = Selection()
+    shapes = make_shapes(selection)
+    assert not selection
+
+    shapes[3].selected = True
+    shapes[1].selected = True
+    assert list(selection) == [shapes[3], shapes[1]]
+    assert shapes[1] in selection and shapes[0] not in selection
+
+    shapes[3].selected = False
+    assert list(selection) == [shapes[1]]
+    assert len(selection) == 1
+
+
+def test_select_and_clear_report_changes():
+    selection = Selection()
+    shapes = make_shapes(selection)
+    shapes[0].selected = True
+
+    assert selection.select(shapes[:3]) == shapes[1:3]
+    assert list(selection) == shapes[:3]
+
+    assert selection.clear() == shapes[:3]
+    assert not selection
+    assert not any(shape.selected for shape in shapes)
+
+
+def test_selected_shapes_join_and_leave_with_the_selection():
+    first = Selection()
+    second = Selection()
+    shape = Rectangle(0, 0, 10, 10, 0)
+    shape.selected = True
+
+    shape.selection = first
+    assert list(first) == [shape]
+
+    shape.selection = second
+    assert not first
+    assert list(second) == [shape]
+
+    shape.selection = None
+    assert not second
+    assert shape.selected
+
+
+def test_iteration_is_a_copy():
+    selection = Selection()
+    shapes = make_shapes(selection)
+    selection.select(shapes)
+    for shape in selection:
+        shape.selected = False
+    assert not selection
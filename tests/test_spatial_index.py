@@ -0,0 +1,114 @@
+import math
+import random
+
+import numpy as np
+import pytest
+from PySide6.QtCore import QRectF, QPointF
+
+from model import SpatialIndex
+
+Box = tuple[float, float, float, float]
+
+
+def random_boxes(rng: random.Random, n: int, extent: float = 2000) -> dict[int, Box]:
+    # Some fall outside the initial bounds, so the tree has to grow
+    boxes = {}
+    for i in range(n):
+        x = rng.uniform(-extent / 2, extent)
+        y = rng.uniform(-extent / 2, extent)
+        boxes[i] = exact((x, y, x + rng.choice([0, rng.uniform(0, 50), rng.uniform(0, 500)]), y + rng.uniform(0, 80)))
+    return boxes
+
+
+def rect(box: Box) -> QRectF:
+    return QRectF(QPointF(box[0], box[1]), QPointF(box[2], box[3]))
+
+
+def exact(box: Box) -> Box:
+    # QRectF keeps a width and height, so the right and bottom the index sees can round differently
+    r = rect(box)
+    return r.left(), r.top(), r.right(), r.bottom()
+
+
+def intersecting(boxes: dict[int, Box], query: Box) -> set[int]:
+    return {i for i, b in boxes.items() if b[0] <= query[2] and query[0] <= b[2] and b[1] <= query[3] and query[1] <= b[3]}
+
+
+def contained(boxes: dict[int, Box], query: Box) -> set[int]:
+    return {i for i, b in boxes.items() if query[0] <= b[0] and query[1] <= b[1] and b[2] <= query[2] and b[3] <= query[3]}
+
+
+def check_queries(index: SpatialIndex, boxes: dict[int, Box], rng: random.Random):
+    assert len(index) == len(boxes)
+    for _ in range(100):
+        x, y = rng.uniform(-1200, 2200), rng.uniform(-1200, 2200)
+        query = (x, y, x + rng.uniform(0, 600), y + rng.uniform(0, 600))
+        assert set(index.query_rect(rect(query))) == intersecting(boxes, query)
+        assert set(index.query_rect(rect(query), contained=True)) == contained(boxes, query)
+        assert set(index.query_point(QPointF(x, y))) == intersecting(boxes, (x, y, x, y))
+
+        items, found = index.query_rect_boxes(rect(query))
+        assert {i: tuple(row) for i, row in zip(items, found.tolist())} == {i: boxes[i] for i in items}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_queries_match_brute_force(seed: int):
+    rng = random.Random(seed)
+    boxes = random_boxes(rng, 1500)
+    index = SpatialIndex(max_items=4)
+    for i, box in boxes.items():
+        index.insert(i, rect(box))
+    check_queries(index, boxes, rng)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_insert_many_matches_insert(seed: int):
+    rng = random.Random(seed)
+    boxes = random_boxes(rng, 1500)
+    index = SpatialIndex(max_items=4)
+    items = list(boxes)
+    x0, y0, x1, y1 = (np.array([boxes[i][k] for i in items]) for k in range(4))
+    index.insert_many(items[:700], x0[:700], y0[:700], x1[:700], y1[:700])
+    index.insert_many(items[700:], x0[700:], y0[700:], x1[700:], y1[700:])
+    check_queries(index, boxes, rng)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_updates_and_removals(seed: int):
+    rng = random.Random(seed)
+    boxes = random_boxes(rng, 800)
+    index = SpatialIndex(max_items=4)
+    for i, box in boxes.items():
+        index.insert(i, rect(box))
+
+    for _ in range(1500):
+        i = rng.choice(list(boxes))
+        if rng.random() < 0.2:
+            index.remove(i)
+            del boxes[i]
+            assert i not in index and index.bounds(i) is None
+            continue
+        x0, y0, x1, y1 = boxes[i]
+        dx, dy = rng.choice([(rng.uniform(-3, 3), rng.uniform(-3, 3)), (rng.uniform(-900, 900), rng.uniform(-900, 900))])
+        boxes[i] = exact((x0 + dx, y0 + dy, x1 + dx, y1 + dy))
+        index.update(i, rect(boxes[i]))
+        assert index.bounds(i) == rect(boxes[i])
+    check_queries(index, boxes, rng)
+
+
+def test_clear_keeps_bounds():
+    index = SpatialIndex(QRectF(0, 0, 100, 100))
+    index.insert("a", QRectF(10, 10, 5, 5))
+    index.clear()
+    assert len(index) == 0
+    assert index.query_rect(QRectF(0, 0, 100, 100)) == []
+
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf])
+def test_rejects_non_finite_rects(value: float):
+    index = SpatialIndex()
+    with pytest.raises(ValueError):
+        index.insert("a", QRectF(value, 0, 10, 10))
+    with pytest.raises(ValueError):
+        index.insert_many(["a"], np.array([0.0]), np.array([value]), np.array([10.0]), np.array([10.0]))
+    assert len(index) == 0
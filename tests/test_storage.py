@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from model import Storage
+
+
+def expected_order(items: list[tuple[int, int]]) -> list[int]:
+    # Higher priorities first, equal ones in insertion order
+    return [value for priority, value in sorted(items, key=lambda item: (-item[0], item[1]))]
+
+
+def test_push_orders_by_priority_then_insertion():
+    storage = Storage()
+    for value, priority in enumerate([0, 5, -3, 5, 0, 10, -3]):
+        storage.push(value, priority)
+
+    assert list(storage) == [5, 1, 3, 0, 4, 2, 6]
+    assert list(reversed(storage)) == [6, 2, 4, 0, 3, 1, 5]
+    assert len(storage) == 7
+
+
+def test_push_many_matches_push():
+    rng = random.Random(0)
+    existing = [(i, rng.randint(-5, 5)) for i in range(20)]
+    items = [(i, rng.randint(-5, 5)) for i in range(20, 220)]
+
+    one_by_one = Storage()
+    batched = Storage()
+    for value, priority in existing:
+        one_by_one.push(value, priority)
+        batched.push(value, priority)
+    for value, priority in items:
+        one_by_one.push(value, priority)
+    nodes = batched.push_many(items)
+
+    assert list(batched) == list(one_by_one) == expected_order([(p, v) for v, p in existing + items])
+    assert [node.value for node in nodes] == [value for value, _ in items]
+
+
+def test_cursor_walks_and_pops():
+    storage = Storage()
+    for value in range(4):
+        storage.push(value)
+
+    storage.first()
+    storage.next()
+    assert storage.get_current() == 1
+    assert storage.pop_current() == 1
+    assert storage.get_current() == 2
+    assert storage.pop_front() == 0
+    assert storage.pop_back() == 3
+    assert list(storage) == [2]
+
+    storage.pop_back()
+    storage.first()
+    assert storage.eol()
+    with pytest.raises(ValueError):
+        storage.get_current()
+    with pytest.raises(ValueError):
+        storage.pop_front()
+
+
+def test_remove_rejects_foreign_nodes():
+    storage = Storage()
+    node = Storage().push(1)
+    with pytest.raises(ValueError):
+        storage.remove(node)
+
+
+def test_iterators_survive_removal():
+    storage = Storage()
+    nodes = [storage.push(value) for value in range(5)]
+    it = iter(storage)
+    assert next(it) == 0
+    storage.remove(nodes[1])
+    storage.remove(nodes[2])
+    assert list(it) == [3, 4]
+
+    snapshot = storage.snapshot()
+    storage.remove(nodes[3])
+    assert list(snapshot) == [0, 3, 4]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_edits_keep_order(seed: int):
+    rng = random.Random(seed)
+    storage = Storage()
+    live: list[tuple[int, int]] = []
+    nodes = {}
+    value = 0
+    for _ in range(500):
+        r = rng.random()
+        if r < 0.4:
+            priority = rng.randint(-8, 8)
+            nodes[value] = storage.push(value, priority)
+            live.append((priority, value))
+            value += 1
+        elif r < 0.55:
+            batch = [(value + i, rng.randint(-8, 8)) for i in range(rng.randint(0, 6))]
+            for node in storage.push_many(batch):
+                nodes[node.value] = node
+            live += [(priority, v) for v, priority in batch]
+            value += len(batch)
+        elif r < 0.8 and live:
+            priority, v = rng.choice(live)
+            storage.remove(nodes[v])
+            live.remove((priority, v))
+        else:
+            removed = [node for node in nodes.values() if node.storage is None]
+            if removed:
+                restored = rng.sample(removed, min(len(removed), rng.randint(1, 4)))
+                storage.restore_many(restored)
+                live += [(node.priority, node.value) for node in restored]
+
+        order = expected_order(live)
+        assert list(storage) == order
+        assert list(reversed(storage)) == order[::-1]
+        assert len(storage) == len(order)
+
+
+def test_restore_rejects_linked_nodes():
+    storage = Storage()
+    node = storage.push(1)
+    with pytest.raises(ValueError):
+        storage.restore(node)
+
+
+def test_nodes_walks_in_order():
+    storage = Storage()
+    for value, priority in enumerate([0, 3, 0]):
+        storage.push(value, priority)
+    assert [(node.value, node.priority) for node in storage.nodes()] == [(1, 3), (0, 0), (2, 0)]
@@ -0,0 +1,22 @@
+from PySide6.QtCore import QPoint, QPointF, QRect
+
+from views import PaintingArea
+from views.painting_area import HUD_RECT
+
+
+def test_pan_repaints_overlays(area: PaintingArea, monkeypatch):
+    area.hud_visible = True
+    area._start_band(QPointF(100, 100), False)
+    area._extend_band(QPointF(300, 250))
+    area._update_band()
+
+    updated = []
+    monkeypatch.setattr(area, "update", lambda *args: updated.append(QRect(args[0])) if args else None)
+    area.pan(30, -20)
+
+    assert HUD_RECT in updated
+    assert HUD_RECT.translated(-30, 20) in updated
+    band = area.map_from_canvas_rect(area._band_polygon().boundingRect()).toAlignedRect()
+    assert any(rect.contains(band) for rect in updated)
+    assert area.view_offset == QPoint(30, -20)
+    area.hud_visible = False
@@ -1,2 +1,5 @@
 from .main_window import *
 from .painting_area import *
+from .ndjson_import import *
+from .icon_cache import *
+from .batch import *
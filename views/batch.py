@@ -0,0 +1,56 @@
+import enum
+from typing import Iterable, Optional, Union
+
+from PySide6.QtGui import QColor, Qt
+
+from model import Shape
+
+__all__ = ("Batch",)
+
+
+class Batch:
+    # Nothing changes until PaintingArea.apply_batch, so an exception inside `with area.batch()` changes nothing
+    class Op(enum.Enum):
+        INSERT = enum.auto()
+        DELETE = enum.auto()
+        RECOLOR = enum.auto()
+        CHANGE_Z = enum.auto()
+
+    def __init__(self):
+        self._ops: list[tuple[Batch.Op, list, dict]] = []
+
+    def __len__(self) -> int:
+        return sum(len(items) for _, items, _ in self._ops)
+
+    @property
+    def ops(self) -> list[tuple[Op, list, dict]]:
+        return self._ops
+
+    def insert(self, shape: Shape, z: int = 0):
+        self._add(self.Op.INSERT, [(shape, z)], {})
+
+    def insert_many(self, shapes: Iterable[tuple[Shape, int]]):
+        self._add(self.Op.INSERT, list(shapes), {})
+
+    def delete(self, shapes: Iterable[Shape]):
+        self._add(self.Op.DELETE, list(shapes), {})
+
+    def recolor(self, shapes: Iterable[Shape], border: Optional[Union[QColor, Qt.GlobalColor]] = None,
+                fill: Optional[Union[QColor, Qt.GlobalColor]] = None):
+        self._add(self.Op.RECOLOR, list(shapes), {"border": border, "fill": fill})
+
+    def change_z(self, shapes: Iterable[Shape], z: int):
+        self._add(self.Op.CHANGE_Z, list(shapes), {"z": z})
+
+    def clear(self):
+        self._ops.clear()
+
+    def _add(self, op: Op, items: list, args: dict):
+        if not items:
+            return
+        if self._ops:
+            last_op, last_items, last_args = self._ops[-1]
+            if last_op is op and last_args == args:
+                last_items.extend(items)
+                return
+        self._ops.append((op, items, args))
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Optional, Sequence, Type, Union
+
+from PySide6.QtCore import QRect, QStandardPaths, QSaveFile, QIODevice
+from PySide6.QtGui import QIcon, QPixmap, QPainter, QColor, Qt
+
+import model
+
+__all__ = ("IconCache", "resource_path")
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "images")
+
+# Bump when the atlas layout or the way icons are drawn changes
+ATLAS_VERSION = 1
+
+Color = Union[QColor, Qt.GlobalColor]
+
+
+def resource_path(name: str) -> str:
+    # Resources are found next to the package, not the working directory
+    return os.path.join(RESOURCES_DIR, name)
+
+
+class IconCache:
+    # The atlas on disk is keyed by the shape classes, their modules and the device pixel ratio
+    def __init__(self, icon_size: int = 50, device_pixel_ratio: float = 1.0, directory: Optional[str] = None):
+        self._icon_size = icon_size
+        self._device_pixel_ratio = device_pixel_ratio
+        if directory is None:
+            directory = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        self._directory = directory
+
+        self._shape_icons: dict[type, QIcon] = {}
+        self._pixmaps: dict[str, QPixmap] = {}
+        self._color_icons: dict[int, QIcon] = {}
+        self._tool_button_icons: dict[tuple[str, int], QIcon] = {}
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def icon_size(self) -> int:
+        return self._icon_size
+
+    def shape_icon(self, shape: Type[model.Shape]) -> QIcon:
+        icon = self._shape_icons.get(shape)
+        if icon is None:
+            self.load_shapes([shape])
+            icon = self._shape_icons[shape]
+        return icon
+
+    def load_shapes(self, shapes: Sequence[Type[model.Shape]]):
+        shapes = [s for s in shapes if s not in self._shape_icons]
+        if not shapes:
+            return
+
+        side = round(self._icon_size * self._device_pixel_ratio)
+        path = os.path.join(self._directory, f"icons-{self._key(shapes, side)}.png")
+
+        atlas = QPixmap(path)
+        if atlas.width() != side * len(shapes) or atlas.height() != side:
+            atlas = self._render_atlas(shapes, side)
+            self._save(atlas, path)
+
+        for i, shape in enumerate(shapes):
+            pixmap = atlas.copy(QRect(i * side, 0, side, side))
+            pixmap.setDevicePixelRatio(self._device_pixel_ratio)
+            self._shape_icons[shape] = QIcon(pixmap)
+
+    def pixmap(self, path: str) -> QPixmap:
+        pixmap = self._pixmaps.get(path)
+        if pixmap is None:
+            pixmap = self._pixmaps[path] = QPixmap(path)
+        return pixmap
+
+    def icon(self, path: str) -> QIcon:
+        return QIcon(self.pixmap(path))
+
+    def color_icon(self, color: Color) -> QIcon:
+        rgba = QColor(color).rgba()
+        icon = self._color_icons.get(rgba)
+        if icon is None:
+            pixmap = QPixmap(20, 20)
+            pixmap.fill(color)
+            icon = self._color_icons[rgba] = QIcon(pixmap)
+        return icon
+
+    def color_tool_button_icon(self, path: str, color: Color) -> QIcon:
+        key = path, QColor(color).rgba()
+        icon = self._tool_button_icons.get(key)
+        if icon is None:
+            pixmap = QPixmap(50, 80)
+            pixmap.fill(Qt.transparent)
+
+            painter = QPainter(pixmap)
+            source = QRect(0, 0, 42, 43)
+            target = QRect(0, 4, 42, 43)
+
+            painter.fillRect(QRect(0, 60, 50, 80), color)
+            painter.drawPixmap(target, self.pixmap(path), source)
+            painter.end()
+
+            icon = self._tool_button_icons[key] = QIcon(pixmap)
+        return icon
+
+    def clear(self):
+        self._shape_icons.clear()
+        self._pixmaps.clear()
+        self._color_icons.clear()
+        self._tool_button_icons.clear()
+
+    def _key(self, shapes: Sequence[Type[model.Shape]], side: int) -> str:
+        # Editing a shape module changes its mtime, which is enough to redraw the atlas
+        parts: list[object] = [ATLAS_VERSION, side]
+        for shape in shapes:
+            module = sys.modules.get(shape.__module__)
+            source = getattr(module, "__file__", None)
+            try:
+                mtime = os.stat(source).st_mtime_ns if source else 0
+            except OSError:
+                mtime = 0
+            parts.append((shape.__module__, shape.__qualname__, mtime))
+        return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _render_atlas(shapes: Sequence[Type[model.Shape]], side: int) -> QPixmap:
+        atlas = QPixmap(side * len(shapes), side)
+        atlas.fill(Qt.transparent)
+
+        painter = QPainter(atlas)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for i, shape in enumerate(shapes):
+            painter.drawPixmap(QRect(i * side, 0, side, side), shape.image())
+        painter.end()
+
+        return atlas
+
+    @staticmethod
+    def _save(atlas: QPixmap, path: str):
+        # A failed write only costs the next start a redraw
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        except OSError:
+            return
+
+        file = QSaveFile(path)
+        if file.open(QIODevice.WriteOnly) and atlas.save(file, "PNG"):
+            file.commit()
+        else:
+            file.cancelWriting()
@@ -1,13 +1,15 @@
 import functools
-from typing import Type, Callable, Union
+from typing import Type, Callable, Union, Optional
 
-from PySide6.QtCore import Slot, QSize, QRect
-from PySide6.QtGui import QIcon, Qt, QAction, QKeySequence, QColor, QPixmap, QPainter, QKeyEvent
+from PySide6.QtCore import Slot, QSize, Signal, QEvent, QTimer
+from PySide6.QtGui import Qt, QAction, QKeySequence, QColor, QKeyEvent
 from PySide6.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QButtonGroup, QAbstractButton, QToolButton, \
-    QGridLayout, QLabel, QToolBox, QSizePolicy, QMenu
+    QGridLayout, QLabel, QToolBox, QSizePolicy, QMenu, QFileDialog, QMessageBox
 
 import model
 from model import shapes
+from .icon_cache import IconCache, resource_path
+from .ndjson_import import NdjsonImporter
 from .painting_area import PaintingArea
 
 __all__ = ("MainWindow",)
@@ -23,21 +25,31 @@ COLORS = {
 
 Color = Union[QColor, Qt.GlobalColor]
 
-DELETE_PATH = "resources/images/delete.png"
-EDIT_PATH = "resources/images/pointer.png"
-FLOODFILL_PATH = "resources/images/floodfill.png"
-LINECOLOR_PATH = "resources/images/linecolor.png"
-BRING_TO_FRONT_PATH = "resources/images/bringtofront.png"
-SEND_TO_BACK_PATH = "resources/images/sendtoback.png"
+DELETE_PATH = resource_path("delete.png")
+EDIT_PATH = resource_path("pointer.png")
+FLOODFILL_PATH = resource_path("floodfill.png")
+LINECOLOR_PATH = resource_path("linecolor.png")
+BRING_TO_FRONT_PATH = resource_path("bringtofront.png")
+SEND_TO_BACK_PATH = resource_path("sendtoback.png")
+
+DOCUMENT_FILTER = "Shape documents (*.shapes)"
+NDJSON_FILTER = "NDJSON shapes (*.ndjson)"
+TRACE_FILTER = "Chrome trace (*.json)"
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    first_painted = Signal()
+
+    def __init__(self, icons: Optional[IconCache] = None):
         super().__init__()
+        self._importer: Optional[NdjsonImporter] = None
+        self._icons = icons if icons is not None else IconCache(device_pixel_ratio=self.devicePixelRatioF())
+        self._painted = False
 
         self._create_tool_box()
         self._create_actions()
         self._create_toolbars()
+        self._create_menus()
 
         self._area = PaintingArea()
         self._area.line_color = self._line_color
@@ -55,6 +67,71 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(widget)
         self.setWindowTitle("OOP LAB 6")
 
+    @property
+    def icons(self) -> IconCache:
+        return self._icons
+
+    @property
+    def area(self) -> PaintingArea:
+        return self._area
+
+    def event(self, event: QEvent) -> bool:
+        result = super().event(event)
+        if event.type() == QEvent.Paint and not self._painted:
+            # Children are painted after the window itself, so signal once the whole frame is done
+            self._painted = True
+            QTimer.singleShot(0, self.first_painted.emit)
+        return result
+
+    def _open_document(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open", "", DOCUMENT_FILTER)
+        if not path:
+            return
+
+        if self._importer is not None:
+            self._importer.cancel()
+        try:
+            self._area.storage = model.load_storage(path)
+        except (OSError, model.DocumentError) as e:
+            QMessageBox.warning(self, "Open", f"Could not open {path}: {e}")
+
+    def _save_document(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save", "", DOCUMENT_FILTER)
+        if not path:
+            return
+
+        self._area.flush_input()
+        try:
+            model.save_document(path, self._area.storage)
+        except OSError as e:
+            QMessageBox.warning(self, "Save", f"Could not save {path}: {e}")
+
+    def _import_ndjson(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import", "", NDJSON_FILTER)
+        if not path:
+            return
+
+        if self._importer is not None:
+            self._importer.cancel()
+
+        self._importer = NdjsonImporter(self._area, path, parent=self)
+        self._importer.progress.connect(lambda n: self.statusBar().showMessage(f"Imported {n} shapes..."))
+        self._importer.finished.connect(lambda n: self.statusBar().showMessage(f"Imported {n} shapes", 5000))
+        self._importer.failed.connect(lambda e: QMessageBox.warning(self, "Import", f"Could not import {path}: {e}"))
+        self._importer.start()
+
+    def _export_ndjson(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export", "", NDJSON_FILTER)
+        if not path:
+            return
+
+        self._area.flush_input()
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                model.write_ndjson(f, self._area.storage)
+        except OSError as e:
+            QMessageBox.warning(self, "Export", f"Could not export {path}: {e}")
+
     def _delete_item(self):
         self._area.delete_selected()
 
@@ -64,6 +141,60 @@ class MainWindow(QMainWindow):
     def _send_to_back(self):
         self._area.change_z_selected(-100)
 
+    def _undo(self):
+        self._area.undo()
+
+    def _redo(self):
+        self._area.redo()
+
+    def _select_all(self):
+        self._area.select_all()
+
+    def _clear_selection(self):
+        self._area.clear_selection()
+
+    def _set_lasso_selection(self, enabled: bool):
+        self._area.band_shape = PaintingArea.BandShape.LASSO if enabled else PaintingArea.BandShape.RECTANGLE
+
+    def _set_enclosed_selection(self, enabled: bool):
+        self._area.selection_mode = PaintingArea.SelectionMode.CONTAIN if enabled \
+            else PaintingArea.SelectionMode.INTERSECT
+
+    def _zoom_in(self):
+        self._area.zoom_in()
+
+    def _zoom_out(self):
+        self._area.zoom_out()
+
+    def _reset_zoom(self):
+        self._area.reset_zoom()
+
+    def _zoom_to_fit(self):
+        self._area.zoom_to_fit()
+
+    def _set_tiled_rendering(self, enabled: bool):
+        self._area.tiled_rendering = enabled
+
+    def _set_columnar(self, enabled: bool):
+        self._area.columnar = enabled
+
+    def _set_profiling(self, enabled: bool):
+        if enabled:
+            model.profiler.reset()
+        model.profiler.enabled = enabled
+        self._area.hud_visible = enabled
+        self._export_trace_action.setEnabled(enabled)
+
+    def _export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export trace", "", TRACE_FILTER)
+        if not path:
+            return
+
+        try:
+            model.profiler.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Export trace", f"Could not write {path}: {e}")
+
     def _set_edit_mode(self):
         self._area.mode = PaintingArea.Mode.EDIT_ITEM
         self._edit_action.setChecked(True)
@@ -83,16 +214,12 @@ class MainWindow(QMainWindow):
 
     def _item_color_changed(self, color: Color):
         self._fill_color = color
-        self._fill_color_tool_button.setIcon(
-            self._create_color_tool_button_icon(FLOODFILL_PATH, self._fill_color)
-        )
+        self._fill_color_tool_button.setIcon(self._icons.color_tool_button_icon(FLOODFILL_PATH, self._fill_color))
         self._area.fill_color = color
 
     def _line_color_changed(self, color: Color):
         self._line_color = color
-        self._line_color_tool_button.setIcon(
-            self._create_color_tool_button_icon(LINECOLOR_PATH, self._line_color)
-        )
+        self._line_color_tool_button.setIcon(self._icons.color_tool_button_icon(LINECOLOR_PATH, self._line_color))
         self._area.line_color = color
 
     @Slot(QAbstractButton)
@@ -108,34 +235,36 @@ class MainWindow(QMainWindow):
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
         ctrl = bool(event.modifiers() & Qt.ControlModifier)
+        # Held arrow keys fold into one history entry
+        repeat = event.isAutoRepeat()
         if event.modifiers() & Qt.ShiftModifier:
             match event.key():
                 case Qt.Key_Up:
-                    self._area.resize_selected(PaintingArea.Direction.UP, ctrl)
+                    self._area.resize_selected(PaintingArea.Direction.UP, ctrl, repeat)
                 case Qt.Key_Down:
-                    self._area.resize_selected(PaintingArea.Direction.DOWN, ctrl)
+                    self._area.resize_selected(PaintingArea.Direction.DOWN, ctrl, repeat)
                 case Qt.Key_Left:
-                    self._area.resize_selected(PaintingArea.Direction.LEFT, ctrl)
+                    self._area.resize_selected(PaintingArea.Direction.LEFT, ctrl, repeat)
                 case Qt.Key_Right:
-                    self._area.resize_selected(PaintingArea.Direction.RIGHT, ctrl)
+                    self._area.resize_selected(PaintingArea.Direction.RIGHT, ctrl, repeat)
 
         elif event.modifiers() & Qt.AltModifier:
             match event.key():
                 case Qt.Key_Left:
-                    self._area.rotate_selected(PaintingArea.Direction.LEFT, ctrl)
+                    self._area.rotate_selected(PaintingArea.Direction.LEFT, ctrl, repeat)
                 case Qt.Key_Right:
-                    self._area.rotate_selected(PaintingArea.Direction.RIGHT, ctrl)
+                    self._area.rotate_selected(PaintingArea.Direction.RIGHT, ctrl, repeat)
 
         else:
             match event.key():
                 case Qt.Key_Up:
-                    self._area.move_selected(PaintingArea.Direction.UP, ctrl)
+                    self._area.move_selected(PaintingArea.Direction.UP, ctrl, repeat)
                 case Qt.Key_Down:
-                    self._area.move_selected(PaintingArea.Direction.DOWN, ctrl)
+                    self._area.move_selected(PaintingArea.Direction.DOWN, ctrl, repeat)
                 case Qt.Key_Left:
-                    self._area.move_selected(PaintingArea.Direction.LEFT, ctrl)
+                    self._area.move_selected(PaintingArea.Direction.LEFT, ctrl, repeat)
                 case Qt.Key_Right:
-                    self._area.move_selected(PaintingArea.Direction.RIGHT, ctrl)
+                    self._area.move_selected(PaintingArea.Direction.RIGHT, ctrl, repeat)
 
         super().keyPressEvent(event)
 
@@ -146,39 +275,157 @@ class MainWindow(QMainWindow):
         self._shapes_id: dict[int, Type[model.Shape]] = {}
         self._last_btn_id = -1
 
-        layout = QGridLayout()
-        i = 0
-        for s in shapes.available_shapes:
-            layout.addWidget(self._create_cell_widget(s), i // 2, i % 2)
-            i += 1
-
-        widget = QWidget()
-        widget.setLayout(layout)
-
+        # Pages are filled in when they are first shown
+        self._toolbox_pages: dict[QWidget, Callable[[QGridLayout], None]] = {}
         self._toolbox = QToolBox()
         self._toolbox.setSizePolicy(QSizePolicy(QSizePolicy.Maximum, QSizePolicy.Ignored))
-        self._toolbox.addItem(widget, "Shapes")
+        self._toolbox.currentChanged.connect(self._fill_tool_box_page)
+        self._add_tool_box_page("Shapes", functools.partial(self._fill_shapes_page, shapes.available_shapes))
+
+    def _add_tool_box_page(self, title: str, fill: Callable[[QGridLayout], None]):
+        widget = QWidget()
+        widget.setLayout(QGridLayout())
+        self._toolbox_pages[widget] = fill
+        self._toolbox.addItem(widget, title)
+        if self._toolbox.currentWidget() is widget:
+            self._fill_tool_box_page(self._toolbox.currentIndex())
+
+    def _fill_tool_box_page(self, index: int):
+        widget = self._toolbox.widget(index)
+        fill = self._toolbox_pages.pop(widget, None)
+        if fill is not None:
+            fill(widget.layout())
+
+    def _fill_shapes_page(self, page_shapes: list[Type[model.Shape]], layout: QGridLayout):
+        self._icons.load_shapes(page_shapes)
+        for i, s in enumerate(page_shapes):
+            layout.addWidget(self._create_cell_widget(s), i // 2, i % 2)
 
     def _create_actions(self):
-        self._delete_action = QAction(QIcon(DELETE_PATH), "Delete", self)
+        self._delete_action = QAction(self._icons.icon(DELETE_PATH), "Delete", self)
         self._delete_action.setShortcut("Delete")
         self._delete_action.triggered.connect(self._delete_item)
 
-        self._edit_action = QAction(QIcon(EDIT_PATH), "Edit", self)
+        self._edit_action = QAction(self._icons.icon(EDIT_PATH), "Edit", self)
         self._edit_action.triggered.connect(self._set_edit_mode)
         self._edit_action.setCheckable(True)
 
-        self._bring_to_front_action = QAction(QIcon(BRING_TO_FRONT_PATH), "Bring to front", self)
+        self._bring_to_front_action = QAction(self._icons.icon(BRING_TO_FRONT_PATH), "Bring to front", self)
         self._bring_to_front_action.setShortcut("F")
         self._bring_to_front_action.triggered.connect(self._bring_to_front)
 
-        self._send_to_back_action = QAction(QIcon(SEND_TO_BACK_PATH), "Send to back", self)
+        self._send_to_back_action = QAction(self._icons.icon(SEND_TO_BACK_PATH), "Send to back", self)
         self._send_to_back_action.setShortcut("B")
         self._send_to_back_action.triggered.connect(self._send_to_back)
 
+        self._undo_action = QAction("Undo", self)
+        self._undo_action.setShortcut(QKeySequence.Undo)
+        self._undo_action.triggered.connect(self._undo)
+
+        self._redo_action = QAction("Redo", self)
+        self._redo_action.setShortcut(QKeySequence.Redo)
+        self._redo_action.triggered.connect(self._redo)
+
+        self._select_all_action = QAction("Select all", self)
+        self._select_all_action.setShortcut(QKeySequence.SelectAll)
+        self._select_all_action.triggered.connect(self._select_all)
+        self.addAction(self._select_all_action)
+
+        self._clear_selection_action = QAction("Clear selection", self)
+        self._clear_selection_action.setShortcut("Escape")
+        self._clear_selection_action.triggered.connect(self._clear_selection)
+        self.addAction(self._clear_selection_action)
+
+        self._lasso_selection_action = QAction("Lasso selection", self)
+        self._lasso_selection_action.setCheckable(True)
+        self._lasso_selection_action.toggled.connect(self._set_lasso_selection)
+
+        self._enclosed_selection_action = QAction("Select enclosed shapes only", self)
+        self._enclosed_selection_action.setCheckable(True)
+        self._enclosed_selection_action.toggled.connect(self._set_enclosed_selection)
+
+        self._open_action = QAction("Open...", self)
+        self._open_action.setShortcut(QKeySequence.Open)
+        self._open_action.triggered.connect(self._open_document)
+
+        self._save_action = QAction("Save...", self)
+        self._save_action.setShortcut(QKeySequence.Save)
+        self._save_action.triggered.connect(self._save_document)
+
+        self._import_action = QAction("Import NDJSON...", self)
+        self._import_action.triggered.connect(self._import_ndjson)
+
+        self._export_action = QAction("Export NDJSON...", self)
+        self._export_action.triggered.connect(self._export_ndjson)
+
+        self._zoom_in_action = QAction("Zoom in", self)
+        self._zoom_in_action.setShortcut(QKeySequence.ZoomIn)
+        self._zoom_in_action.triggered.connect(self._zoom_in)
+
+        self._zoom_out_action = QAction("Zoom out", self)
+        self._zoom_out_action.setShortcut(QKeySequence.ZoomOut)
+        self._zoom_out_action.triggered.connect(self._zoom_out)
+
+        self._reset_zoom_action = QAction("Actual size", self)
+        self._reset_zoom_action.setShortcut("Ctrl+0")
+        self._reset_zoom_action.triggered.connect(self._reset_zoom)
+
+        self._zoom_to_fit_action = QAction("Fit drawing", self)
+        self._zoom_to_fit_action.setShortcut("Ctrl+9")
+        self._zoom_to_fit_action.triggered.connect(self._zoom_to_fit)
+
+        self._tiled_rendering_action = QAction("Tiled rendering", self)
+        self._tiled_rendering_action.setCheckable(True)
+        self._tiled_rendering_action.toggled.connect(self._set_tiled_rendering)
+
+        self._columnar_action = QAction("Column store", self)
+        self._columnar_action.setCheckable(True)
+        self._columnar_action.toggled.connect(self._set_columnar)
+
+        self._profiling_action = QAction("Profiler", self)
+        self._profiling_action.setShortcut("F12")
+        self._profiling_action.setCheckable(True)
+        self._profiling_action.toggled.connect(self._set_profiling)
+
+        self._export_trace_action = QAction("Export trace...", self)
+        self._export_trace_action.setEnabled(False)
+        self._export_trace_action.triggered.connect(self._export_trace)
+
         self._exit_action = QAction("Exit", self)
         self._exit_action.setShortcut(QKeySequence.Quit)
-        self._exit_action.triggered.connect(QWidget.close)
+        self._exit_action.triggered.connect(self.close)
+
+    def _create_menus(self):
+        self._file_menu = self.menuBar().addMenu("File")
+        self._file_menu.addAction(self._open_action)
+        self._file_menu.addAction(self._save_action)
+        self._file_menu.addSeparator()
+        self._file_menu.addAction(self._import_action)
+        self._file_menu.addAction(self._export_action)
+        self._file_menu.addSeparator()
+        self._file_menu.addAction(self._exit_action)
+
+        self._edit_menu = self.menuBar().addMenu("Edit")
+        self._edit_menu.addAction(self._undo_action)
+        self._edit_menu.addAction(self._redo_action)
+        self._edit_menu.addSeparator()
+        self._edit_menu.addAction(self._select_all_action)
+        self._edit_menu.addAction(self._clear_selection_action)
+        self._edit_menu.addSeparator()
+        self._edit_menu.addAction(self._lasso_selection_action)
+        self._edit_menu.addAction(self._enclosed_selection_action)
+
+        self._view_menu = self.menuBar().addMenu("View")
+        self._view_menu.addAction(self._zoom_in_action)
+        self._view_menu.addAction(self._zoom_out_action)
+        self._view_menu.addAction(self._reset_zoom_action)
+        self._view_menu.addAction(self._zoom_to_fit_action)
+        self._view_menu.addSeparator()
+        self._view_menu.addAction(self._tiled_rendering_action)
+        self._view_menu.addAction(self._columnar_action)
+        self._view_menu.addSeparator()
+        self._view_menu.addAction(self._profiling_action)
+        self._view_menu.addAction(self._export_trace_action)
 
     def _create_toolbars(self):
         self._edit_toolbar = self.addToolBar("Edit")
@@ -191,9 +438,7 @@ class MainWindow(QMainWindow):
         self._fill_color_tool_button = QToolButton()
         self._fill_color_tool_button.setPopupMode(QToolButton.MenuButtonPopup)
         self._fill_color_tool_button.setMenu(self._create_color_menu(self._item_color_changed, self._fill_color))
-        self._fill_color_tool_button.setIcon(
-            self._create_color_tool_button_icon(FLOODFILL_PATH, self._fill_color)
-        )
+        self._fill_color_tool_button.setIcon(self._icons.color_tool_button_icon(FLOODFILL_PATH, self._fill_color))
 
         self._fill_color_tool_button.clicked.connect(self._fill_button_clicked)
 
@@ -201,9 +446,7 @@ class MainWindow(QMainWindow):
         self._line_color_tool_button = QToolButton()
         self._line_color_tool_button.setPopupMode(QToolButton.MenuButtonPopup)
         self._line_color_tool_button.setMenu(self._create_color_menu(self._line_color_changed, self._line_color))
-        self._line_color_tool_button.setIcon(
-            self._create_color_tool_button_icon(LINECOLOR_PATH, self._line_color)
-        )
+        self._line_color_tool_button.setIcon(self._icons.color_tool_button_icon(LINECOLOR_PATH, self._line_color))
 
         self._line_color_tool_button.clicked.connect(self._line_button_clicked)
 
@@ -212,7 +455,7 @@ class MainWindow(QMainWindow):
         self._color_toolbar.addWidget(self._line_color_tool_button)
 
     def _create_cell_widget(self, shape: Type[model.Shape]) -> QWidget:
-        icon = QIcon(shape.image())
+        icon = self._icons.shape_icon(shape)
 
         button = QToolButton()
         button.setIcon(icon)
@@ -232,39 +475,20 @@ class MainWindow(QMainWindow):
         return widget
 
     def _create_color_menu(self, func: Callable[[Color], None], default_color: Color) -> QMenu:
+        # Entries and their icons are only made the first time the menu opens
         color_menu = QMenu(self)
+        color_menu.aboutToShow.connect(functools.partial(self._fill_color_menu, color_menu, func, default_color))
+        return color_menu
+
+    def _fill_color_menu(self, color_menu: QMenu, func: Callable[[Color], None], default_color: Color):
+        if not color_menu.isEmpty():
+            return
 
         for name, color in COLORS.items():
             action = QAction(name, color_menu)
-            action.setIcon(self._create_color_icon(color))
+            action.setIcon(self._icons.color_icon(color))
             action.triggered.connect(functools.partial(func, color))
 
             color_menu.addAction(action)
             if color == default_color:
                 color_menu.setDefaultAction(action)
-
-        return color_menu
-
-    @staticmethod
-    def _create_color_tool_button_icon(image_file: str, color: Color) -> QIcon:
-        pixmap = QPixmap(50, 80)
-        pixmap.fill(Qt.transparent)
-
-        painter = QPainter(pixmap)
-        image = QPixmap(image_file)
-
-        source = QRect(0, 0, 42, 43)
-        target = QRect(0, 4, 42, 43)
-
-        painter.fillRect(QRect(0, 60, 50, 80), color)
-        painter.drawPixmap(target, image, source)
-        painter.end()
-
-        return QIcon(pixmap)
-
-    @staticmethod
-    def _create_color_icon(color: Color) -> QIcon:
-        pixmap = QPixmap(20, 20)
-        pixmap.fill(color)
-
-        return QIcon(pixmap)
@@ -0,0 +1,85 @@
+from typing import Optional, Iterator
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+import model
+from .painting_area import PaintingArea
+
+__all__ = ("NdjsonImporter",)
+
+
+class NdjsonImporter(QObject):
+    progress = Signal(int)
+    finished = Signal(int)
+    failed = Signal(str)
+
+    def __init__(self, area: PaintingArea, path: str, chunk_size: int = 2000, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._area = area
+        self._path = path
+        self._chunk_size = chunk_size
+        self._file = None
+        self._chunks: Optional[Iterator[list[tuple[model.Shape, int]]]] = None
+        self._count = 0
+        self._command: Optional[model.InsertCommand] = None
+        self._first: Optional[model.Node] = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._step)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def start(self):
+        try:
+            self._file = open(self._path, encoding="utf-8")
+        except OSError as e:
+            self.failed.emit(str(e))
+            return
+
+        self._chunks = model.read_ndjson(self._file, self._chunk_size)
+        self._timer.start()
+
+    def cancel(self):
+        self._stop()
+
+    def _step(self):
+        try:
+            self._import_chunk()
+        except (OSError, ValueError, TypeError, OverflowError, model.DocumentError) as e:
+            self._stop()
+            self.failed.emit(str(e))
+        except BaseException:
+            self._stop()
+            raise
+
+    def _import_chunk(self):
+        chunk = next(self._chunks, None)
+
+        if chunk is None:
+            self._stop()
+            self.finished.emit(self._count)
+            return
+
+        if self._first is not None and self._first.storage is not self._area.storage:
+            # Undone or replaced by another document in the meantime
+            self._stop()
+            self.failed.emit("The import was undone")
+            return
+
+        # The whole import is one undo step, whatever else was pushed between chunks
+        self._command = self._area.add_shapes(chunk, into=self._command)
+        if self._first is None and self._command is not None:
+            # The node rather than the shape, as the column store inserts copies of the shapes it is given
+            self._first = self._command.nodes[0]
+        self._count += len(chunk)
+        self.progress.emit(self._count)
+
+    def _stop(self):
+        self._timer.stop()
+        self._chunks = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
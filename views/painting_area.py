@@ -1,14 +1,56 @@
 import enum
-from typing import Optional, Type, Union
+import itertools
+import time
+from contextlib import nullcontext, contextmanager
+from typing import Optional, Type, Union, Iterable, Sequence, Iterator
 
-from PySide6.QtCore import QPoint, QRect, QRectF
-from PySide6.QtGui import QMouseEvent, Qt, QPaintEvent, QPainter, QColor
+import numpy as np
+from PySide6.QtCore import QPoint, QRect, QRectF, QPointF, QTimer
+from PySide6.QtGui import QMouseEvent, Qt, QPaintEvent, QPainter, QColor, QTransform, QWheelEvent, QFont, QPen, \
+    QPolygonF, QRegion, QImage
 from PySide6.QtWidgets import QWidget
 
-from model import Storage, Shape
+from model import Storage, Shape, SpatialIndex, RasterCache, GroupTransform, Selection, TileRenderer, paint_shapes, \
+    Node, History, Command, InsertCommand, DeleteCommand, TransformCommand, RecolorCommand, ChangeZCommand, \
+    BatchCommand, DocumentListener, ShapeColumns, ShapeView, ColumnTransform, STROKE_MARGIN, profiler, styles
+from .batch import Batch
 
 __all__ = ("PaintingArea",)
 
+# Past this many shapes a group edit damages one rect around the whole group
+GROUP_DAMAGE_THRESHOLD = 64
+
+# Side of the virtual canvas shapes are kept inside, in canvas units
+CANVAS_SIZE = 1 << 20
+
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 32
+ZOOM_STEP = 1.25
+
+# Pixels scrolled per wheel notch; a notch is reported as 120
+WHEEL_SCROLL = 40
+
+# Drag and key-repeat input is folded into one edit per frame
+FRAME_INTERVAL = 16
+
+# Lasso points closer than this on screen are dropped
+LASSO_STEP = 3
+
+# Profiler overlay in the top left corner, refreshed a few times a second
+HUD_RECT = QRect(8, 8, 380, 44)
+HUD_INTERVAL = 250
+
+
+def _union_rect(x0: list[float], y0: list[float], x1: list[float], y1: list[float]) -> QRectF:
+    return QRectF(QPointF(min(x0), min(y0)), QPointF(max(x1), max(y1)))
+
+
+def _padded_bounds(group: GroupTransform) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Analytic bounds in one pass per shape type, so no QPainterPath is built. Ellipse bounds can be a
+    # hair tighter than the Bezier path ones, hence the padding, as in _update_group
+    x0, y0, x1, y1 = (np.asarray(b, np.float64) for b in group.old_bounds)
+    return x0 - 1, y0 - 1, x1 + 1, y1 + 1
+
 
 class PaintingArea(QWidget):
     class Mode(enum.Enum):
@@ -21,19 +63,167 @@ class PaintingArea(QWidget):
         LEFT = (-1, 0, -1, 0)
         RIGHT = (1, 0, 1, 0)
 
+    class SelectionMode(enum.Enum):
+        INTERSECT = enum.auto()
+        CONTAIN = enum.auto()
+
+    class BandShape(enum.Enum):
+        RECTANGLE = enum.auto()
+        LASSO = enum.auto()
+
     def __init__(self, parent: Optional[QWidget] = None):
         super().__init__(parent)
         self._storage: Storage[Shape] = Storage()
+        self._index: SpatialIndex[Shape] = SpatialIndex()
+        self._selection = Selection()
+        self._raster_cache: Optional[RasterCache] = None
+        self._tile_renderer: Optional[TileRenderer] = None
+        # Opt-in column store: document shapes are views over its rows and selection edits run on whole columns
+        self._columns: Optional[ShapeColumns] = None
+        self._history = History()
         self._current_shape: Optional[Type[Shape]] = None
         self._mode = self.Mode.EDIT_ITEM
         self._line_color: Optional[Union[QColor, Qt.GlobalColor]] = None
         self._fill_color: Optional[Union[QColor, Qt.GlobalColor]] = None
 
+        self._canvas = QRectF(0, 0, CANVAS_SIZE, CANVAS_SIZE)
+        self._zoom = 1.0
+        # Widget origin on the canvas scaled by the zoom; whole pixels so tiles blit without resampling
+        self._offset = QPoint()
+
         self._mouse_pressed = False
-        self._prev_mouse_pos = QPoint()
+        self._prev_mouse_pos = QPointF()
+
+        # While dragging, the selection is drawn shifted by _drag_offset and only committed on release
+        self._drag_bounds: Optional[QRectF] = None
+        self._drag_offset = QPoint()
+        self._drawn_offset = QPoint()
+        # Key-repeat step not applied yet, as (dx, dy, dw, dh, da)
+        self._pending_step: Optional[list] = None
+
+        # Rubber band in canvas coordinates; the shapes it selected are updated once per frame
+        self._selection_mode = self.SelectionMode.INTERSECT
+        self._band_shape = self.BandShape.RECTANGLE
+        self._band: Optional[list[QPointF]] = None
+        self._band_drawn: Optional[QPolygonF] = None
+        self._band_dirty = False
+        self._band_base: set[Shape] = set()
+        self._band_hits: set[Shape] = set()
+        # Lasso candidates with their index rects, fetched once for the area they cover
+        self._band_candidates: Optional[tuple[QRectF, list[Shape], np.ndarray]] = None
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(FRAME_INTERVAL)
+        self._frame_timer.timeout.connect(self._on_frame)
+
+        self._hud_timer = QTimer(self)
+        self._hud_timer.setInterval(HUD_INTERVAL)
+        self._hud_timer.timeout.connect(self._refresh_hud)
+        self._panning = False
+        self._prev_pan_pos = QPoint()
+
+        # While a batch is applied, damage is collected here and flushed once at the end
+        self._batch: Optional[Batch] = None
+        self._batch_damage: Optional[QRectF] = None
+
+        # Told about every change to the document, e.g. to save it in the background
+        self._listeners: list[DocumentListener] = []
 
         self.setMouseTracking(True)
 
+    @property
+    def storage(self) -> Storage[Shape]:
+        return self._storage
+
+    @storage.setter
+    def storage(self, value: Storage[Shape]):
+        self.flush_input()
+        nodes = list(value.nodes())
+        shapes = [node.value for node in nodes]
+        # Moved in or out of the column store before anything changes, as that is what rejects bad geometry
+        if self._columns is not None:
+            shapes = self._columns.adopt(shapes)
+        else:
+            shapes = [shape.to_shape() if isinstance(shape, ShapeView) else shape for shape in shapes]
+        for shape in self._storage:
+            shape.selection = None
+
+        self._storage = value
+        self._index.clear()
+        # A storage filled with plain push() has no handles on its shapes yet
+        for node, shape in zip(nodes, shapes):
+            if node.value is not shape:
+                node.value.node = None
+                node.value = shape
+            shape.node = node
+            shape.selection = self._selection
+        if shapes:
+            self._index.insert_many(shapes, *_padded_bounds(self._group_transform(shapes)))
+        for listener in self._listeners:
+            listener.document_reset(shapes)
+
+        if self._raster_cache is not None:
+            self._raster_cache.clear()
+        if self._tile_renderer is not None:
+            self._tile_renderer.clear()
+        self._history.clear()
+        self.update()
+
+    def add_shapes(self, shapes: Iterable[tuple[Shape, int]], merge: bool = False,
+                   into: Optional[InsertCommand] = None) -> Optional[InsertCommand]:
+        # With into the shapes join that earlier insert's undo step, wherever it sits on the stack
+        command = self._insert_shapes(list(shapes))
+        if command is None:
+            return into
+        if into is not None:
+            into.merge(command)
+            self._history.refresh(into)
+            return into
+        self._history.push(command, merge)
+        return command
+
+    @contextmanager
+    def batch(self) -> Iterator[Batch]:
+        # Nested batches record into the outermost one
+        if self._batch is not None:
+            yield self._batch
+            return
+
+        self.flush_input()
+        self._batch = Batch()
+        try:
+            yield self._batch
+            batch = self._batch
+        finally:
+            self._batch = None
+        self.apply_batch(batch)
+
+    def apply_batch(self, batch: Batch, merge: bool = False):
+        commands: list[Command] = []
+        self._batch_damage = QRectF()
+        try:
+            for op, items, args in batch.ops:
+                match op:
+                    case Batch.Op.INSERT:
+                        command = self._insert_shapes(items)
+                    case Batch.Op.DELETE:
+                        command = self._delete_shapes(items)
+                    case Batch.Op.RECOLOR:
+                        command = self._recolor_shapes(items, **args)
+                    case Batch.Op.CHANGE_Z:
+                        command = self._change_z(items, **args)
+                if command is not None:
+                    commands.append(command)
+        finally:
+            dirty, self._batch_damage = self._batch_damage, None
+            if not dirty.isNull():
+                self._damage(dirty)
+
+            # Ops applied before a failing one stay applied, so they have to stay undoable too
+            if commands:
+                self._history.push(commands[0] if len(commands) == 1 else BatchCommand(commands), merge)
+
     @property
     def current_shape(self) -> Optional[Type[Shape]]:
         return self._current_shape
@@ -66,63 +256,400 @@ class PaintingArea(QWidget):
     def fill_color(self, value: Union[QColor, Qt.GlobalColor]):
         self._fill_color = value
 
-    def change_border_color_selected(self):
-        for shape in self._storage:
-            if shape.selected:
-                shape.default_border_color = self._line_color
+    @property
+    def selection_mode(self) -> SelectionMode:
+        return self._selection_mode
 
-        self.update()
+    @selection_mode.setter
+    def selection_mode(self, value: SelectionMode):
+        self._selection_mode = value
 
-    def change_fill_color_selected(self):
-        for shape in self._storage:
-            if shape.selected:
-                shape.default_background_color = self._fill_color
+    @property
+    def band_shape(self) -> BandShape:
+        return self._band_shape
+
+    @band_shape.setter
+    def band_shape(self, value: BandShape):
+        self._band_shape = value
+
+    @property
+    def raster_cache_enabled(self) -> bool:
+        return self._raster_cache is not None
 
+    @raster_cache_enabled.setter
+    def raster_cache_enabled(self, value: bool):
+        if value and self._raster_cache is None:
+            self._raster_cache = RasterCache()
+        elif not value:
+            self._raster_cache = None
         self.update()
 
-    def delete_selected(self):
-        self._storage.first()
-        while not self._storage.eol():
-            shape = self._storage.get_current()
-            if shape.selected:
-                self._storage.pop_current()
-            else:
-                self._storage.next()
+    @property
+    def raster_cache(self) -> Optional[RasterCache]:
+        return self._raster_cache
+
+    @property
+    def tiled_rendering(self) -> bool:
+        return self._tile_renderer is not None
 
+    @tiled_rendering.setter
+    def tiled_rendering(self, value: bool):
+        if value and self._tile_renderer is None:
+            self._tile_renderer = TileRenderer()
+        elif not value:
+            self._tile_renderer = None
         self.update()
 
-    def change_z_selected(self, z: int):
+    @property
+    def tile_renderer(self) -> Optional[TileRenderer]:
+        return self._tile_renderer
+
+    @property
+    def columnar(self) -> bool:
+        return self._columns is not None
+
+    @columnar.setter
+    def columnar(self, value: bool):
+        if value == self.columnar:
+            return
+        # The document is reloaded into or out of the columns, which drops the history as a new storage does
+        self.flush_input()
+        self._columns = ShapeColumns() if value else None
+        self.storage = self._storage
+
+    @property
+    def columns(self) -> Optional[ShapeColumns]:
+        return self._columns
+
+    @property
+    def selection(self) -> Selection:
+        return self._selection
+
+    @property
+    def hud_visible(self) -> bool:
+        return self._hud_timer.isActive()
+
+    @hud_visible.setter
+    def hud_visible(self, value: bool):
+        if value:
+            self._hud_timer.start()
+        else:
+            self._hud_timer.stop()
+        self.update(HUD_RECT)
+
+    @property
+    def history(self) -> History:
+        return self._history
+
+    def undo(self):
+        self.flush_input()
+        self._history.undo(self)
+
+    def redo(self):
+        self.flush_input()
+        self._history.redo(self)
+
+    def add_listener(self, listener: DocumentListener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: DocumentListener):
+        self._listeners.remove(listener)
+
+    def remove_nodes(self, nodes: Sequence[Node[Shape]]):
+        if self._in_columns(node.value for node in nodes):
+            self._columns.set_live(self._columns.rows([node.value for node in nodes]), False)
+        for node in nodes:
+            shape = node.value
+            shape.selection = None
+            self._storage.remove(node)
+            self._index.remove(shape)
+            if self._raster_cache is not None:
+                self._raster_cache.discard(shape)
+            shape.node = None
+        shapes = [node.value for node in nodes]
+        self._damage_shapes(shapes)
+        for listener in self._listeners:
+            listener.shapes_removed(shapes)
+
+    def restore_nodes(self, nodes: Sequence[Node[Shape]]):
         shapes = []
-        self._storage.first()
-        while not self._storage.eol():
-            shape = self._storage.get_current()
-            if shape.selected:
-                self._storage.pop_current()
-                shapes.append(shape)
-            else:
-                self._storage.next()
-
-        for shape in shapes:
-            shape._z = z
-            self._storage.push(shape, z)
+        for node in self._storage.restore_many(nodes):
+            shape = node.value
+            shape.node = node
+            shape.selection = self._selection
+            shapes.append(shape)
+        if self._in_columns(shapes):
+            self._columns.set_live(self._columns.rows(shapes), True)
+        self._index_shapes(shapes)
+        for listener in self._listeners:
+            listener.shapes_added(shapes)
+
+    def transform_shapes(self, shapes: Sequence[Shape], dx: int, dy: int, dw: int, dh: int, da: float):
+        group = self._group_transform(shapes)
+        if group.apply(dx, dy, dw, dh, da, None):
+            self._update_group(group)
+
+    def restyle_shapes(self, shapes: Sequence[Shape], style_ids: Sequence[int]):
+        if self._in_columns(shapes):
+            self._columns.restyle(self._columns.rows(shapes), style_ids)
+        else:
+            for shape, style in zip(shapes, style_ids):
+                shape.style_id = style
+        self._damage_shapes(list(shapes))
+        for listener in self._listeners:
+            listener.shapes_changed(shapes)
+
+    @property
+    def canvas_rect(self) -> QRectF:
+        return QRectF(self._canvas)
+
+    @canvas_rect.setter
+    def canvas_rect(self, value: QRectF):
+        self._canvas = QRectF(value)
+
+    @property
+    def zoom(self) -> float:
+        return self._zoom
+
+    @zoom.setter
+    def zoom(self, value: float):
+        self.zoom_at(value, QPointF(self.width() / 2, self.height() / 2))
+
+    @property
+    def view_offset(self) -> QPoint:
+        return QPoint(self._offset)
+
+    @view_offset.setter
+    def view_offset(self, value: QPoint):
+        self._offset = QPoint(value)
+        self.update()
+
+    @property
+    def visible_rect(self) -> QRectF:
+        return self.map_to_canvas_rect(QRectF(self.rect()))
+
+    def view_transform(self) -> QTransform:
+        return QTransform(self._zoom, 0, 0, self._zoom, -self._offset.x(), -self._offset.y())
+
+    def map_to_canvas(self, p: QPointF) -> QPointF:
+        return QPointF((p.x() + self._offset.x()) / self._zoom, (p.y() + self._offset.y()) / self._zoom)
+
+    def map_to_canvas_rect(self, rect: QRectF) -> QRectF:
+        k = self._zoom
+        return QRectF((rect.x() + self._offset.x()) / k, (rect.y() + self._offset.y()) / k,
+                      rect.width() / k, rect.height() / k)
+
+    def map_from_canvas_rect(self, rect: QRectF) -> QRectF:
+        k = self._zoom
+        return QRectF(rect.x() * k - self._offset.x(), rect.y() * k - self._offset.y(),
+                      rect.width() * k, rect.height() * k)
+
+    def pan(self, dx: int, dy: int):
+        if dx or dy:
+            old = self._overlay_rects()
+            self._offset += QPoint(dx, dy)
+            # Shift what is already on screen and repaint only the exposed strip. The overlays get shifted too, so
+            # both their shifted copies and where they belong now are repainted
+            self.scroll(-dx, -dy)
+            for rect in old:
+                self.update(rect.translated(-dx, -dy))
+            for rect in self._overlay_rects():
+                self.update(rect)
+
+    def _overlay_rects(self) -> list[QRect]:
+        rects = []
+        if self.hud_visible:
+            rects.append(HUD_RECT)
+        if self._band_drawn is not None and not self._band_drawn.isEmpty():
+            band = self.view_transform().map(self._band_drawn).boundingRect()
+            rects.append(band.toAlignedRect().adjusted(-2, -2, 2, 2))
+        return rects
+
+    def zoom_at(self, zoom: float, anchor: QPointF):
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self._zoom:
+            return
+
+        p = self.map_to_canvas(anchor)
+        self._zoom = zoom
+        self._offset = QPoint(round(p.x() * zoom - anchor.x()), round(p.y() * zoom - anchor.y()))
+        self.update()
+
+    def zoom_in(self):
+        self.zoom = self._zoom * ZOOM_STEP
+
+    def zoom_out(self):
+        self.zoom = self._zoom / ZOOM_STEP
+
+    def reset_zoom(self):
+        self.zoom = 1.0
+
+    def zoom_to_fit(self):
+        bounds = QRectF()
+        for shape in self._storage:
+            bounds = bounds.united(shape.bounding_rect)
+        if bounds.isEmpty() or self.width() <= 0 or self.height() <= 0:
+            return
 
+        m = 2 * STROKE_MARGIN
+        bounds.adjust(-m, -m, m, m)
+        zoom = min(max(min(self.width() / bounds.width(), self.height() / bounds.height()), MIN_ZOOM), MAX_ZOOM)
+        center = bounds.center()
+        self._zoom = zoom
+        self._offset = QPoint(round(center.x() * zoom - self.width() / 2), round(center.y() * zoom - self.height() / 2))
         self.update()
 
-    def move_selected(self, direction: Direction, increased_step: bool = False):
+    def select_all(self):
+        self.flush_input()
+        for shape in self._selection.select(self._storage):
+            self._damage(shape.bounding_rect)
+
+    def clear_selection(self):
+        self.flush_input()
+        for shape in self._selection.clear():
+            self._damage(shape.bounding_rect)
+
+    def change_border_color_selected(self):
+        self.flush_input()
+        self._push(self._recolor_shapes(list(self._selection), border=self._line_color))
+
+    def change_fill_color_selected(self):
+        self.flush_input()
+        self._push(self._recolor_shapes(list(self._selection), fill=self._fill_color))
+
+    def delete_selected(self):
+        self.flush_input()
+        self._push(self._delete_shapes(list(self._selection)))
+
+    def change_z_selected(self, z: int):
+        self.flush_input()
+        self._push(self._change_z(list(self._selection), z))
+
+    def _push(self, command: Optional[Command]):
+        if command is not None:
+            self._history.push(command)
+
+    def _insert_shapes(self, items: list[tuple[Shape, int]]) -> Optional[Command]:
+        if not items:
+            return None
+
+        shapes = [shape for shape, _ in items]
+        if self._columns is not None:
+            # The document holds views over copies of the shapes; InsertCommand.nodes tells which
+            shapes = self._columns.adopt(shapes)
+            items = list(zip(shapes, (z for _, z in items)))
+        # Indexing rejects bad geometry, so it goes first and a failed insert leaves nothing linked
+        self._index_shapes(shapes)
+        nodes = self._storage.push_many(items)
+        for shape, node in zip(shapes, nodes):
+            shape.node = node
+            shape.selection = self._selection
+        for listener in self._listeners:
+            listener.shapes_added(shapes)
+        return InsertCommand(nodes)
+
+    def _delete_shapes(self, shapes: list[Shape]) -> Optional[Command]:
+        # Shapes already out of the document are skipped
+        nodes = [shape.node for shape in dict.fromkeys(shapes) if shape.node is not None]
+        if not nodes:
+            return None
+
+        self.remove_nodes(nodes)
+        return DeleteCommand(nodes)
+
+    def _recolor_shapes(self, shapes: list[Shape], border: Optional[Union[QColor, Qt.GlobalColor]] = None,
+                        fill: Optional[Union[QColor, Qt.GlobalColor]] = None) -> Optional[Command]:
+        if not shapes:
+            return None
+
+        if self._in_columns(shapes):
+            # Each row is counted once when its style is derived
+            shapes = list(dict.fromkeys(shapes))
+            old, new = (ids.tolist() for ids in self._columns.recolor(self._columns.rows(shapes), border, fill))
+        else:
+            old = [shape.style_id for shape in shapes]
+            # Shapes sharing a style share the derived one; each is held once until every shape refers to it
+            derived: dict[int, int] = {}
+            for shape, style in zip(shapes, old):
+                new = derived.get(style)
+                if new is None:
+                    styles.retain(style)
+                    new = derived[style] = styles.derive(style, border=border, fill=fill)
+                shape.style_id = new
+            for new in derived.values():
+                styles.release(new)
+            new = [shape.style_id for shape in shapes]
+
+        self._damage_shapes(shapes)
+        for listener in self._listeners:
+            listener.shapes_changed(shapes)
+        return RecolorCommand(shapes, old, new)
+
+    def _change_z(self, shapes: list[Shape], z: int) -> Optional[Command]:
+        # Re-push in z order so the shapes keep their relative stacking
+        shapes = sorted((shape for shape in dict.fromkeys(shapes) if shape.node is not None),
+                        key=lambda s: s.node.z_key)
+        if not shapes:
+            return None
+
+        old = [shape.node for shape in shapes]
+        for node in old:
+            self._storage.remove(node)
+        new = self._storage.push_many((shape, z) for shape in shapes)
+        for shape, node in zip(shapes, new):
+            shape.node = node
+
+        self._damage_shapes(shapes)
+        for listener in self._listeners:
+            listener.shapes_changed(shapes)
+        return ChangeZCommand(old, new)
+
+    def _index_shapes(self, shapes: list[Shape]):
+        if not shapes:
+            return
+
+        x0, y0, x1, y1 = _padded_bounds(self._group_transform(shapes))
+        self._index.insert_many(shapes, x0, y0, x1, y1)
+
+        if len(shapes) > GROUP_DAMAGE_THRESHOLD:
+            self._damage(QRectF(QPointF(x0.min(), y0.min()), QPointF(x1.max(), y1.max())))
+        else:
+            for rect in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist()):
+                self._damage(QRectF(QPointF(rect[0], rect[1]), QPointF(rect[2], rect[3])))
+
+    def _group_transform(self, shapes: Sequence[Shape]) -> GroupTransform:
+        if self._in_columns(shapes):
+            return ColumnTransform(self._columns, shapes)
+        return GroupTransform(shapes)
+
+    def _in_columns(self, shapes: Iterable[Shape]) -> bool:
+        # False for shapes that never went through the column store, e.g. ones a batch recolors before inserting
+        columns = self._columns
+        return columns is not None and all(isinstance(s, ShapeView) and s.columns is columns for s in shapes)
+
+    def _damage_shapes(self, shapes: list[Shape]):
+        if len(shapes) > GROUP_DAMAGE_THRESHOLD:
+            x0, y0, x1, y1 = _padded_bounds(self._group_transform(shapes))
+            self._damage(QRectF(QPointF(x0.min(), y0.min()), QPointF(x1.max(), y1.max())))
+        else:
+            for shape in shapes:
+                self._damage(shape.bounding_rect)
+
+    def move_selected(self, direction: Direction, increased_step: bool = False, merge: bool = False):
         dx, dy, *_ = direction.value
         if increased_step:
             dx *= 10
             dy *= 10
-        self._change_selected(dx, dy, 0, 0, 0)
+        self._step_selected(dx, dy, 0, 0, 0, merge)
 
-    def resize_selected(self, direction: Direction, increased_step: bool = False):
+    def resize_selected(self, direction: Direction, increased_step: bool = False, merge: bool = False):
         *_, dw, dh = direction.value
         if increased_step:
             dw *= 10
             dh *= 10
-        self._change_selected(0, 0, dw, dh, 0)
+        self._step_selected(0, 0, dw, dh, 0, merge)
 
-    def rotate_selected(self, direction: Direction, increased_step: bool = False):
+    def rotate_selected(self, direction: Direction, increased_step: bool = False, merge: bool = False):
         if direction == self.Direction.LEFT:
             da = -5
         elif direction == self.Direction.RIGHT:
@@ -133,102 +660,446 @@ class PaintingArea(QWidget):
         if increased_step:
             da *= 3
 
-        self._change_selected(0, 0, 0, 0, da)
+        self._step_selected(0, 0, 0, 0, da, merge)
 
-    def _change_selected(self, dx: int, dy: int, dw: int, dh: int, da: float):
-        for shape in self._storage:
-            if shape.selected:
-                shape.x += dx
-                shape.y += dy
-                shape.w += dw
-                shape.h += dh
-                shape.a += da
-
-                if not self.inside_area(shape.bounding_rect):
-                    shape.x -= dx
-                    shape.y -= dy
-                    shape.w -= dw
-                    shape.h -= dh
-                    shape.a -= da
+    def _step_selected(self, dx: int, dy: int, dw: int, dh: int, da: float, merge: bool):
+        step = [dx, dy, dw, dh, da]
+        pending = self._pending_step
+        # Repeats of the same kind of step pile up until the next frame; anything else goes through now
+        if merge and pending is not None and [bool(v) for v in pending] == [bool(v) for v in step]:
+            for i, v in enumerate(step):
+                pending[i] += v
+        elif merge:
+            self.flush_input()
+            self._pending_step = step
+            self._frame_timer.start()
+        else:
+            self.flush_input()
+            self._change_selected(dx, dy, dw, dh, da)
 
-        self.update()
+    def flush_input(self):
+        self._frame_timer.stop()
+        step = self._pending_step
+        if step is not None:
+            self._pending_step = None
+            self._change_selected(*step, merge=True)
+        self._commit_drag()
+        self._finish_band()
+
+    def _on_frame(self):
+        step = self._pending_step
+        if step is not None:
+            self._pending_step = None
+            self._change_selected(*step, merge=True)
+        if self._drag_bounds is not None:
+            self._damage_preview()
+        if self._band_dirty:
+            self._update_band()
+
+    def _start_drag(self):
+        group = self._group_transform(list(self._selection))
+        self._drag_bounds = _union_rect(*(b.tolist() for b in group.old_bounds))
+        self._drag_offset = QPoint()
+        self._drawn_offset = QPoint()
+        if self._tile_renderer is not None:
+            # Tiles are drawn without the selection until the drag is committed
+            self._tile_renderer.hidden = self._selection
+            self._tile_renderer.invalidate(self._drag_bounds)
+
+    def _drag_by(self, dx: int, dy: int):
+        # Same clamping as GroupTransform does for a pure move, on the bounds taken at drag start
+        b = self._drag_bounds
+        c = self._canvas
+        dx = min(max(self._drag_offset.x() + dx, min(c.left() - b.left(), 0)), max(c.right() - b.right(), 0))
+        dy = min(max(self._drag_offset.y() + dy, min(c.top() - b.top(), 0)), max(c.bottom() - b.bottom(), 0))
+        self._drag_offset = QPoint(int(dx), int(dy))
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
+
+    def _damage_preview(self):
+        m = STROKE_MARGIN
+        old = self._drag_bounds.translated(QPointF(self._drawn_offset))
+        new = self._drag_bounds.translated(QPointF(self._drag_offset))
+        self._drawn_offset = QPoint(self._drag_offset)
+        self.update(self.map_from_canvas_rect(old.united(new)).adjusted(-m, -m, m, m).toAlignedRect())
+
+    def _commit_drag(self):
+        if self._drag_bounds is None:
+            return
+
+        self._damage_preview()
+        bounds = self._drag_bounds
+        offset = self._drag_offset
+        self._drag_bounds = None
+        self._drag_offset = QPoint()
+        if self._tile_renderer is not None:
+            self._tile_renderer.hidden = None
+        self._damage(bounds)
+
+        if not offset.isNull():
+            self._change_selected(offset.x(), offset.y(), 0, 0, 0)
+
+    def _start_band(self, p: QPointF, keep_selection: bool):
+        self._band = [p, p]
+        self._band_drawn = None
+        self._band_dirty = False
+        self._band_base = set(self._selection) if keep_selection else set()
+        self._band_hits = set()
+        self._band_candidates = None
+
+    def _extend_band(self, p: QPointF):
+        if self._band_shape == self.BandShape.RECTANGLE:
+            self._band[1] = p
+        else:
+            last = self._band[-1]
+            step = LASSO_STEP / self._zoom
+            if abs(p.x() - last.x()) < step and abs(p.y() - last.y()) < step:
+                return
+            self._band.append(p)
+
+        self._band_dirty = True
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
+
+    def _band_polygon(self) -> QPolygonF:
+        if self._band_shape == self.BandShape.RECTANGLE:
+            return QPolygonF(QRectF(self._band[0], self._band[1]).normalized())
+        return QPolygonF(self._band)
+
+    def _band_query(self, polygon: QPolygonF) -> list[Shape]:
+        # Bounding rects from the index decide; no shape path is built or tested
+        contained = self._selection_mode == self.SelectionMode.CONTAIN
+        if self._band_shape == self.BandShape.RECTANGLE or len(polygon) < 3:
+            return self._index.query_rect(polygon.boundingRect(), contained)
+
+        bounds = polygon.boundingRect()
+        if self._band_candidates is None or not self._band_candidates[0].contains(bounds):
+            area = bounds.united(self.visible_rect)
+            self._band_candidates = (area, *self._index.query_rect_boxes(area))
+        _, shapes, boxes = self._band_candidates
+        if not shapes:
+            return []
+
+        # The lasso is filled into a mask at screen resolution; a summed-area table then tells for every
+        # box at once how many of its pixels are inside
+        screen = self.view_transform().map(polygon)
+        r = screen.boundingRect().toAlignedRect()
+        w = r.width() + 1
+        h = r.height() + 1
+        image = QImage(w, h, QImage.Format_Grayscale8)
+        image.fill(0)
+        painter = QPainter(image)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(Qt.white)
+        painter.translate(-r.left(), -r.top())
+        painter.drawPolygon(screen)
+        painter.end()
+
+        mask = np.frombuffer(image.constBits(), np.uint8).reshape(h, image.bytesPerLine())[:, :w]
+        sat = np.zeros((h + 1, w + 1), np.int64)
+        np.cumsum(np.cumsum(mask != 0, 0), 1, out=sat[1:, 1:])
 
-    def inside_area(self, rect: QRect) -> bool:
-        r = QRectF(self.rect())
-        return r.contains(rect)
+        # Box corners in mask pixels, at least one pixel wide
+        x0 = np.floor(boxes[:, 0] * self._zoom - self._offset.x() - r.left()).astype(np.int64)
+        y0 = np.floor(boxes[:, 1] * self._zoom - self._offset.y() - r.top()).astype(np.int64)
+        x1 = np.maximum(np.ceil(boxes[:, 2] * self._zoom - self._offset.x() - r.left()).astype(np.int64), x0 + 1)
+        y1 = np.maximum(np.ceil(boxes[:, 3] * self._zoom - self._offset.y() - r.top()).astype(np.int64), y0 + 1)
+        cx0, cx1 = np.clip(x0, 0, w), np.clip(x1, 0, w)
+        cy0, cy1 = np.clip(y0, 0, h), np.clip(y1, 0, h)
+        inside = sat[cy1, cx1] - sat[cy0, cx1] - sat[cy1, cx0] + sat[cy0, cx0]
+
+        hits = inside == (x1 - x0) * (y1 - y0) if contained else inside > 0
+        return [shapes[i] for i in np.flatnonzero(hits).tolist()]
+
+    def _update_band(self):
+        self._band_dirty = False
+        polygon = self._band_polygon()
+        hits = set(self._band_query(polygon))
+        base = self._band_base
+
+        removed = [shape for shape in self._band_hits - hits if shape not in base]
+        added = [shape for shape in hits - self._band_hits if shape not in base]
+        for shape in removed:
+            shape.selected = False
+        for shape in added:
+            shape.selected = True
+        self._band_hits = hits
+        self._damage_shapes(removed + added)
+        self._damage_band(polygon)
+
+    def _finish_band(self):
+        if self._band is None:
+            return
+
+        if self._band_dirty:
+            self._update_band()
+        self._damage_band(None)
+        self._band = None
+        self._band_base = set()
+        self._band_hits = set()
+        self._band_candidates = None
+
+    def _damage_band(self, polygon: Optional[QPolygonF]):
+        # Only the outline is drawn, so only strips along the old and new edges are repainted
+        region = QRegion()
+        for drawn in (self._band_drawn, polygon):
+            if drawn is None or drawn.isEmpty():
+                continue
+            points = self.view_transform().map(drawn)
+            for i in range(len(points)):
+                a = points[i]
+                b = points[(i + 1) % len(points)]
+                region += QRectF(a, b).normalized().adjusted(-2, -2, 2, 2).toAlignedRect()
+        self._band_drawn = polygon
+        if not region.isEmpty():
+            self.update(region)
+
+    def _change_selected(self, dx: int, dy: int, dw: int, dh: int, da: float, merge: bool = False) -> bool:
+        group = self._group_transform(list(self._selection))
+        if not group.apply(dx, dy, dw, dh, da, self._canvas):
+            return False
+
+        self._update_group(group)
+        self._history.push(TransformCommand(group.shapes, *group.delta), merge)
+        return True
+
+    def _update_group(self, group: GroupTransform):
+        old_bounds = [b.tolist() for b in group.old_bounds]
+        new_bounds = [b.tolist() for b in group.new_bounds]
+        for shape, x0, y0, x1, y1 in zip(group.shapes, *new_bounds):
+            # Analytic ellipse bounds can be a hair tighter than the Bezier path ones
+            self._index.update(shape, QRectF(x0 - 1, y0 - 1, x1 - x0 + 2, y1 - y0 + 2))
+        for listener in self._listeners:
+            listener.shapes_changed(group.shapes)
+
+        if len(group) > GROUP_DAMAGE_THRESHOLD:
+            self._damage(_union_rect(*old_bounds).united(_union_rect(*new_bounds)))
+        else:
+            for ox0, oy0, ox1, oy1, nx0, ny0, nx1, ny1 in zip(*old_bounds, *new_bounds):
+                self._damage(QRectF(QPointF(min(ox0, nx0), min(oy0, ny0)), QPointF(max(ox1, nx1), max(oy1, ny1))))
+
+    def _damage(self, rect: QRectF):
+        if self._batch_damage is not None:
+            self._batch_damage = self._batch_damage.united(rect)
+            return
+
+        m = STROKE_MARGIN
+        if self._tile_renderer is not None:
+            self._tile_renderer.invalidate(rect)
+        self.update(self.map_from_canvas_rect(rect).adjusted(-m, -m, m, m).toAlignedRect())
+
+    def inside_area(self, rect: Union[QRect, QRectF]) -> bool:
+        return self._canvas.contains(rect)
+
+    def shape_at(self, p: Union[QPoint, QPointF]) -> Optional[Shape]:
+        p = QPointF(p)
+        candidates = self._index.query_point(p)
+        hits = Shape.hit_test(candidates, p)
+        if not hits.any():
+            return None
+
+        return max(itertools.compress(candidates, hits), key=lambda shape: shape.node.z_key)
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
-        x = event.x()
-        y = event.y()
+        self.flush_input()
+        if event.button() == Qt.MiddleButton:
+            self._panning = True
+            self._prev_pan_pos = event.pos()
+            return
+
+        p = self.map_to_canvas(event.position())
+        x = round(p.x())
+        y = round(p.y())
         ctrl = event.modifiers() & Qt.ControlModifier
+        # Shift starts a band even over a shape, so dense drawings can still be band-selected
+        shift = event.modifiers() & Qt.ShiftModifier
 
         match self._mode:
             case self.Mode.EDIT_ITEM:
                 self._mouse_pressed = True
-                self._prev_mouse_pos = event.pos()
+                self._prev_mouse_pos = p
 
-                flag = False
-                for shape in reversed(self._storage):
-                    if shape.inside(QPoint(x, y)) and not flag:
-                        shape.selected = True
-                        flag = True
-                    elif not ctrl:
-                        shape.selected = False
+                with profiler.span("hit_test", "input", event="press") if profiler.enabled else nullcontext():
+                    hit = self.shape_at(p)
+                if not ctrl:
+                    self.clear_selection()
+                if hit is None or shift:
+                    self._start_band(p, bool(ctrl))
+                elif not hit.selected:
+                    hit.selected = True
+                    self._damage(hit.bounding_rect)
 
             case self.Mode.INSERT_ITEM:
                 shape = self._current_shape(x, y, 40, 40, 0)
 
-                if shape.x < shape.w // 2:
-                    shape.x = shape.w // 2
+                c = self._canvas.toRect()
+                if shape.x < c.left() + shape.w // 2:
+                    shape.x = c.left() + shape.w // 2
 
-                if shape.x > self.width() - shape.w // 2:
-                    shape.x = self.width() - shape.w // 2
+                if shape.x > c.right() + 1 - shape.w // 2:
+                    shape.x = c.right() + 1 - shape.w // 2
 
-                if shape.y < shape.h // 2:
-                    shape.y = shape.h // 2
+                if shape.y < c.top() + shape.h // 2:
+                    shape.y = c.top() + shape.h // 2
 
-                if shape.y > self.height() - shape.h // 2:
-                    shape.y = self.height() - shape.h // 2
+                if shape.y > c.bottom() + 1 - shape.h // 2:
+                    shape.y = c.bottom() + 1 - shape.h // 2
 
                 shape.default_background_color = self._fill_color
                 shape.default_border_color = self._line_color
-                shape.selected = True
                 if not ctrl:
-                    for s in self._storage:
-                        s.selected = False
-                self._storage.push(shape)
-
-        self.update()
+                    self.clear_selection()
+                shape.selected = True
+                self.add_shapes([(shape, 0)])
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
-        self._mouse_pressed = False
+        if event.button() == Qt.MiddleButton:
+            self._panning = False
+        else:
+            self._mouse_pressed = False
+            self._commit_drag()
+            self._finish_band()
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
+        if self._panning:
+            d = event.pos() - self._prev_pan_pos
+            self._prev_pan_pos = event.pos()
+            self.pan(-d.x(), -d.y())
+            return
+
         if not self._mouse_pressed:
             return
 
-        d = event.pos() - self._prev_mouse_pos
-        dx = d.x()
-        dy = d.y()
+        if self._band is not None:
+            self._extend_band(self.map_to_canvas(event.position()))
+            return
+
+        # Shapes sit on whole canvas units; at high zoom the remainder carries over to the next move
+        p = self.map_to_canvas(event.position())
+        dx = round(p.x() - self._prev_mouse_pos.x())
+        dy = round(p.y() - self._prev_mouse_pos.y())
+        if dx == 0 and dy == 0:
+            return
         if self.rect().contains(event.pos()):
-            self._prev_mouse_pos = event.pos()
+            self._prev_mouse_pos += QPointF(dx, dy)
 
-        inside_selected = False
-        for shape in self._storage:
-            if shape.selected and shape.inside(QPoint(self._prev_mouse_pos.x(), self._prev_mouse_pos.y())):
-                inside_selected = True
-                break
+        # Hit-test against where the selection is drawn, not where the model still has it
+        probe = self._prev_mouse_pos - QPointF(self._drag_offset)
+        with profiler.span("hit_test", "input", event="move") if profiler.enabled else nullcontext():
+            inside_selected = self._selection_at(probe)
 
         if inside_selected:
-            self._change_selected(dx, dy, 0, 0, 0)
+            if self._drag_bounds is None:
+                self._start_drag()
+            self._drag_by(dx, dy)
+
+    def _selection_at(self, p: QPointF) -> bool:
+        candidates = [shape for shape in self._index.query_point(p) if shape.selected]
+        return bool(Shape.hit_test(candidates, p).any())
+
+    def wheelEvent(self, event: QWheelEvent) -> None:
+        d = event.angleDelta()
+        if event.modifiers() & Qt.ControlModifier:
+            self.zoom_at(self._zoom * ZOOM_STEP ** (d.y() / 120), event.position())
+        else:
+            self.pan(-d.x() * WHEEL_SCROLL // 120, -d.y() * WHEEL_SCROLL // 120)
 
     def paintEvent(self, event: QPaintEvent) -> None:
+        rect = event.rect()
+        if not profiler.enabled:
+            self._paint(rect)
+        else:
+            start = time.perf_counter()
+            painted = self._paint(rect)
+            # Repaints of the overlay alone are not frames
+            if not HUD_RECT.contains(rect):
+                profiler.frame(start, time.perf_counter() - start, shapes=painted,
+                               rect=[rect.x(), rect.y(), rect.width(), rect.height()])
+
+        if self.hud_visible and HUD_RECT.intersects(rect):
+            self._paint_hud()
+
+    def _refresh_hud(self):
+        self.update(HUD_RECT)
+
+    def _paint_hud(self):
+        stats = profiler.stats()
+        counters = profiler.counters
+        storage = sum(n for name, n in counters.items() if name.startswith("storage."))
+        lines = (
+            f"{stats['fps']:.1f} fps   frame p50 {stats['p50'] * 1000:.1f} ms   p99 {stats['p99'] * 1000:.1f} ms",
+            f"shape() {counters.get('shape.shape', 0)}   geometry builds {counters['shape.geometry_builds']}"
+            f"   storage ops {storage}",
+        ) if profiler.enabled else ("Profiler is off",)
+
+        painter = QPainter(self)
+        painter.fillRect(HUD_RECT, QColor(0, 0, 0, 160))
+        painter.setPen(Qt.white)
+        font = QFont(painter.font())
+        font.setStyleHint(QFont.Monospace)
+        painter.setFont(font)
+        painter.drawText(HUD_RECT.adjusted(6, 4, -6, -4), Qt.AlignLeft | Qt.AlignTop, "\n".join(lines))
+        painter.end()
+
+    def _paint(self, rect: QRect) -> int:
+        if self._tile_renderer is not None:
+            self._tile_renderer.device_pixel_ratio = self.devicePixelRatioF()
+            self._tile_renderer.scale = self._zoom
+            painter = QPainter(self)
+            painted = self._tile_renderer.paint(painter, rect, self._index, self._offset)
+            if self._drag_bounds is not None:
+                painter.setRenderHint(QPainter.Antialiasing)
+                painter.setTransform(self.view_transform())
+                painted += self._paint_drag(painter, self.map_to_canvas_rect(QRectF(rect)))
+            if self._band_drawn is not None:
+                self._paint_band(painter)
+            painter.end()
+            return painted
+
+        # Only shapes inside the exposed part of the viewport are looked at
+        m = STROKE_MARGIN
+        visible = self.map_to_canvas_rect(QRectF(rect).adjusted(-m, -m, m, m))
+        shapes = self._index.query_rect(visible)
+        if self._drag_bounds is not None:
+            shapes = [shape for shape in shapes if shape not in self._selection]
+        shapes.sort(key=lambda shape: shape.node.z_key)
+
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
-        painter.fillRect(0, 0, self.size().width(), self.size().height(), Qt.white)
+        painter.fillRect(rect, Qt.white)
+        painter.setTransform(self.view_transform())
 
-        for shape in self._storage:
-            painter.save()
-            shape.paint(painter)
-            painter.restore()
+        cache = self._raster_cache
+        if cache is not None:
+            cache.device_pixel_ratio = self.devicePixelRatioF() * self._zoom
+
+        paint_shapes(painter, shapes, self._zoom, cache)
+        painted = len(shapes)
+        if self._drag_bounds is not None:
+            painted += self._paint_drag(painter, visible)
+        if self._band_drawn is not None:
+            self._paint_band(painter)
         painter.end()
+        return painted
+
+    def _paint_drag(self, painter: QPainter, visible: QRectF) -> int:
+        # The dragged selection goes on top, shifted as a whole; the model is untouched until release
+        offset = QPointF(self._drag_offset)
+        if not self._drag_bounds.translated(offset).intersects(visible):
+            return 0
+
+        visible = visible.translated(-offset)
+        shapes = [shape for shape in self._selection if shape.bounding_rect.intersects(visible)]
+        shapes.sort(key=lambda shape: shape.node.z_key)
+        painter.translate(offset)
+        paint_shapes(painter, shapes, self._zoom, self._raster_cache)
+        return len(shapes)
+
+    def _paint_band(self, painter: QPainter):
+        # The outline last damaged, in widget coordinates so the dashes keep their size at any zoom
+        polygon = self.view_transform().map(self._band_drawn)
+        painter.resetTransform()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setBrush(Qt.NoBrush)
+        painter.setPen(QPen(Qt.darkBlue, 1, Qt.DashLine))
+        painter.drawPolygon(polygon)